@@ -0,0 +1,285 @@
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+import yaml
+
+import main
+from floodlight_stub import FloodlightStub
+
+
+# Benchmarks de main.py contra un Floodlight simulado y un datos.yaml sintético.
+# Uso:
+#   python benchmark.py generar --alumnos 50000 --salida datos_sinteticos.yaml
+#   python benchmark.py ejecutar --alumnos 20000 --latencia 0.002 --salida bench_output.json
+
+
+# Generador de datos sintéticos
+
+
+def mac_de(prefijo, i):
+    return f'{prefijo:02X}:' + ':'.join(f'{b:02X}' for b in i.to_bytes(5, 'big'))
+
+
+def generar_datos(alumnos=1000, cursos=50, servidores=5, servicios=3, alumnos_por_curso=40,
+                  servidores_por_curso=2, proporcion_dictando=0.8, semilla=354):
+    rnd = random.Random(semilla)
+    nombres_servicio = [f'svc{j}' for j in range(servicios)]
+    lista_alumnos = [{'nombre': f'Alumno {i}', 'codigo': 20000000 + i, 'mac': mac_de(0x44, i)}
+                     for i in range(alumnos)]
+    lista_servidores = [{
+        'nombre': f'Servidor {k + 1}',
+        'ip': f'10.0.{k // 250}.{k % 250 + 3}',
+        'mac': mac_de(0x52, k),
+        'servicios': [{'nombre': nombre, 'protocolo': 'TCP' if j % 4 else 'UDP', 'puerto': 1000 + j}
+                      for j, nombre in enumerate(nombres_servicio)],
+    } for k in range(servidores)]
+    lista_cursos = []
+    for c in range(cursos):
+        matriculados = rnd.sample(range(alumnos), min(alumnos_por_curso, alumnos))
+        elegidos = rnd.sample(lista_servidores, min(servidores_por_curso, servidores))
+        lista_cursos.append({
+            'codigo': f'TEL{c:04d}',
+            'estado': 'DICTANDO' if rnd.random() < proporcion_dictando else 'INACTIVO',
+            'nombre': f'Curso {c}',
+            'alumnos': [20000000 + i for i in matriculados],
+            'servidores': [{'nombre': s['nombre'],
+                            'servicios_permitidos': rnd.sample(nombres_servicio, rnd.randint(1, servicios))}
+                           for s in elegidos],
+        })
+    return {'alumnos': lista_alumnos, 'cursos': lista_cursos, 'servidores': lista_servidores}
+
+
+def poblar_stub(stub, data, switches, semilla=354):
+    # Conecta cada alumno y servidor a un switch aleatorio de la topología lineal
+    rnd = random.Random(semilla)
+    stub.construir_topologia(switches)
+    for i, alumno in enumerate(data['alumnos']):
+        stub.agregar_host(alumno['mac'], f'10.{128 + i // 65536}.{i // 256 % 256}.{i % 256}',
+                          stub.dpid(rnd.randrange(switches)), 10 + i % 40)
+    for k, servidor in enumerate(data['servidores']):
+        stub.agregar_host(servidor['mac'], servidor['ip'], stub.dpid(rnd.randrange(switches)), 60 + k % 40)
+
+
+# Utilidades de medición
+
+
+def resumen_latencias(muestras):
+    if not muestras:
+        return {}
+    ordenadas = sorted(muestras)
+
+    def percentil(p):
+        return ordenadas[min(len(ordenadas) - 1, int(p * len(ordenadas)))]
+
+    return {
+        'n': len(ordenadas),
+        'media_ms': statistics.fmean(ordenadas) * 1000,
+        'p50_ms': percentil(0.50) * 1000,
+        'p95_ms': percentil(0.95) * 1000,
+        'p99_ms': percentil(0.99) * 1000,
+        'max_ms': ordenadas[-1] * 1000,
+    }
+
+
+def reiniciar_estado():
+    main.conexiones = main.AlmacenConexiones()
+    main.tablas_flows.clear()
+    main._caches_dispositivos.clear()
+    main._caches_rutas.clear()
+    main._monitores_puertos.clear()
+
+
+# Benchmarks
+
+
+def bench_importacion(archivo, puro=False):
+    resultado = {}
+    inicio = time.perf_counter()
+    data = main.importar_datos(archivo)
+    resultado['yaml_rapido_s'] = time.perf_counter() - inicio
+    resultado['loader'] = main.YamlLoader.__name__
+    if puro:
+        inicio = time.perf_counter()
+        with open(archivo, encoding='utf-8') as f:
+            yaml.load(f, Loader=yaml.SafeLoader)
+        resultado['yaml_puro_s'] = time.perf_counter() - inicio
+    inicio = time.perf_counter()
+    main.AlmacenPoliticas(data)
+    resultado['indexado_s'] = time.perf_counter() - inicio
+    snapshot = main.ruta_snapshot(archivo)
+    if os.path.exists(snapshot):
+        os.remove(snapshot)
+    inicio = time.perf_counter()
+    main.cargar_almacen_archivo(archivo)
+    resultado['carga_fria_s'] = time.perf_counter() - inicio
+    inicio = time.perf_counter()
+    main.cargar_almacen_archivo(archivo)
+    resultado['carga_snapshot_s'] = time.perf_counter() - inicio
+    return resultado
+
+
+def muestras_autorizacion(data, n, rnd):
+    codigos = [str(a['codigo']) for a in data['alumnos']]
+    pares = [(s['nombre'], svc['nombre']) for s in data['servidores'] for svc in s['servicios']]
+    autorizadas = list(main.almacen.autorizaciones)
+    muestras = []
+    for i in range(n):
+        if i % 2 and autorizadas:
+            muestras.append(rnd.choice(autorizadas))
+        else:
+            muestras.append((rnd.choice(codigos),) + rnd.choice(pares))
+    return muestras
+
+
+def bench_autorizacion(data, n, rnd):
+    muestras = muestras_autorizacion(data, n, rnd)
+    inicio = time.perf_counter()
+    permitidas = sum(1 for cod, srv, svc in muestras if main.almacen.esta_autorizado(cod, srv, svc))
+    segundos = time.perf_counter() - inicio
+    return {'consultas': n, 'autorizadas': permitidas, 'segundos': segundos,
+            'consultas_por_s': n / segundos if segundos else 0.0}
+
+
+def bench_crear_conexion(controller_ip, n, rnd):
+    reiniciar_estado()
+    planes = rnd.sample(sorted(main.almacen.autorizaciones), min(n, len(main.almacen.autorizaciones)))
+    latencias = []
+    errores = 0
+    for cod, srv, svc in planes:
+        inicio = time.perf_counter()
+        try:
+            main.conectar(cod, srv, svc, controller_ip)
+        except main.ErrorConexion:
+            errores += 1
+            continue
+        latencias.append(time.perf_counter() - inicio)
+    resultado = resumen_latencias(latencias)
+    resultado['errores'] = errores
+    return resultado
+
+
+def bench_build_route(stub, rutas, saltos):
+    # Rutas que cruzan 'saltos' switches de la cadena, con pares de MAC distintos
+    ruta = main.get_route(stub.controller_ip, stub.dpid(0), 10, stub.dpid(saltos - 1), 60)
+    flows = 0
+    inicio = time.perf_counter()
+    for i in range(rutas):
+        datos_conexion = {'mac_src': mac_de(0x66, i), 'mac_dst': mac_de(0x52, 0), 'ip_src': f'10.200.{i // 256 % 256}.{i % 256}',
+                          'ip_dst': '10.0.0.3', 'puerto_l4': 22, 'protocolo': 'TCP'}
+        flows += sum(1 for r in main.build_route(ruta, datos_conexion, stub.controller_ip) if r['ok'])
+    segundos = time.perf_counter() - inicio
+    return {'rutas': rutas, 'saltos': saltos, 'flows': flows, 'segundos': segundos,
+            'flows_por_s': flows / segundos if segundos else 0.0}
+
+
+def bench_provision_masiva(controller_ip, asincrono):
+    reiniciar_estado()
+    curso = max((c for c in main.almacen.cursos_por_codigo.values() if c.estado == 'DICTANDO'),
+                key=lambda c: len(c.alumnos), default=None)
+    if curso is None:
+        return {}
+    resultado = main.provisionar_masivo(main.planificar_conexiones(curso.codigo), controller_ip,
+                                        asincrono=asincrono)
+    resultado['fallidas'] = len(resultado['fallidas'])
+    resultado['curso'] = curso.codigo
+    return resultado
+
+
+def bench_pool(data, args):
+    # N stubs con la misma topología; cada DPID pertenece a un controlador (round-robin)
+    stubs = [FloodlightStub(latencia=args.latencia).iniciar() for _ in range(args.controladores)]
+    try:
+        for stub in stubs:
+            poblar_stub(stub, data, args.switches, args.semilla)
+        resultados = {}
+        main.configurar_pool('bench', [(stub.controller_ip, [stub.dpid(i) for i in range(args.switches)
+                                                             if i % len(stubs) == k])
+                                       for k, stub in enumerate(stubs)])
+        for asincrono in (False, True):
+            for stub in stubs:
+                stub.flows.clear()
+            resultado = bench_provision_masiva('bench', asincrono)
+            resultado['flows_por_controlador'] = [stub.total_flows() for stub in stubs]
+            resultados['async' if asincrono else 'hilos'] = resultado
+        return resultados
+    finally:
+        for stub in stubs:
+            stub.detener()
+        main.pools.clear()
+
+
+def ejecutar(args):
+    rnd = random.Random(args.semilla)
+    data = generar_datos(args.alumnos, args.cursos, args.servidores, args.servicios, args.alumnos_por_curso,
+                         semilla=args.semilla)
+    resultados = {
+        'fecha': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'parametros': vars(args).copy(),
+        'resultados': {},
+    }
+    resultados['parametros'].pop('funcion', None)
+    with tempfile.TemporaryDirectory() as directorio:
+        archivo = os.path.join(directorio, 'datos.yaml')
+        main.exportar_datos(archivo, data)
+        resultados['resultados']['importacion'] = bench_importacion(archivo, args.puro)
+    resultados['resultados']['autorizacion'] = bench_autorizacion(data, args.consultas, rnd)
+    with FloodlightStub(latencia=args.latencia) as stub:
+        poblar_stub(stub, data, args.switches, args.semilla)
+        resultados['resultados']['crear_conexion'] = bench_crear_conexion(stub.controller_ip, args.conexiones, rnd)
+        resultados['resultados']['build_route'] = bench_build_route(stub, args.rutas, min(args.saltos, args.switches))
+        resultados['resultados']['provision_masiva'] = bench_provision_masiva(stub.controller_ip, False)
+        resultados['resultados']['provision_masiva_async'] = bench_provision_masiva(stub.controller_ip, True)
+    if args.controladores > 1:
+        resultados['resultados']['provision_pool'] = bench_pool(data, args)
+    with open(args.salida, 'w', encoding='utf-8') as f:
+        json.dump(resultados, f, indent=2)
+    print(json.dumps(resultados['resultados'], indent=2))
+    print(f"Resultados guardados en {args.salida}")
+
+
+def generar(args):
+    data = generar_datos(args.alumnos, args.cursos, args.servidores, args.servicios, args.alumnos_por_curso,
+                         semilla=args.semilla)
+    main.exportar_datos(args.salida, data)
+    print(f"Generado {args.salida}: {args.alumnos} alumnos, {args.cursos} cursos, {args.servidores} servidores")
+
+
+def parser():
+    p = argparse.ArgumentParser(description='Benchmarks del Network Policy manager')
+    sub = p.add_subparsers(dest='comando', required=True)
+    for nombre, funcion, salida in (('generar', generar, 'datos_sinteticos.yaml'),
+                                    ('ejecutar', ejecutar, 'bench_output.json')):
+        s = sub.add_parser(nombre)
+        s.set_defaults(funcion=funcion)
+        s.add_argument('--alumnos', type=int, default=5000)
+        s.add_argument('--cursos', type=int, default=100)
+        s.add_argument('--servidores', type=int, default=5)
+        s.add_argument('--servicios', type=int, default=3)
+        s.add_argument('--alumnos-por-curso', type=int, default=60)
+        s.add_argument('--semilla', type=int, default=354)
+        s.add_argument('--salida', default=salida)
+        if nombre == 'ejecutar':
+            s.add_argument('--latencia', type=float, default=0.0, help='segundos por respuesta del stub')
+            s.add_argument('--switches', type=int, default=8)
+            s.add_argument('--saltos', type=int, default=4)
+            s.add_argument('--consultas', type=int, default=200000)
+            s.add_argument('--conexiones', type=int, default=200)
+            s.add_argument('--rutas', type=int, default=100)
+            s.add_argument('--controladores', type=int, default=1,
+                           help='además, provisionar contra un pool de N stubs fragmentado por DPID')
+            s.add_argument('--puro', action='store_true', help='medir también el parser YAML en Python puro')
+    return p
+
+
+if __name__ == '__main__':
+    argumentos = parser().parse_args()
+    argumentos.funcion(argumentos)
+    sys.exit(0)
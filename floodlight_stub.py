@@ -0,0 +1,250 @@
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Servidor HTTP local que imita los endpoints REST de Floodlight usados por main.py
+# (útil para pruebas sin controlador real)
+
+
+class _ServidorHTTP(ThreadingHTTPServer):
+    # La cola por defecto (5) descarta conexiones cuando llegan cientos a la vez
+    request_queue_size = 1024
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+
+class FloodlightStub:
+    def __init__(self, host='127.0.0.1', puerto=0, latencia=0.0):
+        # Segundos añadidos a cada respuesta para simular un controlador remoto
+        self.latencia = latencia
+        self.dispositivos = []
+        self.enlaces = []
+        self.switches = []
+        # Ruta fija por clave (src_dpid, src_port, dst_dpid, dst_port); si falta se
+        # devuelve el camino directo origen -> destino
+        self.rutas = {}
+        # Flows instalados: {dpid: {nombre: flow}}
+        self.flows = {}
+        # Posición de cada switch en la topología lineal generada
+        self.posicion = {}
+        # Bytes acumulados por puerto: {(dpid, puerto): [rx, tx]}
+        self.trafico = {}
+        # Contadores por flow instalado: {nombre: [paquetes, bytes]}
+        self.contadores_flows = {}
+        # Nombres de flow cuyo POST responde 500 (para probar la reversión de rutas)
+        self.rechazar = set()
+        # Instante de instalación y de último tráfico por flow, para idle/hard timeout
+        self.instalados = {}
+        self.ultimo_uso = {}
+        self.peticiones = 0
+        self.lock = threading.Lock()
+        self.servidor = _ServidorHTTP((host, puerto), self._manejador())
+        self.hilo = None
+
+    @property
+    def controller_ip(self):
+        host, puerto = self.servidor.server_address[:2]
+        return f'{host}:{puerto}'
+
+    def iniciar(self):
+        self.hilo = threading.Thread(target=self.servidor.serve_forever, daemon=True)
+        self.hilo.start()
+        return self
+
+    def detener(self):
+        self.servidor.shutdown()
+        self.servidor.server_close()
+
+    def __enter__(self):
+        return self.iniciar()
+
+    def __exit__(self, *exc):
+        self.detener()
+
+    def agregar_host(self, mac, ip, dpid, puerto):
+        self.dispositivos.append({
+            'mac': [mac],
+            'ipv4': [ip],
+            'attachmentPoint': [{'switchDPID': dpid, 'port': puerto}],
+        })
+
+    def sumar_trafico(self, dpid, puerto, rx, tx=0):
+        with self.lock:
+            contador = self.trafico.setdefault((dpid, int(puerto)), [0, 0])
+            contador[0] += rx
+            contador[1] += tx
+
+    def sumar_trafico_flow(self, nombre, octetos, paquetes=1):
+        with self.lock:
+            contador = self.contadores_flows.setdefault(nombre, [0, 0])
+            contador[0] += paquetes
+            contador[1] += octetos
+            self.ultimo_uso[nombre] = time.monotonic()
+
+    def _expirar(self):
+        # Como el switch: quita los flows vencidos (Floodlight los borra también
+        # del staticentrypusher al recibir el FLOW_REMOVED). Se llama con el lock tomado.
+        ahora = time.monotonic()
+        for flows in self.flows.values():
+            for nombre, flow in list(flows.items()):
+                instalado = self.instalados.get(nombre, ahora)
+                idle = float(flow.get('idle_timeout') or 0)
+                hard = float(flow.get('hard_timeout') or 0)
+                if (hard and ahora - instalado >= hard) or \
+                        (idle and ahora - max(instalado, self.ultimo_uso.get(nombre, 0)) >= idle):
+                    del flows[nombre]
+
+    def _estadisticas_flows(self):
+        # Mismo formato que /wm/core/switch/all/flow/json de Floodlight 1.x
+        campos_match = ('in_port', 'eth_type', 'ip_proto', 'ipv4_src', 'ipv4_dst',
+                        'tcp_src', 'tcp_dst', 'udp_src', 'udp_dst')
+        with self.lock:
+            self._expirar()
+            respuesta = {}
+            for dpid, flows in self.flows.items():
+                lista = []
+                for nombre, flow in flows.items():
+                    paquetes, octetos = self.contadores_flows.get(nombre, (0, 0))
+                    lista.append({'version': 'OF_13', 'cookie': '45035996273704960', 'table_id': '0x0',
+                                  'packet_count': str(paquetes), 'byte_count': str(octetos),
+                                  'priority': flow.get('priority', '32768'),
+                                  'match': {c: flow[c] for c in campos_match if c in flow}})
+                respuesta[dpid] = {'flows': lista}
+        return respuesta
+
+    def _puertos(self):
+        # Mismo formato que /wm/core/switch/all/port/json de Floodlight 1.x
+        with self.lock:
+            claves = set(self.trafico)
+            for d in self.dispositivos:
+                for ap in d['attachmentPoint']:
+                    claves.add((ap['switchDPID'], int(ap['port'])))
+            por_switch = {}
+            for dpid, puerto in sorted(claves):
+                rx, tx = self.trafico.get((dpid, puerto), (0, 0))
+                por_switch.setdefault(dpid, []).append({'port_number': str(puerto), 'receive_bytes': str(rx),
+                                                        'transmit_bytes': str(tx)})
+        return {dpid: {'port_reply': [{'version': 'OF_13', 'port': puertos}]} for dpid, puertos in por_switch.items()}
+
+    @staticmethod
+    def dpid(i):
+        return ':'.join(f'{b:02x}' for b in (i + 1).to_bytes(8, 'big'))
+
+    def construir_topologia(self, num_switches):
+        # Cadena s1 - s2 - ... - sN: el puerto 1 mira al switch anterior y el 2 al siguiente
+        self.switches = [{'switchDPID': self.dpid(i)} for i in range(num_switches)]
+        self.posicion = {self.dpid(i): i for i in range(num_switches)}
+        self.enlaces = [{'src-switch': self.dpid(i), 'src-port': 2, 'dst-switch': self.dpid(i + 1), 'dst-port': 1,
+                         'type': 'internal', 'direction': 'bidirectional'} for i in range(num_switches - 1)]
+
+    def total_flows(self):
+        with self.lock:
+            self._expirar()
+            return sum(len(f) for f in self.flows.values())
+
+    def _ruta(self, src_dpid, src_port, dst_dpid, dst_port):
+        clave = (src_dpid, src_port, dst_dpid, dst_port)
+        if clave in self.rutas:
+            return self.rutas[clave]
+        if src_dpid in self.posicion and dst_dpid in self.posicion:
+            i, j = self.posicion[src_dpid], self.posicion[dst_dpid]
+            paso = 1 if j >= i else -1
+            salida, entrada = (2, 1) if paso == 1 else (1, 2)
+            ruta = [{'switch': src_dpid, 'port': int(src_port)}]
+            for k in range(i, j, paso):
+                ruta.append({'switch': self.dpid(k), 'port': salida})
+                ruta.append({'switch': self.dpid(k + paso), 'port': entrada})
+            ruta.append({'switch': dst_dpid, 'port': int(dst_port)})
+            return ruta
+        return [{'switch': src_dpid, 'port': int(src_port)}, {'switch': dst_dpid, 'port': int(dst_port)}]
+
+    def _listar(self, switch):
+        with self.lock:
+            self._expirar()
+            if switch == 'all':
+                dpids = list(self.flows)
+            else:
+                dpids = [switch] if switch in self.flows else []
+            return {dpid: [{nombre: flow} for nombre, flow in self.flows[dpid].items()] for dpid in dpids}
+
+    def _manejador(self):
+        stub = self
+
+        class Manejador(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Cabeceras y cuerpo van en escrituras separadas; sin TCP_NODELAY cada
+            # respuesta keep-alive esperaría el ACK retardado del cliente
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _responder(self, status, cuerpo):
+                if stub.latencia:
+                    time.sleep(stub.latencia)
+                datos = json.dumps(cuerpo).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(datos)))
+                self.end_headers()
+                self.wfile.write(datos)
+
+            def _leer_json(self):
+                largo = int(self.headers.get('Content-Length') or 0)
+                datos = self.rfile.read(largo) if largo else b''
+                return json.loads(datos) if datos else {}
+
+            def do_GET(self):
+                stub.peticiones += 1
+                partes = self.path.strip('/').split('/')
+                if self.path.startswith('/wm/device'):
+                    return self._responder(200, stub.dispositivos)
+                if self.path.startswith('/wm/topology/route/') and len(partes) >= 8:
+                    return self._responder(200, stub._ruta(*partes[3:7]))
+                if self.path.startswith('/wm/topology/links'):
+                    return self._responder(200, stub.enlaces)
+                if self.path.startswith('/wm/core/controller/switches'):
+                    return self._responder(200, stub.switches)
+                if self.path.startswith('/wm/core/switch/all/port'):
+                    return self._responder(200, stub._puertos())
+                if self.path.startswith('/wm/core/switch/all/flow'):
+                    return self._responder(200, stub._estadisticas_flows())
+                if self.path.startswith('/wm/staticentrypusher/list/') and len(partes) >= 4:
+                    return self._responder(200, stub._listar(partes[3]))
+                self._responder(404, {'error': 'not found'})
+
+            def do_POST(self):
+                stub.peticiones += 1
+                if not self.path.startswith('/wm/staticentrypusher/json'):
+                    return self._responder(404, {'error': 'not found'})
+                flow = self._leer_json()
+                if 'switch' not in flow or 'name' not in flow:
+                    return self._responder(400, {'status': 'Fields switch and name are required'})
+                if flow['name'] in stub.rechazar:
+                    return self._responder(500, {'status': 'Error pushing entry'})
+                with stub.lock:
+                    # Un nombre identifica un único flow en todo el controlador
+                    for flows in stub.flows.values():
+                        flows.pop(flow['name'], None)
+                    stub.flows.setdefault(flow['switch'], {})[flow['name']] = flow
+                    stub.instalados[flow['name']] = time.monotonic()
+                self._responder(200, {'status': 'Entry pushed'})
+
+            def do_DELETE(self):
+                stub.peticiones += 1
+                if not self.path.startswith('/wm/staticentrypusher/json'):
+                    return self._responder(404, {'error': 'not found'})
+                nombre = self._leer_json().get('name')
+                with stub.lock:
+                    for flows in stub.flows.values():
+                        flows.pop(nombre, None)
+                self._responder(200, {'status': f'Entry {nombre} deleted'})
+
+        return Manejador
@@ -3,109 +3,1492 @@ import os
 import sys
 import requests
 import json
+import threading
+import asyncio
+import time
+import random
+import hashlib
+import hmac
+import secrets
+import marshal
+import shlex
+import re
+import argparse
+import io
+import sqlite3
+from contextlib import contextmanager
+from urllib.parse import urlsplit, parse_qsl, unquote
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 
 
 # Clases principales
+# Modelo compacto en memoria: __slots__, cadenas repetidas internadas y cursos
+# que referencian alumnos y servidores por id entero. Los campos del YAML que el
+# modelo no conoce se guardan en 'extra' para exportar sin pérdidas.
+
+
+def _intern(valor):
+    return sys.intern(valor) if isinstance(valor, str) else valor
+
+
+def _extra(d, campos):
+    extra = {k: v for k, v in d.items() if k not in campos}
+    return extra or None
+
+
+def _a_dict(campos, obj):
+    d = {}
+    for campo in campos:
+        valor = getattr(obj, campo)
+        if valor is not None:
+            d[campo] = valor
+    if obj.extra:
+        d.update(obj.extra)
+    return d
 
 
 class Alumno:
-    def __init__(self, nombre, codigo, mac):
+    __slots__ = ('nombre', 'codigo', 'mac', 'extra')
+    CAMPOS = ('nombre', 'codigo', 'mac')
+
+    def __init__(self, nombre, codigo, mac, extra=None):
         self.nombre = nombre
-        self.codigo = codigo
-        self.mac = mac
+        self.codigo = _intern(codigo)
+        self.mac = _intern(mac)
+        self.extra = extra
+
+    @classmethod
+    def desde_dict(cls, d):
+        return cls(d.get('nombre'), d.get('codigo'), d.get('mac'), _extra(d, cls.CAMPOS))
+
+    def a_dict(self):
+        return _a_dict(self.CAMPOS, self)
 
 
 class Servicio:
-    def __init__(self, nombre, protocolo, puerto):
-        self.nombre = nombre
-        self.protocolo = protocolo
+    __slots__ = ('nombre', 'protocolo', 'puerto', 'extra')
+    CAMPOS = ('nombre', 'protocolo', 'puerto')
+
+    def __init__(self, nombre, protocolo, puerto, extra=None):
+        self.nombre = _intern(nombre)
+        self.protocolo = _intern(protocolo)
         self.puerto = puerto
+        self.extra = extra
+
+    @classmethod
+    def desde_dict(cls, d):
+        return cls(d.get('nombre'), d.get('protocolo'), d.get('puerto'), _extra(d, cls.CAMPOS))
+
+    def a_dict(self):
+        return _a_dict(self.CAMPOS, self)
 
 
 class Servidor:
-    def __init__(self, nombre, ip, servicios=None):
-        self.nombre = nombre
-        self.ip = ip
+    __slots__ = ('nombre', 'ip', 'mac', 'servicios', 'extra')
+    CAMPOS = ('nombre', 'ip', 'mac')
+
+    def __init__(self, nombre, ip, servicios=None, mac=None, extra=None):
+        self.nombre = _intern(nombre)
+        self.ip = _intern(ip)
+        self.mac = _intern(mac)
         self.servicios = servicios if servicios else []
+        self.extra = extra
+
+    @classmethod
+    def desde_dict(cls, d):
+        servicios = [Servicio.desde_dict(s) for s in d.get('servicios') or []]
+        return cls(d.get('nombre'), d.get('ip'), servicios, d.get('mac'), _extra(d, cls.CAMPOS + ('servicios',)))
+
+    def a_dict(self):
+        d = _a_dict(self.CAMPOS, self)
+        d['servicios'] = [s.a_dict() for s in self.servicios]
+        return d
 
 
 class Curso:
-    def __init__(self, codigo, estado, nombre, alumnos=None, servidores=None):
-        self.codigo = codigo
-        self.estado = estado
+    # alumnos: array de ids de código de alumno
+    # servidores: lista de (id de servidor, nombres de servicios permitidos, extra)
+    __slots__ = ('codigo', 'estado', 'nombre', 'alumnos', 'servidores', 'extra')
+    CAMPOS = ('codigo', 'estado', 'nombre')
+
+    def __init__(self, codigo, estado, nombre, alumnos=None, servidores=None, extra=None):
+        self.codigo = _intern(codigo)
+        self.estado = _intern(estado)
         self.nombre = nombre
-        self.alumnos = alumnos if alumnos else []
+        self.alumnos = alumnos if alumnos is not None else array('q')
         self.servidores = servidores if servidores else []
+        self.extra = extra
 
 
 class Conexion:
-    def __init__(self, handler, alumno, servidor, servicio):
+    __slots__ = ('handler', 'alumno', 'servidor', 'servicio', 'controller', 'ruta', 'datos_conexion', 'flows')
+
+    def __init__(self, handler, alumno, servidor, servicio, controller=None, ruta=None, datos_conexion=None,
+                 flows=None):
         self.handler = handler
         self.alumno = alumno
         self.servidor = servidor
         self.servicio = servicio
+        self.controller = controller
+        self.ruta = ruta if ruta else []
+        self.datos_conexion = datos_conexion
+        self.flows = flows if flows else []
+
+    def a_dict(self):
+        return {campo: getattr(self, campo) for campo in self.__slots__}
+
+    @classmethod
+    def desde_dict(cls, d):
+        return cls(**{campo: d.get(campo) for campo in cls.__slots__})
 
 
 # Funciones de import/export YAML
 
 
+# Se usan el loader/dumper en C (libyaml) cuando PyYAML fue compilado con él
+try:
+    from yaml import CSafeLoader as YamlLoader, CSafeDumper as YamlDumper
+except ImportError:
+    from yaml import SafeLoader as YamlLoader, SafeDumper as YamlDumper
+
+
 def importar_datos(filename):
     with open(filename, 'r', encoding='utf-8') as f:
-        data = yaml.safe_load(f)
+        data = yaml.load(f, Loader=YamlLoader)
     return data
 
 
+def yaml_seccion(clave, valor):
+    return yaml.dump({clave: valor}, Dumper=YamlDumper, allow_unicode=True)
+
+
+def escribir_atomico(filename, trozos):
+    # Se escribe a un temporal en el mismo directorio y se renombra: un corte a
+    # mitad de escritura deja intacto el archivo anterior. Devuelve el sha256.
+    directorio = os.path.dirname(os.path.abspath(filename))
+    temporal = os.path.join(directorio, f'.{os.path.basename(filename)}.{os.getpid()}.tmp')
+    resumen = hashlib.sha256()
+    try:
+        with open(temporal, 'wb') as f:
+            for trozo in trozos:
+                datos = trozo.encode('utf-8') if isinstance(trozo, str) else trozo
+                resumen.update(datos)
+                f.write(datos)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporal, filename)
+    except BaseException:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+    return resumen.hexdigest()
+
+
 def exportar_datos(filename, data):
-    with open(filename, 'w', encoding='utf-8') as f:
-        yaml.dump(data, f, allow_unicode=True)
+    # Una sección de primer nivel por vez, en el mismo orden que yaml.dump
+    escribir_atomico(filename, (yaml_seccion(clave, data[clave]) for clave in sorted(data)))
+
+
+# Línea que abre una sección de primer nivel ('clave:' o 'clave: valor') y
+# marcas de anclas/alias, que podrían enlazar una sección con otra
+CLAVE_PRIMER_NIVEL = re.compile(rb'([A-Za-z_][A-Za-z0-9_]*):(?:[ \t].*)?\r?\n?')
+ANCLA_O_ALIAS = re.compile(rb'(?:^|[\s\[{,])[&*][^\s\[\]{},]', re.M)
+
+
+def indice_secciones(contenido):
+    # Posición (inicio, fin) de cada sección de primer nivel en el YAML. Solo se
+    # indexan archivos en estilo bloque como los de exportar_datos: con cualquier
+    # otra forma se devuelve {} y todas las secciones se vuelven a serializar.
+    if not contenido.endswith(b'\n') or ANCLA_O_ALIAS.search(contenido):
+        return {}
+    secciones = {}
+    clave, inicio, posicion = None, 0, 0
+    for linea in contenido.splitlines(keepends=True):
+        if linea.startswith(b'---'):
+            return {}
+        if linea[:1] not in (b' ', b'\t', b'-', b'\r', b'\n'):
+            m = CLAVE_PRIMER_NIVEL.fullmatch(linea)
+            if m is None:
+                return {}
+            if clave is not None:
+                secciones[clave] = (inicio, posicion)
+            clave, inicio = m.group(1).decode(), posicion
+            if clave in secciones:
+                return {}
+        elif clave is None and linea.strip():
+            return {}
+        posicion += len(linea)
+    if clave is not None:
+        secciones[clave] = (inicio, posicion)
+    return secciones
+
+
+# Almacén de políticas en memoria con índices hash
+
+
+class AlmacenPoliticas:
+    def __init__(self, data=None):
+        data = data if data else {}
+        # Tablas de ids: códigos de alumno y nombres de servidor -> id entero
+        self.codigos = []
+        self.claves = []
+        self.id_por_codigo = {}
+        self.nombres_servidor = []
+        self.id_por_servidor = {}
+        self.alumnos_por_codigo = {}
+        self.alumnos_por_mac = {}
+        self.servidores_por_nombre = {}
+        self.servicios_por_clave = {}
+        self.cursos_por_codigo = {}
+        self.extra = _extra(data, ('alumnos', 'cursos', 'servidores'))
+        # Posición (inicio, fin) de cada sección sin cambios en el archivo de
+        # 'origen': al exportar se copia de ahí en lugar de volver a serializarla.
+        # Una sección modificada se descarta del índice.
+        self.yaml_secciones = {}
+        # Cambios aún no guardados, en el formato del registro de cambios
+        self.cambios = []
+        # Clave (ruta, mtime, tamaño, sha256) del archivo que refleja este almacén
+        # y cantidad de cambios ya agregados a su registro
+        self.origen = None
+        self.registrados = 0
+        # Alumnos que perdieron alguna autorización desde la última revocación de flows
+        self.revocados = set()
+        # Las modificaciones y las lecturas de varios pasos lo toman: el daemon
+        # responde consultas mientras su hilo de escritura modifica los índices
+        self.lock = threading.RLock()
+        for d in data.get('alumnos') or []:
+            self._indexar_alumno(Alumno.desde_dict(d))
+        for d in data.get('servidores') or []:
+            self._indexar_servidor(Servidor.desde_dict(d))
+        for d in data.get('cursos') or []:
+            curso = Curso(d.get('codigo'), d.get('estado'), d.get('nombre'),
+                          array('q', (self.id_codigo(c) for c in d.get('alumnos') or [])),
+                          [(self.id_servidor(s.get('nombre')),
+                            tuple(_intern(v) for v in s.get('servicios_permitidos') or []),
+                            _extra(s, ('nombre', 'servicios_permitidos')))
+                           for s in d.get('servidores') or []],
+                          _extra(d, Curso.CAMPOS + ('alumnos', 'servidores')))
+            self.cursos_por_codigo[str(curso.codigo)] = curso
+        self.reconstruir_indices()
+
+    # Conversión al formato del YAML
+
+    def marcar_sucia(self, seccion):
+        self.yaml_secciones.pop(seccion, None)
+
+    def registrar_cambio(self, op, *args):
+        self.cambios.append([op, *args])
+
+    def seccion(self, clave):
+        if clave == 'alumnos':
+            return [a.a_dict() for a in self.alumnos_por_codigo.values()]
+        if clave == 'cursos':
+            return [self.curso_a_dict(c) for c in self.cursos_por_codigo.values()]
+        if clave == 'servidores':
+            return [s.a_dict() for s in self.servidores_por_nombre.values()]
+        return self.extra[clave]
+
+    def trozos_yaml(self, rangos, serializadas):
+        # rangos recibe la posición de cada sección en el archivo escrito y
+        # serializadas las que no se pudieron copiar del origen
+        fuente = None
+        if self.yaml_secciones and self.origen is not None and _sin_modificar(self.origen['ruta'], self.origen):
+            fuente = open(self.origen['ruta'], 'rb')
+        posicion = 0
+        try:
+            for clave in sorted(('alumnos', 'cursos', 'servidores', *(self.extra or ()))):
+                rango = self.yaml_secciones.get(clave) if fuente is not None else None
+                if rango is None:
+                    datos = yaml_seccion(clave, self.seccion(clave)).encode('utf-8')
+                    serializadas.append(clave)
+                else:
+                    fuente.seek(rango[0])
+                    datos = fuente.read(rango[1] - rango[0])
+                rangos[clave] = (posicion, posicion + len(datos))
+                posicion += len(datos)
+                yield datos
+        finally:
+            if fuente is not None:
+                fuente.close()
+
+    def a_dict(self):
+        with self.lock:
+            data = {
+                'alumnos': [a.a_dict() for a in self.alumnos_por_codigo.values()],
+                'cursos': [self.curso_a_dict(c) for c in self.cursos_por_codigo.values()],
+                'servidores': [s.a_dict() for s in self.servidores_por_nombre.values()],
+            }
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    def curso_a_dict(self, curso):
+        with self.lock:
+            d = _a_dict(Curso.CAMPOS, curso)
+            d['alumnos'] = [self.codigos[i] for i in curso.alumnos]
+            servidores = []
+            for id_servidor, servicios, extra in curso.servidores:
+                s = {'nombre': self.nombres_servidor[id_servidor], 'servicios_permitidos': list(servicios)}
+                if extra:
+                    s.update(extra)
+                servidores.append(s)
+            d['servidores'] = servidores
+            return d
+
+    def id_codigo(self, codigo):
+        clave = str(codigo)
+        i = self.id_por_codigo.get(clave)
+        if i is None:
+            clave = sys.intern(clave)
+            i = self.id_por_codigo[clave] = len(self.codigos)
+            self.codigos.append(_intern(codigo))
+            self.claves.append(clave)
+        return i
+
+    def id_servidor(self, nombre):
+        i = self.id_por_servidor.get(nombre)
+        if i is None:
+            i = self.id_por_servidor[_intern(nombre)] = len(self.nombres_servidor)
+            self.nombres_servidor.append(_intern(nombre))
+        return i
+
+    def clave_codigo(self, i):
+        return self.claves[i]
+
+    def reconstruir_indices(self):
+        # Códigos de alumno (como str) por curso y cursos por alumno
+        self.alumnos_curso = {}
+        self.cursos_alumno = {}
+        for codigo, curso in self.cursos_por_codigo.items():
+            claves = {self.clave_codigo(i) for i in curso.alumnos}
+            self.alumnos_curso[codigo] = claves
+            for clave in claves:
+                self.cursos_alumno.setdefault(clave, set()).add(codigo)
+        self.reconstruir_autorizaciones()
+
+    # Matriz de autorización precalculada:
+    #   autorizaciones[(alumno, servidor, servicio)] -> cursos DICTANDO que lo permiten
+    #   cursos_por_servicio[(servidor, servicio)] -> cursos (cualquier estado) que lo incluyen
+
+    def reconstruir_autorizaciones(self):
+        self.permisos_curso = {}
+        self.cursos_por_servicio = {}
+        self.autorizaciones = {}
+        for codigo, curso in self.cursos_por_codigo.items():
+            permisos = set()
+            for id_servidor, servicios, _ in curso.servidores:
+                nombre_servidor = self.nombres_servidor[id_servidor]
+                for nombre_servicio in servicios:
+                    permisos.add((nombre_servidor, nombre_servicio))
+                    self.cursos_por_servicio.setdefault((nombre_servidor, nombre_servicio), {})[codigo] = None
+            self.permisos_curso[codigo] = permisos
+            if curso.estado == 'DICTANDO':
+                for cod in self.alumnos_curso[codigo]:
+                    self._autorizar(codigo, cod)
+
+    def _autorizar(self, codigo_curso, cod_alumno):
+        for nombre_servidor, nombre_servicio in self.permisos_curso[codigo_curso]:
+            clave = (cod_alumno, nombre_servidor, nombre_servicio)
+            self.autorizaciones.setdefault(clave, set()).add(codigo_curso)
+
+    def _revocar(self, codigo_curso, cod_alumno):
+        for nombre_servidor, nombre_servicio in self.permisos_curso[codigo_curso]:
+            clave = (cod_alumno, nombre_servidor, nombre_servicio)
+            cursos = self.autorizaciones.get(clave)
+            if cursos is not None:
+                cursos.discard(codigo_curso)
+                if not cursos:
+                    del self.autorizaciones[clave]
+                    self.revocados.add(cod_alumno)
+
+    def tomar_revocados(self):
+        with self.lock:
+            revocados, self.revocados = self.revocados, set()
+            return revocados
+
+    def esta_autorizado(self, cod_alumno, nombre_servidor, nombre_servicio):
+        return (str(cod_alumno), nombre_servidor, nombre_servicio) in self.autorizaciones
+
+    def cursos_autorizantes(self, cod_alumno, nombre_servidor, nombre_servicio):
+        with self.lock:
+            return set(self.autorizaciones.get((str(cod_alumno), nombre_servidor, nombre_servicio), ()))
+
+    def cursos_con_acceso(self, nombre_servidor, nombre_servicio):
+        codigos = self.cursos_por_servicio.get((nombre_servidor, nombre_servicio), {})
+        return [self.cursos_por_codigo[c] for c in codigos]
+
+    def _indexar_alumno(self, alumno):
+        self.id_codigo(alumno.codigo)
+        self.alumnos_por_codigo[str(alumno.codigo)] = alumno
+        if alumno.mac:
+            self.alumnos_por_mac[alumno.mac.lower()] = alumno
+
+    def _indexar_servidor(self, servidor):
+        self.id_servidor(servidor.nombre)
+        self.servidores_por_nombre[servidor.nombre] = servidor
+        for srv in servidor.servicios:
+            self.servicios_por_clave[(servidor.nombre, srv.nombre)] = srv
+
+    # Búsquedas O(1)
+
+    def buscar_alumno(self, codigo):
+        return self.alumnos_por_codigo.get(str(codigo))
+
+    def buscar_alumno_por_mac(self, mac):
+        return self.alumnos_por_mac.get(mac.lower())
+
+    def buscar_servidor(self, nombre):
+        return self.servidores_por_nombre.get(nombre)
+
+    def buscar_servicio(self, nombre_servidor, nombre_servicio):
+        return self.servicios_por_clave.get((nombre_servidor, nombre_servicio))
+
+    def buscar_curso(self, codigo):
+        return self.cursos_por_codigo.get(str(codigo))
+
+    def alumno_en_curso(self, codigo_curso, cod_alumno):
+        return str(cod_alumno) in self.alumnos_curso.get(str(codigo_curso), ())
+
+    # Operaciones que mantienen los índices
+
+    def agregar_alumno(self, alumno):
+        with self.lock:
+            if str(alumno.codigo) in self.alumnos_por_codigo:
+                return False
+            self._indexar_alumno(alumno)
+            self.marcar_sucia('alumnos')
+            self.registrar_cambio('agregar_alumno', alumno.a_dict())
+            return True
+
+    def borrar_alumno(self, codigo):
+        with self.lock:
+            codigo = str(codigo)
+            alumno = self.alumnos_por_codigo.pop(codigo, None)
+            if alumno is None:
+                return None
+            if alumno.mac:
+                self.alumnos_por_mac.pop(alumno.mac.lower(), None)
+            self.marcar_sucia('alumnos')
+            self.registrar_cambio('borrar_alumno', codigo)
+            # Solo se recorren los cursos en los que está matriculado
+            for codigo_curso in list(self.cursos_alumno.get(codigo, ())):
+                self._quitar_alumno_curso(codigo_curso, codigo)
+            self.cursos_alumno.pop(codigo, None)
+            return alumno
+
+    def agregar_alumno_curso(self, codigo_curso, cod_alumno):
+        with self.lock:
+            codigo_curso = str(codigo_curso)
+            curso = self.cursos_por_codigo.get(codigo_curso)
+            if curso is None or str(cod_alumno) in self.alumnos_curso[codigo_curso]:
+                return False
+            id_alumno = self.id_codigo(cod_alumno)
+            cod_alumno = self.claves[id_alumno]
+            curso.alumnos.append(id_alumno)
+            self.alumnos_curso[codigo_curso].add(cod_alumno)
+            self.cursos_alumno.setdefault(cod_alumno, set()).add(codigo_curso)
+            if curso.estado == 'DICTANDO':
+                self._autorizar(codigo_curso, cod_alumno)
+            self.marcar_sucia('cursos')
+            self.registrar_cambio('agregar_alumno_curso', codigo_curso, cod_alumno)
+            return True
+
+    def eliminar_alumno_curso(self, codigo_curso, cod_alumno):
+        with self.lock:
+            if not self._quitar_alumno_curso(codigo_curso, cod_alumno):
+                return False
+            self.registrar_cambio('eliminar_alumno_curso', str(codigo_curso), str(cod_alumno))
+            return True
+
+    def _quitar_alumno_curso(self, codigo_curso, cod_alumno):
+        codigo_curso, cod_alumno = str(codigo_curso), str(cod_alumno)
+        curso = self.cursos_por_codigo.get(codigo_curso)
+        if curso is None or cod_alumno not in self.alumnos_curso[codigo_curso]:
+            return False
+        self.marcar_sucia('cursos')
+        curso.alumnos.remove(self.id_por_codigo[cod_alumno])
+        self.alumnos_curso[codigo_curso].discard(cod_alumno)
+        cursos = self.cursos_alumno.get(cod_alumno)
+        if cursos is not None:
+            cursos.discard(codigo_curso)
+        if curso.estado == 'DICTANDO':
+            self._revocar(codigo_curso, cod_alumno)
+        return True
+
+    def cambiar_estado_curso(self, codigo_curso, estado):
+        with self.lock:
+            codigo_curso = str(codigo_curso)
+            curso = self.cursos_por_codigo.get(codigo_curso)
+            if curso is None:
+                return False
+            antes = curso.estado == 'DICTANDO'
+            despues = estado == 'DICTANDO'
+            curso.estado = _intern(estado)
+            self.marcar_sucia('cursos')
+            self.registrar_cambio('cambiar_estado_curso', codigo_curso, estado)
+            if antes and not despues:
+                for cod in self.alumnos_curso[codigo_curso]:
+                    self._revocar(codigo_curso, cod)
+            elif despues and not antes:
+                for cod in self.alumnos_curso[codigo_curso]:
+                    self._autorizar(codigo_curso, cod)
+            return True
+
+
+# Almacén cargado actualmente (None hasta importar datos)
+almacen = None
+
+
+def cargar_almacen(data):
+    global almacen
+    almacen = AlmacenPoliticas(data)
+    return almacen
+
+
+# Snapshot binario del dataset ya parseado, junto al YAML de origen: evita el
+# parser YAML y solo se reconstruyen los índices. La primera línea es la clave en
+# JSON (ruta, mtime, tamaño y hash del YAML, más el hash del contenido) y se
+# compara antes de leer nada más. El contenido son solo contenedores básicos en
+# formato marshal, que no ejecuta código al cargarse.
+VERSION_SNAPSHOT = 4
+
+
+def ruta_snapshot(filename):
+    directorio, nombre = os.path.split(os.path.abspath(filename))
+    return os.path.join(directorio, f'.{nombre}.snap')
+
+
+def _clave_snapshot(filename, contenido):
+    return _clave_archivo(filename, hashlib.sha256(contenido).hexdigest())
+
+
+def _clave_archivo(filename, sha256):
+    st = os.stat(filename)
+    return {
+        'version': VERSION_SNAPSHOT,
+        'ruta': os.path.abspath(filename),
+        'mtime_ns': st.st_mtime_ns,
+        'tamano': st.st_size,
+        'sha256': sha256,
+    }
 
 
+def leer_snapshot(filename, clave):
+    try:
+        with open(ruta_snapshot(filename), 'rb') as f:
+            cabecera = json.loads(f.readline())
+            if not isinstance(cabecera, dict) or cabecera.get('clave') != clave:
+                return None
+            contenido = f.read()
+        if hashlib.sha256(contenido).hexdigest() != cabecera.get('sha256'):
+            return None
+        data = marshal.loads(contenido)
+        if not isinstance(data, dict):
+            return None
+        return AlmacenPoliticas(data)
+    except (OSError, EOFError, ValueError, TypeError, AttributeError, ImportError, KeyError, IndexError):
+        return None
+
+
+def escribir_snapshot(filename, clave, almacen_nuevo):
+    destino = ruta_snapshot(filename)
+    temporal = f'{destino}.{os.getpid()}.tmp'
+    try:
+        contenido = marshal.dumps(almacen_nuevo.a_dict())
+    except ValueError:
+        # Valores que marshal no admite (p. ej. fechas del YAML): no se usa snapshot
+        return
+    try:
+        with open(temporal, 'wb') as f:
+            f.write(json.dumps({'clave': clave, 'sha256': hashlib.sha256(contenido).hexdigest()}).encode() + b'\n')
+            f.write(contenido)
+        os.replace(temporal, destino)
+    except OSError:
+        # Sin permisos de escritura el snapshot simplemente no se usa
+        if os.path.exists(temporal):
+            os.remove(temporal)
+
+
+def cargar_almacen_archivo(filename, usar_snapshot=True):
+    global almacen
+    with open(filename, 'rb') as f:
+        contenido = f.read()
+    clave = _clave_snapshot(filename, contenido)
+    cargado = leer_snapshot(filename, clave) if usar_snapshot else None
+    if cargado is None:
+        cargado = AlmacenPoliticas(yaml.load(contenido.decode('utf-8'), Loader=YamlLoader))
+        if usar_snapshot:
+            escribir_snapshot(filename, clave, cargado)
+    cargado.origen = clave
+    cargado.yaml_secciones = indice_secciones(contenido)
+    aplicar_registro(filename, cargado)
+    almacen = cargado
+    return almacen
+
+
+# Registro de cambios append-only junto al YAML: un guardado incremental agrega
+# una línea JSON por operación en lugar de reescribir todo el archivo. La primera
+# línea identifica el YAML base por su sha256; si el YAML cambia, el registro se
+# ignora. Al superar MAX_CAMBIOS_REGISTRO se compacta con una exportación completa.
+MAX_CAMBIOS_REGISTRO = 50000
+# Se activa con --registro-cambios; por defecto cada exportación es completa
+usar_registro = False
+OPERACIONES_REGISTRO = ('borrar_alumno', 'agregar_alumno_curso', 'eliminar_alumno_curso', 'cambiar_estado_curso')
+
+
+def ruta_registro(filename):
+    directorio, nombre = os.path.split(os.path.abspath(filename))
+    return os.path.join(directorio, f'.{nombre}.cambios')
+
+
+def aplicar_cambio(destino, cambio):
+    op, *args = cambio
+    if op == 'agregar_alumno':
+        destino.agregar_alumno(Alumno.desde_dict(args[0]))
+    elif op in OPERACIONES_REGISTRO:
+        getattr(destino, op)(*args)
+    else:
+        raise ValueError(f"Operación desconocida en el registro: {op}")
+
+
+def aplicar_registro(filename, destino):
+    ruta = ruta_registro(filename)
+    try:
+        with open(ruta, 'rb') as f:
+            lineas = f.read().split(b'\n')
+    except OSError:
+        return 0
+    try:
+        cabecera = json.loads(lineas[0])
+    except ValueError:
+        return 0
+    if not isinstance(cabecera, dict) or cabecera.get('base') != destino.origen['sha256']:
+        return 0
+    validos = len(lineas[0]) + 1
+    aplicados = 0
+    for linea in lineas[1:]:
+        if not linea:
+            continue
+        try:
+            cambio = json.loads(linea)
+        except ValueError:
+            # Línea truncada por un corte durante el último guardado
+            os.truncate(ruta, validos)
+            break
+        aplicar_cambio(destino, cambio)
+        validos += len(linea) + 1
+        aplicados += 1
+    # Lo reaplicado ya está en el registro
+    destino.cambios.clear()
+    destino.registrados = aplicados
+    return aplicados
+
+
+def _sin_modificar(filename, origen):
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return False
+    return (origen['ruta'] == os.path.abspath(filename) and st.st_mtime_ns == origen['mtime_ns']
+            and st.st_size == origen['tamano'])
+
+
+def _agregar_registro(filename, destino):
+    cambios = destino.cambios
+    if cambios:
+        # Sin cambios registrados todavía, un registro existente es de otra base
+        modo = 'a' if destino.registrados else 'w'
+        with open(ruta_registro(filename), modo, encoding='utf-8') as f:
+            if modo == 'w':
+                f.write(json.dumps({'base': destino.origen['sha256']}) + '\n')
+            f.writelines(json.dumps(c, ensure_ascii=False) + '\n' for c in cambios)
+            f.flush()
+            os.fsync(f.fileno())
+        destino.registrados += len(cambios)
+    resultado = {'modo': 'registro', 'cambios': len(cambios)}
+    destino.cambios = []
+    return resultado
+
+
+def _exportar_completo(filename, destino):
+    rangos, serializadas = {}, []
+    destino.origen = _clave_archivo(filename, escribir_atomico(filename, destino.trozos_yaml(rangos, serializadas)))
+    destino.yaml_secciones = rangos
+    destino.cambios = []
+    destino.registrados = 0
+    if os.path.exists(ruta_registro(filename)):
+        os.remove(ruta_registro(filename))
+    escribir_snapshot(filename, destino.origen, destino)
+    return {'modo': 'completo', 'secciones_serializadas': len(serializadas)}
+
+
+def guardar_almacen(filename, destino=None, registro=False):
+    # Con registro=True y el archivo sin tocar desde la última carga/guardado,
+    # solo se agregan los cambios pendientes al registro
+    destino = destino if destino is not None else almacen
+    if (registro and destino.origen is not None and _sin_modificar(filename, destino.origen)
+            and destino.registrados + len(destino.cambios) <= MAX_CAMBIOS_REGISTRO):
+        return _agregar_registro(filename, destino)
+    return _exportar_completo(filename, destino)
+
+
+
+
+
+# Instrumentación: temporizadores por fase, contadores e histogramas de latencia
+# de las llamadas REST, exportables en formato de texto de Prometheus
+LIMITES_LATENCIA = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def endpoint_rest(ruta):
+    # Agrupa las rutas con parámetros en una sola etiqueta
+    ruta = ruta.split('?', 1)[0]
+    for prefijo in ('/wm/topology/route', '/wm/staticentrypusher/list', '/wm/core/switch'):
+        if ruta.startswith(prefijo):
+            return prefijo
+    return ruta.rstrip('/') or '/'
+
+
+class Histograma:
+    __slots__ = ('cuentas', 'suma', 'total')
+
+    def __init__(self):
+        self.cuentas = [0] * (len(LIMITES_LATENCIA) + 1)
+        self.suma = 0.0
+        self.total = 0
+
+    def observar(self, valor):
+        self.cuentas[bisect_left(LIMITES_LATENCIA, valor)] += 1
+        self.suma += valor
+        self.total += 1
+
+
+class Metricas:
+    def __init__(self):
+        self.activas = True
+        self.lock = threading.Lock()
+        self.reiniciar()
+
+    def reiniciar(self):
+        with self.lock:
+            self.contadores = {}
+            self.histogramas = {}
+
+    def incrementar(self, nombre, etiquetas=(), valor=1):
+        if not self.activas:
+            return
+        clave = (nombre, tuple(etiquetas))
+        with self.lock:
+            self.contadores[clave] = self.contadores.get(clave, 0) + valor
 
+    def observar(self, nombre, etiquetas, segundos):
+        if not self.activas:
+            return
+        clave = (nombre, tuple(etiquetas))
+        with self.lock:
+            histograma = self.histogramas.get(clave)
+            if histograma is None:
+                histograma = self.histogramas[clave] = Histograma()
+            histograma.observar(segundos)
+
+    @contextmanager
+    def fase(self, nombre):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar('fase_segundos', (('fase', nombre),), time.perf_counter() - inicio)
+
+    def registrar_rest(self, metodo, ruta, status, segundos, enviados, recibidos):
+        if not self.activas:
+            return
+        etiquetas = (('metodo', metodo), ('endpoint', endpoint_rest(ruta)))
+        self.observar('rest_segundos', etiquetas, segundos)
+        self.incrementar('rest_respuestas_total', etiquetas + (('status', str(status)),))
+        self.incrementar('rest_bytes_enviados_total', etiquetas, enviados)
+        self.incrementar('rest_bytes_recibidos_total', etiquetas, recibidos)
+
+    def texto_prometheus(self):
+        def formato(etiquetas):
+            if not etiquetas:
+                return ''
+            return '{' + ','.join(f'{k}="{v}"' for k, v in etiquetas) + '}'
+
+        lineas = []
+        with self.lock:
+            contadores = sorted(self.contadores.items())
+            histogramas = sorted(self.histogramas.items())
+        tipos = set()
+        for (nombre, etiquetas), valor in contadores:
+            if nombre not in tipos:
+                lineas.append(f'# TYPE npm_{nombre} counter')
+                tipos.add(nombre)
+            lineas.append(f'npm_{nombre}{formato(etiquetas)} {valor}')
+        for (nombre, etiquetas), h in histogramas:
+            if nombre not in tipos:
+                lineas.append(f'# TYPE npm_{nombre} histogram')
+                tipos.add(nombre)
+            acumulado = 0
+            for limite, cuenta in zip(LIMITES_LATENCIA + ('+Inf',), h.cuentas):
+                acumulado += cuenta
+                lineas.append(f'npm_{nombre}_bucket{formato(etiquetas + (("le", limite),))} {acumulado}')
+            lineas.append(f'npm_{nombre}_sum{formato(etiquetas)} {h.suma}')
+            lineas.append(f'npm_{nombre}_count{formato(etiquetas)} {h.total}')
+        return '\n'.join(lineas) + '\n'
+
+    def exportar_prometheus(self, archivo):
+        temporal = f'{archivo}.tmp'
+        with open(temporal, 'w', encoding='utf-8') as f:
+            f.write(self.texto_prometheus())
+        os.replace(temporal, archivo)
+
+    def imprimir(self):
+        with self.lock:
+            histogramas = sorted(self.histogramas.items())
+            contadores = sorted(self.contadores.items())
+        if not histogramas and not contadores:
+            print("No hay métricas registradas.")
+            return
+        for (nombre, etiquetas), h in histogramas:
+            media = h.suma / h.total * 1000 if h.total else 0.0
+            detalle = ' '.join(f'{k}={v}' for k, v in etiquetas)
+            print(f"{nombre} {detalle} | n={h.total} | media={media:.2f} ms | total={h.suma:.3f} s")
+        for (nombre, etiquetas), valor in contadores:
+            detalle = ' '.join(f'{k}={v}' for k, v in etiquetas)
+            print(f"{nombre} {detalle} | {valor}")
+
+
+metricas = Metricas()
+
+
+def _medir_respuesta(response, *args, **kwargs):
+    # Hook de requests: cada respuesta del controlador queda registrada
+    request = response.request
+    cuerpo = request.body or b''
+    metricas.registrar_rest(request.method, request.path_url, response.status_code,
+                            response.elapsed.total_seconds(), len(cuerpo), len(response.content))
+    return response
+
+
+# Sesiones HTTP keep-alive por controlador, compartidas por todas las llamadas REST
+MAX_HILOS_FLOWS = 16
+PUERTO_REST = 8080
+_sesiones = {}
+_lock_sesiones = threading.Lock()
+
+
+def url_controlador(controller_ip):
+    # Acepta 'host' (puerto REST por defecto) o 'host:puerto'
+    if ':' in controller_ip:
+        return f'http://{controller_ip}'
+    return f'http://{controller_ip}:{PUERTO_REST}'
+
+
+# Transporte hacia el controlador: timeouts de conexión/lectura, reintentos con
+# backoff exponencial y jitter para las llamadas idempotentes, y un circuit breaker
+# por controlador que falla de inmediato mientras el controlador no responde
+TIMEOUT_CONEXION = 3.05
+TIMEOUT_LECTURA = 10.0
+REINTENTOS = 3
+BACKOFF_BASE = 0.2
+BACKOFF_MAXIMO = 2.0
+# Fallos consecutivos que abren el circuito y segundos hasta la llamada de prueba
+UMBRAL_CIRCUITO = 5
+ESPERA_CIRCUITO = 15.0
+METODOS_IDEMPOTENTES = frozenset(('GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS'))
+
+
+class ControladorNoDisponible(requests.ConnectionError):
+    pass
+
+
+class Circuito:
+    def __init__(self, umbral=UMBRAL_CIRCUITO, espera=ESPERA_CIRCUITO):
+        self.umbral = umbral
+        self.espera = espera
+        self.fallos = 0
+        self.abierto_desde = None
+        self.prueba_en_curso = False
+        self.lock = threading.Lock()
+
+    def estado(self):
+        if self.abierto_desde is None:
+            return 'cerrado'
+        if time.monotonic() - self.abierto_desde >= self.espera:
+            return 'semiabierto'
+        return 'abierto'
+
+    def permitir(self):
+        with self.lock:
+            estado = self.estado()
+            if estado == 'cerrado':
+                return True
+            # Semiabierto: pasa una sola llamada de prueba
+            if estado == 'semiabierto' and not self.prueba_en_curso:
+                self.prueba_en_curso = True
+                return True
+        metricas.incrementar('circuito_rechazos_total')
+        return False
+
+    def exito(self):
+        with self.lock:
+            self.fallos = 0
+            self.abierto_desde = None
+            self.prueba_en_curso = False
+
+    def fallo(self):
+        with self.lock:
+            self.fallos += 1
+            if self.prueba_en_curso or (self.abierto_desde is None and self.fallos >= self.umbral):
+                self.abierto_desde = time.monotonic()
+                metricas.incrementar('circuito_aperturas_total')
+            self.prueba_en_curso = False
+
+
+_circuitos = {}
+
+
+def obtener_circuito(controller_ip):
+    with _lock_sesiones:
+        circuito = _circuitos.get(controller_ip)
+        if circuito is None:
+            circuito = _circuitos[controller_ip] = Circuito()
+        return circuito
+
+
+def espera_backoff(intento):
+    # Backoff exponencial con jitter completo
+    return random.uniform(0, min(BACKOFF_MAXIMO, BACKOFF_BASE * 2 ** intento))
+
+
+def error_circuito(controller_ip):
+    return f"Controlador {controller_ip} no disponible (circuito abierto)"
+
+
+class SesionControlador(requests.Session):
+    def __init__(self, controller_ip, circuito):
+        super().__init__()
+        self.controller_ip = controller_ip
+        self.circuito = circuito
+
+    def request(self, method, url, *args, idempotente=None, **kwargs):
+        # idempotente=True permite reintentar también un POST (p. ej. un flow con nombre)
+        kwargs.setdefault('timeout', (TIMEOUT_CONEXION, TIMEOUT_LECTURA))
+        if idempotente is None:
+            idempotente = method.upper() in METODOS_IDEMPOTENTES
+        intentos = REINTENTOS + 1 if idempotente else 1
+        for intento in range(intentos):
+            if intento:
+                metricas.incrementar('rest_reintentos_total')
+                time.sleep(espera_backoff(intento - 1))
+            if not self.circuito.permitir():
+                raise ControladorNoDisponible(error_circuito(self.controller_ip))
+            try:
+                response = super().request(method, url, *args, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                self.circuito.fallo()
+                if intento == intentos - 1:
+                    raise
+                continue
+            except BaseException:
+                # Cualquier otro error también cierra la prueba del estado semiabierto
+                self.circuito.fallo()
+                raise
+            if response.status_code >= 500:
+                self.circuito.fallo()
+                if intento < intentos - 1:
+                    continue
+            else:
+                self.circuito.exito()
+            return response
+
+
+def obtener_sesion(controller_ip):
+    circuito = obtener_circuito(controller_ip)
+    with _lock_sesiones:
+        session = _sesiones.get(controller_ip)
+        if session is None:
+            session = SesionControlador(controller_ip, circuito)
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=MAX_HILOS_FLOWS)
+            session.mount('http://', adapter)
+            session.headers.update({'Content-type': 'application/json'})
+            session.hooks['response'].append(_medir_respuesta)
+            _sesiones[controller_ip] = session
+        return session
+
+
+# Pools de controladores: un nombre agrupa varias instancias de Floodlight y se usa
+# en lugar de una IP. Cada miembro declara los DPID que controla (fragmento) o
+# ninguno (réplica que ve toda la red). Cada flow se envía al dueño de su switch;
+# si su circuito está abierto pasa a una réplica u otro miembro sano.
+class PoolControladores:
+    def __init__(self, nombre, miembros):
+        # miembros: [(ip, dpids)]
+        self.nombre = nombre
+        self.miembros = [ip for ip, _ in miembros]
+        self.duenos = {str(dpid).lower(): ip for ip, dpids in miembros for dpid in dpids or ()}
+        self.replicas = [ip for ip, dpids in miembros if not dpids]
 
+    @property
+    def fragmentado(self):
+        return bool(self.duenos)
 
+    @staticmethod
+    def sano(ip):
+        return obtener_circuito(ip).estado() != 'abierto'
 
-def get_attachment_point(controller_ip, mac):
-    url = f'http://{controller_ip}:8080/wm/device/'
-    response = requests.get(url)
-    if response.status_code == 200:
-        devices = response.json()
+    def candidatos(self, switch=None):
+        # Dueño del switch, luego réplicas y por último el resto de miembros
+        dueno = self.duenos.get(str(switch).lower()) if switch else None
+        orden = [dueno] if dueno else []
+        return list(dict.fromkeys(orden + self.replicas + self.miembros))
+
+    def destino(self, switch=None):
+        orden = self.candidatos(switch)
+        for ip in orden:
+            if self.sano(ip):
+                if ip != orden[0]:
+                    metricas.incrementar('pool_failover_total', (('pool', self.nombre),))
+                return ip
+        # Ninguno sano: el dueño responderá con el error del circuito
+        return orden[0]
+
+    def sanos(self):
+        return [ip for ip in self.miembros if self.sano(ip)] or list(self.miembros)
+
+    def lectura(self):
+        # Con fragmentos cada miembro solo ve sus switches: se consulta a todos
+        return self.sanos() if self.fragmentado else [self.destino()]
+
+    def respaldo(self):
+        # Miembros a probar, en orden, si una consulta sin fragmentos falla
+        return [] if self.fragmentado else [ip for ip in self.candidatos() if self.sano(ip)]
+
+
+pools = {}
+
+
+def configurar_pool(nombre, miembros):
+    pools[nombre] = PoolControladores(nombre, miembros)
+    return pools[nombre]
+
+
+def cargar_pools(filename):
+    # YAML: {nombre: [{ip: 'host:puerto', dpids: [...]}, ...]}
+    with open(filename, 'r', encoding='utf-8') as f:
+        datos = yaml.load(f, Loader=YamlLoader) or {}
+    for nombre, miembros in datos.items():
+        configurar_pool(str(nombre), [(str(m['ip']), m.get('dpids') or []) for m in miembros])
+    return list(datos)
+
+
+def miembro_activo(controller_ip, switch=None):
+    pool = pools.get(controller_ip)
+    return pool.destino(switch) if pool is not None else controller_ip
+
+
+def miembros_controlador(controller_ip):
+    pool = pools.get(controller_ip)
+    return pool.sanos() if pool is not None else [controller_ip]
+
+
+def consultar_controlador(controller_ip, ruta):
+    # GET a los miembros de lectura; devuelve los cuerpos JSON de las respuestas 200.
+    # Solo se propaga el error si ningún miembro respondió.
+    pool = pools.get(controller_ip)
+    cuerpos = []
+    error = None
+    for ip in (pool.lectura() if pool is not None else [controller_ip]):
+        try:
+            response = obtener_sesion(ip).get(f'{url_controlador(ip)}{ruta}')
+        except requests.RequestException as e:
+            error = e
+            continue
+        if response.status_code == 200:
+            cuerpos.append(response.json())
+    if not cuerpos and error is not None and pool is not None:
+        for ip in pool.respaldo():
+            try:
+                response = obtener_sesion(ip).get(f'{url_controlador(ip)}{ruta}')
+            except requests.RequestException as e:
+                error = e
+                continue
+            if response.status_code == 200:
+                return [response.json()]
+    if not cuerpos and error is not None:
+        raise error
+    return cuerpos
+
+
+def fusionar_por_dpid(cuerpos):
+    fusion = {}
+    for cuerpo in cuerpos:
+        if isinstance(cuerpo, dict):
+            fusion.update(cuerpo)
+    return fusion
+
+
+# Caché de la tabla de dispositivos: MAC -> (DPID, puerto)
+TTL_DISPOSITIVOS = 30.0
+
+
+class CacheDispositivos:
+    def __init__(self, controller_ip, ttl=TTL_DISPOSITIVOS, intervalo_minimo=1.0):
+        self.controller_ip = controller_ip
+        self.ttl = ttl
+        # Evita re-descargar la tabla en cada MAC desconocida
+        self.intervalo_minimo = intervalo_minimo
+        self.puntos = {}
+        self.ips = {}
+        self.ultima_carga = None
+        self.lock = threading.Lock()
+
+    def refrescar(self):
+        cuerpos = consultar_controlador(self.controller_ip, '/wm/device/')
+        if not cuerpos:
+            return False
+        devices = []
+        for cuerpo in cuerpos:
+            devices.extend(cuerpo.get('devices', []) if isinstance(cuerpo, dict) else cuerpo)
+        puntos = {}
+        ips = {}
         for device in devices:
-            if mac.lower() in [m.lower() for m in device.get('mac', [])]:
-                ap = device.get('attachmentPoint', [])
+            ap = device.get('attachmentPoint', [])
+            ipv4 = device.get('ipv4', [])
+            for m in device.get('mac', []):
                 if ap:
-                    return ap[0]['switchDPID'], ap[0]['port']
-    return None, None
+                    puntos[m.lower()] = (ap[0]['switchDPID'], ap[0]['port'])
+                if ipv4:
+                    ips[m.lower()] = ipv4[0]
+        with self.lock:
+            self.puntos = puntos
+            self.ips = ips
+            self.ultima_carga = time.monotonic()
+        return True
+
+    def vencida(self):
+        return self.ultima_carga is None or time.monotonic() - self.ultima_carga > self.ttl
+
+    def buscar(self, mac):
+        if self.vencida():
+            self.refrescar()
+        punto = self.puntos.get(mac.lower())
+        if punto is None and time.monotonic() - (self.ultima_carga or 0) >= self.intervalo_minimo:
+            # MAC no encontrada: forzar nueva descarga por si el host acaba de aparecer
+            self.refrescar()
+            punto = self.puntos.get(mac.lower())
+        return punto if punto else (None, None)
+
+    def buscar_ip(self, mac):
+        if self.vencida():
+            self.refrescar()
+        return self.ips.get(mac.lower())
+
+
+_caches_dispositivos = {}
+
+
+def obtener_cache_dispositivos(controller_ip):
+    with _lock_sesiones:
+        cache = _caches_dispositivos.get(controller_ip)
+        if cache is None:
+            cache = CacheDispositivos(controller_ip)
+            _caches_dispositivos[controller_ip] = cache
+        return cache
+
+
+def get_attachment_point(controller_ip, mac):
+    return obtener_cache_dispositivos(controller_ip).buscar(mac)
+
+
+# Contadores de bytes (rx + tx) de todos los puertos, descargados en una sola
+# petición; la tasa de cada puerto se calcula entre dos muestras consecutivas
+TTL_PUERTOS = 5.0
+
+
+class MonitorPuertos:
+    def __init__(self, controller_ip, ttl=TTL_PUERTOS):
+        self.controller_ip = controller_ip
+        self.ttl = ttl
+        self.bytes = {}
+        self.tasas = {}
+        self.ultima_carga = None
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _contadores(respuesta):
+        # Floodlight 1.x: {dpid: {'port_reply': [{'port': [...]}]}}; 0.9: {dpid: [...]}
+        contadores = {}
+        for dpid, datos in respuesta.items():
+            if isinstance(datos, dict):
+                puertos = [p for reply in datos.get('port_reply', []) for p in reply.get('port', [])]
+            else:
+                puertos = datos or []
+            for p in puertos:
+                try:
+                    numero = int(p.get('port_number', p.get('portNumber')))
+                    total = (int(p.get('receive_bytes', p.get('receiveBytes', 0)))
+                             + int(p.get('transmit_bytes', p.get('transmitBytes', 0))))
+                except (TypeError, ValueError):
+                    # Puerto 'local' u otro sin contador numérico
+                    continue
+                contadores[(dpid.lower(), numero)] = total
+        return contadores
+
+    def refrescar(self):
+        cuerpos = consultar_controlador(self.controller_ip, '/wm/core/switch/all/port/json')
+        if not cuerpos:
+            return False
+        contadores = self._contadores(fusionar_por_dpid(cuerpos))
+        ahora = time.monotonic()
+        with self.lock:
+            if self.ultima_carga is not None and ahora > self.ultima_carga:
+                segundos = ahora - self.ultima_carga
+                # Un contador que retrocede (reinicio del switch) cuenta como tasa 0
+                self.tasas = {k: max(0, v - self.bytes.get(k, v)) / segundos for k, v in contadores.items()}
+            self.bytes = contadores
+            self.ultima_carga = ahora
+        return True
+
+    def vencida(self):
+        return self.ultima_carga is None or time.monotonic() - self.ultima_carga > self.ttl
+
+    def tasa(self, dpid, puerto):
+        if self.vencida():
+            self.refrescar()
+        return self.tasas.get((str(dpid).lower(), int(puerto)), 0.0)
+
+
+_monitores_puertos = {}
+
+
+def obtener_monitor_puertos(controller_ip):
+    with _lock_sesiones:
+        monitor = _monitores_puertos.get(controller_ip)
+        if monitor is None:
+            monitor = MonitorPuertos(controller_ip)
+            _monitores_puertos[controller_ip] = monitor
+        return monitor
+
+
+# Caché LRU de rutas, invalidada cuando cambia la topología del controlador
+CAPACIDAD_RUTAS = 4096
+INTERVALO_TOPOLOGIA = 5.0
+
+
+class CacheRutas:
+    def __init__(self, controller_ip, capacidad=CAPACIDAD_RUTAS, intervalo_topologia=INTERVALO_TOPOLOGIA):
+        self.controller_ip = controller_ip
+        self.capacidad = capacidad
+        self.intervalo_topologia = intervalo_topologia
+        self.rutas = OrderedDict()
+        self.huella_topologia = None
+        self.ultima_verificacion = None
+        self.aciertos = 0
+        self.fallos = 0
+        self.lock = threading.Lock()
+
+    def _huella(self):
+        partes = []
+        for endpoint in ('/wm/topology/links/json', '/wm/core/controller/switches/json'):
+            cuerpos = consultar_controlador(self.controller_ip, endpoint)
+            if not cuerpos:
+                return None
+            partes.append(json.dumps(cuerpos, sort_keys=True))
+        return hashlib.sha1('|'.join(partes).encode()).hexdigest()
+
+    def verificar_topologia(self, forzar=False):
+        ahora = time.monotonic()
+        if not forzar and self.ultima_verificacion is not None \
+                and ahora - self.ultima_verificacion < self.intervalo_topologia:
+            return
+        huella = self._huella()
+        with self.lock:
+            self.ultima_verificacion = ahora
+            if huella is None or huella != self.huella_topologia:
+                # Topología distinta (o desconocida): las rutas guardadas ya no son confiables
+                self.rutas.clear()
+            self.huella_topologia = huella
+
+    def invalidar(self):
+        with self.lock:
+            self.rutas.clear()
+
+    def _consultar(self, src_dpid, src_port, dst_dpid, dst_port):
+        ip = miembro_activo(self.controller_ip, src_dpid)
+        url = f'{url_controlador(ip)}/wm/topology/route/{src_dpid}/{src_port}/{dst_dpid}/{dst_port}/json'
+        response = obtener_sesion(ip).get(url)
+        if response.status_code == 200:
+            path = response.json()
+            return [(hop['switch'], hop['port']) for hop in path]
+        return []
+
+    def obtener(self, src_dpid, src_port, dst_dpid, dst_port):
+        self.verificar_topologia()
+        clave = (src_dpid, src_port, dst_dpid, dst_port)
+        with self.lock:
+            ruta = self.rutas.get(clave)
+            if ruta is not None:
+                self.rutas.move_to_end(clave)
+                self.aciertos += 1
+                return list(ruta)
+            self.fallos += 1
+        ruta = self._consultar(src_dpid, src_port, dst_dpid, dst_port)
+        if ruta:
+            with self.lock:
+                self.rutas[clave] = tuple(ruta)
+                self.rutas.move_to_end(clave)
+                while len(self.rutas) > self.capacidad:
+                    self.rutas.popitem(last=False)
+        return ruta
+
+
+_caches_rutas = {}
+
+
+def obtener_cache_rutas(controller_ip):
+    with _lock_sesiones:
+        cache = _caches_rutas.get(controller_ip)
+        if cache is None:
+            cache = CacheRutas(controller_ip)
+            _caches_rutas[controller_ip] = cache
+        return cache
 
 
 def get_route(controller_ip, src_dpid, src_port, dst_dpid, dst_port):
-    url = f'http://{controller_ip}:8080/wm/topology/route/{src_dpid}/{src_port}/{dst_dpid}/{dst_port}/json'
-    response = requests.get(url)
-    if response.status_code == 200:
-        path = response.json()
-        return [(hop['switch'], hop['port']) for hop in path]
-    return []
+    return obtener_cache_rutas(controller_ip).obtener(src_dpid, src_port, dst_dpid, dst_port)
+
+
+# Pipeline de envío de flows con pool de hilos acotado
 
 
 def push_flow_to_floodlight(controller_ip, flow):
-    url = f'http://{controller_ip}:8080/wm/staticentrypusher/json'
-    headers = {'Content-type': 'application/json'}
-    response = requests.post(url, data=json.dumps(flow), headers=headers)
+    return _entrada_floodlight(controller_ip, 'POST', flow)
+
+
+def borrar_flow_de_floodlight(controller_ip, nombre):
+    return _entrada_floodlight(controller_ip, 'DELETE', {'name': nombre})
+
+
+def switch_de_flow(controller_ip, nombre):
+    tabla = tablas_flows.get(controller_ip)
+    flow = tabla.flows.get(nombre) if tabla is not None else None
+    return flow['switch'] if flow else None
+
+
+def _entrada_floodlight(controller_ip, metodo, flow):
+    pool = pools.get(controller_ip)
+    if pool is not None:
+        switch = flow.get('switch') or switch_de_flow(controller_ip, flow['name'])
+        if switch is None and pool.fragmentado:
+            # Borrado de un flow de switch desconocido: se pide a todos los miembros
+            resultados = [_entrada_floodlight(ip, metodo, flow) for ip in pool.sanos()]
+            return next((r for r in resultados if r['ok']), resultados[0])
+        ip = pool.destino(switch)
+        resultado = _entrada_floodlight(ip, metodo, flow)
+        if resultado['status'] is None and pool.destino(switch) != ip:
+            # El miembro cayó durante el envío y su circuito ya abrió: otro lo reintenta
+            resultado = _entrada_floodlight(pool.destino(switch), metodo, flow)
+        return resultado
+    url = f'{url_controlador(controller_ip)}/wm/staticentrypusher/json'
+    resultado = {'name': flow['name'], 'switch': flow.get('switch'), 'ok': False, 'status': None, 'error': None}
+    try:
+        # Las entradas se identifican por nombre: reenviarlas es idempotente
+        response = obtener_sesion(controller_ip).request(metodo, url, data=json.dumps(flow), idempotente=True)
+    except requests.RequestException as e:
+        metricas.incrementar('rest_errores_total', (('endpoint', '/wm/staticentrypusher/json'),))
+        resultado['error'] = str(e)
+        return resultado
+    resultado['status'] = response.status_code
     if response.status_code == 200:
-        print(f"Flow '{flow['name']}' insertado correctamente en Floodlight.")
+        resultado['ok'] = True
     else:
-        print(f"Error al insertar flow '{flow['name']}': {response.status_code} {response.text}")
+        resultado['error'] = response.text
+    return resultado
+
+
+def push_flows(controller_ip, flows, max_hilos=MAX_HILOS_FLOWS):
+    # Envía los flows en paralelo; el reporte conserva el orden de entrada. Con un
+    # pool cada flow va al controlador de su switch y los hilos escalan con los miembros
+    if not flows:
+        return []
+    hilos = max(1, min(max_hilos * len(miembros_controlador(controller_ip)), len(flows)))
+    with ThreadPoolExecutor(max_workers=hilos) as pool:
+        return list(pool.map(lambda flow: push_flow_to_floodlight(controller_ip, flow), flows))
+
+
+def revertir_flows(controller_ip, reporte, anteriores=None, max_hilos=MAX_HILOS_FLOWS):
+    # Deshace los flows enviados con éxito: se restaura la versión anterior si
+    # otra conexión la usaba y, si no, se borran
+    anteriores = anteriores or {}
+    enviados = [r['name'] for r in reporte if r['ok']]
+    if not enviados:
+        return []
+
+    def deshacer(nombre):
+        previo = anteriores.get(nombre)
+        if previo is not None:
+            return push_flow_to_floodlight(controller_ip, previo)
+        return borrar_flow_de_floodlight(controller_ip, nombre)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_hilos, len(enviados)))) as pool:
+        resultados = list(pool.map(deshacer, enviados))
+    for r in reporte:
+        if r['ok']:
+            r['revertido'] = True
+    metricas.incrementar('flows_revertidos_total', valor=sum(1 for r in resultados if r['ok']))
+    return resultados
+
+
+def instalar_ruta(controller_ip, flows, tabla=None, max_hilos=MAX_HILOS_FLOWS):
+    # Instalación atómica: si falla algún flow se revierten los ya enviados.
+    # Devuelve (ok, reporte, reporte de la reversión)
+    anteriores = {f['name']: tabla.flows[f['name']] for f in flows if tabla is not None and f['name'] in tabla.flows}
+    reporte = push_flows(controller_ip, flows, max_hilos)
+    if all(r['ok'] for r in reporte):
+        return True, reporte, []
+    return False, reporte, revertir_flows(controller_ip, reporte, anteriores, max_hilos)
+
+
+def error_instalacion(reporte, reversion):
+    fallido = next(r for r in reporte if not r['ok'])
+    mensaje = f"No se pudo instalar la ruta: flow '{fallido['name']}': {fallido['status']} {fallido['error']}."
+    revertidos = sum(1 for r in reversion if r['ok'])
+    mensaje += f" Se revirtieron {revertidos} flows ya enviados."
+    if revertidos < len(reversion):
+        mensaje += f" {len(reversion) - revertidos} no se pudieron revertir (use Reconciliar)."
+    return mensaje
+
+
+def imprimir_reporte_flows(reporte):
+    for r in reporte:
+        if r['ok']:
+            print(f"Flow '{r['name']}' insertado correctamente en Floodlight.")
+        else:
+            print(f"Error al insertar flow '{r['name']}': {r['status']} {r['error']}")
+    ok = sum(1 for r in reporte if r['ok'])
+    print(f"Flows instalados: {ok}/{len(reporte)}")
 
 
-def build_route(ruta, datos_conexion, controller_ip='localhost'):
+def construir_flows(ruta, datos_conexion):
     # datos_conexion: dict con keys: mac_src, mac_dst, ip_src, ip_dst, puerto_l4, protocolo ('TCP'/'UDP')
     proto_num = '0x06' if datos_conexion['protocolo'].upper() == 'TCP' else '0x11'
+    # El protocolo va en el nombre: TCP y UDP al mismo puerto son flows distintos
+    proto = datos_conexion['protocolo'].lower()
+    # Timeouts del servicio solo en los flows IP: los ARP se comparten entre servicios
+    timeouts = {campo: str(datos_conexion[campo]) for campo in ('idle_timeout', 'hard_timeout')
+                if datos_conexion.get(campo)}
+    flows = []
     # Flujos en sentido alumno -> servidor
     for i in range(len(ruta)-1):
         sw, in_port = ruta[i]
         _, out_port = ruta[i+1]
         flow = {
             "switch": sw,
-            "name": f"flow_{datos_conexion['mac_src']}_{datos_conexion['mac_dst']}_{i}_fwd",
+            "name": f"flow_{datos_conexion['mac_src']}_{datos_conexion['mac_dst']}_{proto}_{datos_conexion['puerto_l4']}_{i}_fwd",
             "cookie": "0",
             "priority": "32768",
             "in_port": str(in_port),
@@ -115,9 +1498,10 @@ def build_route(ruta, datos_conexion, controller_ip='localhost'):
             "ipv4_dst": datos_conexion['ip_dst'],
             f"{datos_conexion['protocolo'].lower()}_dst": str(datos_conexion['puerto_l4']),
             "active": "true",
-            "actions": f"output={out_port}"
+            "actions": f"output={out_port}",
+            **timeouts
         }
-        push_flow_to_floodlight(controller_ip, flow)
+        flows.append(flow)
     # Flujos en sentido servidor -> alumno
     for i in range(len(ruta)-1):
         sw, in_port = ruta[-(i+1)]
@@ -126,7 +1510,7 @@ def build_route(ruta, datos_conexion, controller_ip='localhost'):
             continue
         flow = {
             "switch": sw,
-            "name": f"flow_{datos_conexion['mac_dst']}_{datos_conexion['mac_src']}_{i}_rev",
+            "name": f"flow_{datos_conexion['mac_dst']}_{datos_conexion['mac_src']}_{proto}_{datos_conexion['puerto_l4']}_{i}_rev",
             "cookie": "0",
             "priority": "32768",
             "in_port": str(in_port),
@@ -136,10 +1520,11 @@ def build_route(ruta, datos_conexion, controller_ip='localhost'):
             "ipv4_dst": datos_conexion['ip_src'],
             f"{datos_conexion['protocolo'].lower()}_src": str(datos_conexion['puerto_l4']),
             "active": "true",
-            "actions": f"output={out_port}"
+            "actions": f"output={out_port}",
+            **timeouts
         }
-        push_flow_to_floodlight(controller_ip, flow)
-       
+        flows.append(flow)
+
     # Flujos para ARP en ambos sentidos
     for i in range(len(ruta)-1):
         sw, in_port = ruta[i]
@@ -156,7 +1541,7 @@ def build_route(ruta, datos_conexion, controller_ip='localhost'):
             "active": "true",
             "actions": f"output={out_port}"
         }
-        push_flow_to_floodlight(controller_ip, flow_arp_fwd)
+        flows.append(flow_arp_fwd)
         # ARP reverso
         flow_arp_rev = {
             "switch": sw,
@@ -170,8 +1555,295 @@ def build_route(ruta, datos_conexion, controller_ip='localhost'):
             "active": "true",
             "actions": f"output={in_port}"
         }
-        push_flow_to_floodlight(controller_ip, flow_arp_rev)
-    print("Flows instalados para la ruta en ambos sentidos y para ARP.")
+        flows.append(flow_arp_rev)
+    return flows
+
+
+def build_route(ruta, datos_conexion, controller_ip='localhost'):
+    # Devuelve un reporte por flow: name, switch, ok, status, error (y revertido
+    # si la ruta no se pudo instalar completa)
+    return instalar_ruta(controller_ip, construir_flows(ruta, datos_conexion))[1]
+
+
+# Cliente asyncio para el REST de Floodlight: conexiones keep-alive reutilizadas,
+# límite de operaciones en vuelo y timeout por llamada
+MAX_OPERACIONES_ASYNC = 64
+TIMEOUT_ASYNC = TIMEOUT_LECTURA
+
+
+class ErrorHTTPAsync(Exception):
+    pass
+
+
+class ClienteFloodlightAsync:
+    def __init__(self, controller_ip, limite=MAX_OPERACIONES_ASYNC, timeout=TIMEOUT_ASYNC):
+        base = url_controlador(controller_ip)[len('http://'):]
+        host, _, puerto = base.rpartition(':')
+        self.controller_ip = controller_ip
+        self.host = host
+        self.puerto = int(puerto)
+        self.timeout = timeout
+        self.limite = limite
+        self._semaforo = asyncio.Semaphore(limite)
+        self._libres = []
+        self.circuito = obtener_circuito(controller_ip)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.cerrar()
+
+    async def cerrar(self):
+        libres, self._libres = self._libres, []
+        for _, writer in libres:
+            writer.close()
+        for _, writer in libres:
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+
+    async def _enviar(self, conexion, metodo, ruta, cuerpo):
+        inicio = time.perf_counter()
+        reader, writer = conexion
+        datos = json.dumps(cuerpo).encode() if cuerpo is not None else b''
+        cabecera = (f'{metodo} {ruta} HTTP/1.1\r\n'
+                    f'Host: {self.host}:{self.puerto}\r\n'
+                    'Connection: keep-alive\r\n'
+                    'Content-Type: application/json\r\n'
+                    f'Content-Length: {len(datos)}\r\n\r\n')
+        writer.write(cabecera.encode() + datos)
+        await writer.drain()
+        linea = await reader.readline()
+        if not linea:
+            raise ConnectionError('Conexión cerrada por el controlador')
+        status = int(linea.split()[1])
+        headers = {}
+        while True:
+            linea = await reader.readline()
+            if linea in (b'\r\n', b'\n', b''):
+                break
+            clave, _, valor = linea.decode('latin-1').partition(':')
+            headers[clave.strip().lower()] = valor.strip()
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            partes = []
+            while True:
+                tam = int((await reader.readline()).split(b';')[0], 16)
+                if tam == 0:
+                    await reader.readline()
+                    break
+                partes.append(await reader.readexactly(tam))
+                await reader.readline()
+            contenido = b''.join(partes)
+        elif 'content-length' in headers:
+            contenido = await reader.readexactly(int(headers['content-length']))
+        else:
+            contenido = await reader.read()
+            headers['connection'] = 'close'
+        reutilizable = headers.get('connection', '').lower() != 'close'
+        metricas.registrar_rest(metodo, ruta, status, time.perf_counter() - inicio,
+                                len(cabecera) + len(datos), len(contenido))
+        return status, contenido, reutilizable
+
+    async def peticion(self, metodo, ruta, cuerpo=None, idempotente=None):
+        # Mismas reglas que SesionControlador: circuit breaker y reintentos con backoff
+        if idempotente is None:
+            idempotente = metodo in METODOS_IDEMPOTENTES
+        intentos = REINTENTOS + 1 if idempotente else 1
+        for intento in range(intentos):
+            if intento:
+                metricas.incrementar('rest_reintentos_total')
+                await asyncio.sleep(espera_backoff(intento - 1))
+            if not self.circuito.permitir():
+                raise ErrorHTTPAsync(error_circuito(self.controller_ip))
+            try:
+                status, respuesta = await self._peticion(metodo, ruta, cuerpo)
+            except (ErrorHTTPAsync, asyncio.TimeoutError, OSError):
+                self.circuito.fallo()
+                if intento == intentos - 1:
+                    raise
+                continue
+            except BaseException:
+                # Respuesta malformada o cancelación: también cierra la prueba
+                self.circuito.fallo()
+                raise
+            if status >= 500:
+                self.circuito.fallo()
+                if intento < intentos - 1:
+                    continue
+            else:
+                self.circuito.exito()
+            return status, respuesta
+
+    async def _peticion(self, metodo, ruta, cuerpo=None):
+        async with self._semaforo:
+            for intento in range(2):
+                reutilizada = bool(self._libres)
+                if reutilizada:
+                    conexion = self._libres.pop()
+                else:
+                    conexion = await asyncio.wait_for(
+                        asyncio.open_connection(self.host, self.puerto), min(TIMEOUT_CONEXION, self.timeout))
+                try:
+                    status, contenido, reutilizable = await asyncio.wait_for(
+                        self._enviar(conexion, metodo, ruta, cuerpo), self.timeout)
+                except (ConnectionError, asyncio.IncompleteReadError) as e:
+                    metricas.incrementar('rest_errores_total', (('endpoint', endpoint_rest(ruta)),))
+                    conexion[1].close()
+                    # Una conexión keep-alive puede haber sido cerrada por el servidor
+                    if reutilizada and intento == 0:
+                        continue
+                    raise ErrorHTTPAsync(str(e)) from e
+                except (ValueError, IndexError) as e:
+                    # Línea de estado, cabeceras o chunks que no son HTTP válido
+                    metricas.incrementar('rest_errores_total', (('endpoint', endpoint_rest(ruta)),))
+                    conexion[1].close()
+                    raise ErrorHTTPAsync(f"Respuesta HTTP inválida: {e}") from e
+                except BaseException:
+                    conexion[1].close()
+                    raise
+                if reutilizable and len(self._libres) < self.limite:
+                    self._libres.append(conexion)
+                else:
+                    conexion[1].close()
+                try:
+                    return status, json.loads(contenido) if contenido else None
+                except ValueError:
+                    return status, contenido.decode('utf-8', 'replace')
+
+    async def dispositivos(self):
+        status, devices = await self.peticion('GET', '/wm/device/')
+        if status != 200:
+            return []
+        if isinstance(devices, dict):
+            devices = devices.get('devices', [])
+        return devices
+
+    async def attachment_point(self, mac):
+        for device in await self.dispositivos():
+            if mac.lower() in [m.lower() for m in device.get('mac', [])]:
+                ap = device.get('attachmentPoint', [])
+                if ap:
+                    return ap[0]['switchDPID'], ap[0]['port']
+        return None, None
+
+    async def ruta(self, src_dpid, src_port, dst_dpid, dst_port):
+        status, path = await self.peticion(
+            'GET', f'/wm/topology/route/{src_dpid}/{src_port}/{dst_dpid}/{dst_port}/json')
+        if status == 200:
+            return [(hop['switch'], hop['port']) for hop in path]
+        return []
+
+    async def _resultado_flow(self, metodo, flow):
+        resultado = {'name': flow['name'], 'switch': flow.get('switch'), 'ok': False, 'status': None, 'error': None}
+        try:
+            status, respuesta = await self.peticion(metodo, '/wm/staticentrypusher/json', flow, idempotente=True)
+        except (ErrorHTTPAsync, asyncio.TimeoutError, OSError) as e:
+            resultado['error'] = str(e) or type(e).__name__
+            return resultado
+        resultado['status'] = status
+        if status == 200:
+            resultado['ok'] = True
+        else:
+            resultado['error'] = respuesta
+        return resultado
+
+    async def push_flow(self, flow):
+        return await self._resultado_flow('POST', flow)
+
+    async def borrar_flow(self, nombre):
+        return await self._resultado_flow('DELETE', {'name': nombre})
+
+    async def listar_flows(self, switch='all'):
+        status, flows = await self.peticion('GET', f'/wm/staticentrypusher/list/{switch}/json')
+        return flows if status == 200 and flows else {}
+
+    async def push_flows(self, flows):
+        return list(await asyncio.gather(*(self.push_flow(flow) for flow in flows)))
+
+    async def borrar_flows(self, nombres):
+        return list(await asyncio.gather(*(self.borrar_flow(nombre) for nombre in nombres)))
+
+
+class ClientePoolAsync:
+    # Misma interfaz que ClienteFloodlightAsync; reparte cada flow al cliente del
+    # controlador dueño de su switch (cada uno con su propio límite de operaciones)
+    def __init__(self, pool, limite=MAX_OPERACIONES_ASYNC, timeout=TIMEOUT_ASYNC):
+        self.pool = pool
+        self.controller_ip = pool.nombre
+        self.limite = limite
+        self.timeout = timeout
+        self.clientes = {}
+
+    def cliente(self, ip):
+        if ip not in self.clientes:
+            self.clientes[ip] = ClienteFloodlightAsync(ip, self.limite, self.timeout)
+        return self.clientes[ip]
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.cerrar()
+
+    async def cerrar(self):
+        for cliente in self.clientes.values():
+            await cliente.cerrar()
+
+    async def peticion(self, metodo, ruta, cuerpo=None, idempotente=None):
+        return await self.cliente(self.pool.destino()).peticion(metodo, ruta, cuerpo, idempotente)
+
+    async def dispositivos(self):
+        listados = await asyncio.gather(*(self.cliente(ip).dispositivos() for ip in self.pool.lectura()))
+        return [device for devices in listados for device in devices]
+
+    async def attachment_point(self, mac):
+        for device in await self.dispositivos():
+            if mac.lower() in [m.lower() for m in device.get('mac', [])]:
+                ap = device.get('attachmentPoint', [])
+                if ap:
+                    return ap[0]['switchDPID'], ap[0]['port']
+        return None, None
+
+    async def ruta(self, src_dpid, src_port, dst_dpid, dst_port):
+        return await self.cliente(self.pool.destino(src_dpid)).ruta(src_dpid, src_port, dst_dpid, dst_port)
+
+    async def push_flow(self, flow):
+        return await self.cliente(self.pool.destino(flow['switch'])).push_flow(flow)
+
+    async def borrar_flow(self, nombre):
+        switch = switch_de_flow(self.pool.nombre, nombre)
+        if switch is None and self.pool.fragmentado:
+            resultados = await asyncio.gather(*(self.cliente(ip).borrar_flow(nombre) for ip in self.pool.sanos()))
+            return next((r for r in resultados if r['ok']), resultados[0])
+        return await self.cliente(self.pool.destino(switch)).borrar_flow(nombre)
+
+    async def listar_flows(self, switch='all'):
+        if switch != 'all':
+            return await self.cliente(self.pool.destino(switch)).listar_flows(switch)
+        listados = await asyncio.gather(*(self.cliente(ip).listar_flows('all') for ip in self.pool.lectura()))
+        return fusionar_por_dpid(listados)
+
+    async def push_flows(self, flows):
+        return list(await asyncio.gather(*(self.push_flow(flow) for flow in flows)))
+
+    async def borrar_flows(self, nombres):
+        return list(await asyncio.gather(*(self.borrar_flow(nombre) for nombre in nombres)))
+
+
+def cliente_floodlight_async(controller_ip, limite=MAX_OPERACIONES_ASYNC):
+    pool = pools.get(controller_ip)
+    if pool is not None:
+        return ClientePoolAsync(pool, limite)
+    return ClienteFloodlightAsync(controller_ip, limite)
+
+
+def push_flows_async(controller_ip, flows, limite=MAX_OPERACIONES_ASYNC):
+    async def _push():
+        async with cliente_floodlight_async(controller_ip, limite) as cliente:
+            return await cliente.push_flows(flows)
+    return asyncio.run(_push())
 
 
 
@@ -224,20 +1896,22 @@ def importar_menu():
     if not os.path.exists(filename):
         print(f"Archivo {filename} no encontrado.")
         return
-    data = importar_datos(filename)
-    listar_alumnos.data = data
+    cargar_almacen_archivo(filename)
     print(f"Importado {filename}")
+    imprimir_revocadas(revocar_no_autorizadas(todas=True))
 
 
 def exportar_menu():
     print("Nombre de archivo a exportar:", end=' ')
     filename = input().strip()
-    if not hasattr(listar_alumnos, 'data'):
+    if almacen is None:
         print("No hay datos cargados para exportar.")
         return
-    data = listar_alumnos.data
-    exportar_datos(filename, data)
-    print(f"Exportado a {filename}")
+    resultado = guardar_almacen(filename, registro=usar_registro)
+    if resultado['modo'] == 'registro':
+        print(f"Guardados {resultado['cambios']} cambios en el registro de {filename}")
+    else:
+        print(f"Exportado a {filename}")
 
 
 def cursos_menu():
@@ -265,59 +1939,60 @@ def cursos_menu():
 
 
 def listar_cursos():
-    if not hasattr(listar_alumnos, 'data'):
+    if almacen is None:
         print("Primero importe los datos con la opción 1 del menú principal.")
         return
-    data = listar_alumnos.data
     print("\nCursos registrados:")
-    for curso in data.get('cursos', []):
-        print(f"- {curso['codigo']} | {curso['nombre']} | Estado: {curso['estado']}")
+    for curso in almacen.cursos_por_codigo.values():
+        print(f"- {curso.codigo} | {curso.nombre} | Estado: {curso.estado}")
     print()
 
 
 def mostrar_detalle_curso():
-    if not hasattr(listar_alumnos, 'data'):
+    if almacen is None:
         print("Primero importe los datos con la opción 1 del menú principal.")
         return
-    data = listar_alumnos.data
     codigo = input("Ingrese el código del curso: ").strip()
-    for curso in data.get('cursos', []):
-        if str(curso['codigo']) == codigo:
-            print(f"Código: {curso['codigo']}")
-            print(f"Nombre: {curso['nombre']}")
-            print(f"Estado: {curso['estado']}")
-            print(f"Alumnos: {curso.get('alumnos', [])}")
-            print(f"Servidores: {curso.get('servidores', [])}")
-            return
-    print("Curso no encontrado.")
+    curso = almacen.buscar_curso(codigo)
+    if not curso:
+        print("Curso no encontrado.")
+        return
+    detalle = almacen.curso_a_dict(curso)
+    print(f"Código: {curso.codigo}")
+    print(f"Nombre: {curso.nombre}")
+    print(f"Estado: {curso.estado}")
+    print(f"Alumnos: {detalle['alumnos']}")
+    print(f"Servidores: {detalle['servidores']}")
 
 
 def actualizar_curso():
-    if not hasattr(listar_alumnos, 'data'):
+    if almacen is None:
         print("Primero importe los datos con la opción 1 del menú principal.")
         return
-    data = listar_alumnos.data
     codigo = input("Código del curso a actualizar: ").strip()
-    curso = next((c for c in data.get('cursos', []) if str(c['codigo']) == codigo), None)
+    curso = almacen.buscar_curso(codigo)
     if not curso:
         print("Curso no encontrado.")
         return
-    print("1) Agregar alumno\n2) Eliminar alumno")
+    print("1) Agregar alumno\n2) Eliminar alumno\n3) Cambiar estado")
     op = input("Seleccione opción: ").strip()
     if op == '1':
         cod_alumno = input("Código del alumno a agregar: ").strip()
-        if cod_alumno not in curso['alumnos']:
-            curso['alumnos'].append(cod_alumno)
+        if almacen.agregar_alumno_curso(codigo, cod_alumno):
             print("Alumno agregado al curso.")
         else:
             print("El alumno ya está en el curso.")
     elif op == '2':
         cod_alumno = input("Código del alumno a eliminar: ").strip()
-        if cod_alumno in curso['alumnos']:
-            curso['alumnos'].remove(cod_alumno)
+        if almacen.eliminar_alumno_curso(codigo, cod_alumno):
             print("Alumno eliminado del curso.")
         else:
             print("El alumno no está en el curso.")
+    elif op == '3':
+        estado = input("Nuevo estado (ej: DICTANDO, INACTIVO): ").strip().upper()
+        almacen.cambiar_estado_curso(codigo, estado)
+        print(f"Estado del curso actualizado a {estado}.")
+    imprimir_revocadas(revocar_no_autorizadas())
 
 
 def alumnos_menu():
@@ -346,61 +2021,52 @@ def alumnos_menu():
 
 
 def listar_alumnos():
-    if not hasattr(listar_alumnos, 'data'):
+    if almacen is None:
         print("Primero importe los datos con la opción 1 del menú principal.")
         return
-    data = listar_alumnos.data
     print("\nAlumnos registrados:")
-    for alumno in data.get('alumnos', []):
-        print(f"- {alumno['nombre']} (Código: {alumno['codigo']}, MAC: {alumno['mac']})")
+    for alumno in almacen.alumnos_por_codigo.values():
+        print(f"- {alumno.nombre} (Código: {alumno.codigo}, MAC: {alumno.mac})")
     print()
 
 
 def mostrar_detalle_alumno():
-    if not hasattr(listar_alumnos, 'data'):
+    if almacen is None:
         print("Primero importe los datos con la opción 1 del menú principal.")
         return
-    data = listar_alumnos.data
     codigo = input("Ingrese el código del alumno: ").strip()
-    for alumno in data.get('alumnos', []):
-        if str(alumno['codigo']) == codigo:
-            print(f"Nombre: {alumno['nombre']}")
-            print(f"Código: {alumno['codigo']}")
-            print(f"MAC: {alumno['mac']}")
-            return
-    print("Alumno no encontrado.")
+    alumno = almacen.buscar_alumno(codigo)
+    if not alumno:
+        print("Alumno no encontrado.")
+        return
+    print(f"Nombre: {alumno.nombre}")
+    print(f"Código: {alumno.codigo}")
+    print(f"MAC: {alumno.mac}")
 
 
 def agregar_alumno():
-    if not hasattr(listar_alumnos, 'data'):
+    if almacen is None:
         print("Primero importe los datos con la opción 1 del menú principal.")
         return
-    data = listar_alumnos.data
     nombre = input("Nombre del alumno: ").strip()
     codigo = input("Código del alumno: ").strip()
     mac = input("MAC del alumno: ").strip()
-    if any(str(a['codigo']) == codigo for a in data.get('alumnos', [])):
+    if not almacen.agregar_alumno(Alumno(nombre, codigo, mac)):
         print("Ya existe un alumno con ese código.")
         return
-    data['alumnos'].append({'nombre': nombre, 'codigo': codigo, 'mac': mac})
     print(f"Alumno {nombre} agregado.")
 
 
 def borrar_alumno():
-    if not hasattr(listar_alumnos, 'data'):
+    if almacen is None:
         print("Primero importe los datos con la opción 1 del menú principal.")
         return
-    data = listar_alumnos.data
     codigo = input("Código del alumno a borrar: ").strip()
-    for i, alumno in enumerate(data.get('alumnos', [])):
-        if str(alumno['codigo']) == codigo:
-            data['alumnos'].pop(i)
-            for curso in data.get('cursos', []):
-                if codigo in [str(c) for c in curso.get('alumnos', [])]:
-                    curso['alumnos'] = [c for c in curso['alumnos'] if str(c) != codigo]
-            print("Alumno borrado correctamente.")
-            return
-    print("Alumno no encontrado.")
+    if almacen.borrar_alumno(codigo) is None:
+        print("Alumno no encontrado.")
+        return
+    print("Alumno borrado correctamente.")
+    imprimir_revocadas(revocar_no_autorizadas())
 
 
 def servidores_menu():
@@ -423,31 +2089,29 @@ def servidores_menu():
 
 
 def listar_servidores():
-    if not hasattr(listar_alumnos, 'data'):
+    if almacen is None:
         print("Primero importe los datos con la opción 1 del menú principal.")
         return
-    data = listar_alumnos.data
     print("\nServidores registrados:")
-    for servidor in data.get('servidores', []):
-        print(f"- {servidor['nombre']} (IP: {servidor['ip']})")
+    for servidor in almacen.servidores_por_nombre.values():
+        print(f"- {servidor.nombre} (IP: {servidor.ip})")
     print()
 
 
 def mostrar_detalle_servidor():
-    if not hasattr(listar_alumnos, 'data'):
+    if almacen is None:
         print("Primero importe los datos con la opción 1 del menú principal.")
         return
-    data = listar_alumnos.data
     nombre = input("Ingrese el nombre del servidor: ").strip()
-    for servidor in data.get('servidores', []):
-        if servidor['nombre'] == nombre:
-            print(f"Nombre: {servidor['nombre']}")
-            print(f"IP: {servidor['ip']}")
-            print("Servicios:")
-            for srv in servidor.get('servicios', []):
-                print(f"  - {srv['nombre']} | Protocolo: {srv['protocolo']} | Puerto: {srv['puerto']}")
-            return
-    print("Servidor no encontrado.")
+    servidor = almacen.buscar_servidor(nombre)
+    if not servidor:
+        print("Servidor no encontrado.")
+        return
+    print(f"Nombre: {servidor.nombre}")
+    print(f"IP: {servidor.ip}")
+    print("Servicios:")
+    for srv in servidor.servicios:
+        print(f"  - {srv.nombre} | Protocolo: {srv.protocolo} | Puerto: {srv.puerto}")
 
 
 def politicas_menu():
@@ -459,7 +2123,11 @@ def conexiones_menu():
 1) Crear
 2) Listar
 3) Borrar
-4) Volver
+4) Provisionar curso (masivo)
+5) Reconciliar flows con el controlador
+6) Métricas de provisión
+7) Ocupación de tablas de flows
+8) Volver
 >>> """, end='')
     opcion = input().strip()
     if opcion == '1':
@@ -468,146 +2136,1929 @@ def conexiones_menu():
         listar_conexiones()
     elif opcion == '3':
         borrar_conexion()
-    # Volver
     elif opcion == '4':
+        provisionar_curso()
+    elif opcion == '5':
+        reconciliar_menu()
+    elif opcion == '6':
+        metricas_menu()
+    elif opcion == '7':
+        ocupacion_menu()
+    # Volver
+    elif opcion == '8':
         return
     else:
         print("Opción inválida. Intente de nuevo.")
         conexiones_menu()  # Volver
 
 
-# Conexiones manuales
-conexiones = []
+# Conexiones manuales: índice en memoria por handler, alumno, servidor y servicio,
+# persistido en SQLite para recuperarlas al reiniciar la herramienta
+ARCHIVO_CONEXIONES = 'conexiones.db'
+
+
+class AlmacenConexiones:
+    INDICES = ('alumno', 'servidor', 'servicio')
+
+    def __init__(self):
+        self.por_handler = {}
+        self.indices = {campo: {} for campo in self.INDICES}
+        # handler -> último uso (creación o tráfico visto); el primero es el menos usado
+        self.uso = OrderedDict()
+        self.db = None
+        self.lock = threading.RLock()
+        self._en_lote = False
+
+    def abrir(self, archivo=ARCHIVO_CONEXIONES):
+        with self.lock:
+            self.db = sqlite3.connect(archivo, check_same_thread=False)
+            self.db.execute('PRAGMA journal_mode=WAL')
+            self.db.execute('PRAGMA synchronous=NORMAL')
+            self.db.execute('''CREATE TABLE IF NOT EXISTS conexiones (
+                handler TEXT PRIMARY KEY, alumno TEXT, servidor TEXT, servicio TEXT,
+                controller TEXT, ruta TEXT, datos_conexion TEXT, flows TEXT)''')
+            for campo in self.INDICES:
+                self.db.execute(f'CREATE INDEX IF NOT EXISTS idx_conexiones_{campo} ON conexiones ({campo})')
+            self.db.commit()
+            filas = self.db.execute('SELECT handler, alumno, servidor, servicio, controller, ruta, '
+                                    'datos_conexion, flows FROM conexiones ORDER BY rowid').fetchall()
+        renombradas = []
+        for handler, alumno, servidor, servicio, controller, ruta, datos, flows in filas:
+            conexion = Conexion(handler, alumno, servidor, servicio, controller,
+                                json.loads(ruta), json.loads(datos), json.loads(flows))
+            self._indexar(conexion)
+            # Los flows recuperados vuelven a contar como referencias instaladas
+            if conexion.ruta and conexion.datos_conexion:
+                flows_conexion = construir_flows(conexion.ruta, conexion.datos_conexion)
+                try:
+                    obtener_tabla_flows(controller).adquirir(handler, flows_conexion)
+                except ValueError:
+                    # Quedan sin referencia; Reconciliar los corrige en el switch
+                    continue
+                # Registros con el formato de nombres anterior (sin protocolo): los
+                # flows viejos que sigan en el switch los borra Reconciliar
+                nombres = [f['name'] for f in flows_conexion]
+                if nombres != conexion.flows:
+                    conexion.flows = nombres
+                    renombradas.append(conexion)
+        with self.lote():
+            for conexion in renombradas:
+                self[conexion.handler] = conexion
+        return len(filas)
+
+    def cerrar(self):
+        with self.lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
+
+    @contextmanager
+    def lote(self):
+        # Agrupa muchas altas/bajas en una sola transacción
+        with self.lock:
+            anterior, self._en_lote = self._en_lote, True
+            try:
+                yield self
+            finally:
+                self._en_lote = anterior
+                if not anterior and self.db is not None:
+                    self.db.commit()
+
+    def _confirmar(self):
+        if self.db is not None and not self._en_lote:
+            self.db.commit()
+
+    def _indexar(self, conexion):
+        self.por_handler[conexion.handler] = conexion
+        self.uso[conexion.handler] = time.monotonic()
+        self.uso.move_to_end(conexion.handler)
+        for campo in self.INDICES:
+            self.indices[campo].setdefault(str(getattr(conexion, campo)), set()).add(conexion.handler)
+
+    def _desindexar(self, conexion):
+        for campo in self.INDICES:
+            handlers = self.indices[campo].get(str(getattr(conexion, campo)))
+            if handlers is not None:
+                handlers.discard(conexion.handler)
+                if not handlers:
+                    del self.indices[campo][str(getattr(conexion, campo))]
+
+    def __setitem__(self, handler, conexion):
+        with self.lock:
+            anterior = self.por_handler.get(handler)
+            if anterior is not None:
+                self._desindexar(anterior)
+            self._indexar(conexion)
+            if self.db is not None:
+                self.db.execute('INSERT OR REPLACE INTO conexiones VALUES (?, ?, ?, ?, ?, ?, ?, ?)', (
+                    conexion.handler, str(conexion.alumno), conexion.servidor, conexion.servicio,
+                    conexion.controller, json.dumps(conexion.ruta), json.dumps(conexion.datos_conexion),
+                    json.dumps(conexion.flows)))
+                self._confirmar()
+
+    def __delitem__(self, handler):
+        with self.lock:
+            conexion = self.por_handler.pop(handler, None)
+            if conexion is None:
+                return
+            self._desindexar(conexion)
+            self.uso.pop(handler, None)
+            if self.db is not None:
+                self.db.execute('DELETE FROM conexiones WHERE handler = ?', (handler,))
+                self._confirmar()
+
+    def __getitem__(self, handler):
+        return self.por_handler[handler]
+
+    def get(self, handler, defecto=None):
+        return self.por_handler.get(handler, defecto)
+
+    def __contains__(self, handler):
+        return handler in self.por_handler
+
+    def __len__(self):
+        return len(self.por_handler)
+
+    def __iter__(self):
+        return iter(list(self.por_handler))
+
+    def values(self):
+        return list(self.por_handler.values())
+
+    def tocar(self, handlers):
+        ahora = time.monotonic()
+        with self.lock:
+            for handler in handlers:
+                if handler in self.uso:
+                    self.uso[handler] = ahora
+                    self.uso.move_to_end(handler)
+
+    def menos_usadas(self):
+        with self.lock:
+            return list(self.uso)
+
+    def handlers_de(self, campo, valor):
+        with self.lock:
+            return list(self.indices[campo].get(str(valor), ()))
+
+    def consultar(self, alumno=None, servidor=None, servicio=None, pagina=1, por_pagina=20):
+        # Intersección de los índices pedidos; devuelve (conexiones de la página, total)
+        with self.lock:
+            filtros = [(campo, valor) for campo, valor in (('alumno', alumno), ('servidor', servidor),
+                                                         ('servicio', servicio)) if valor]
+            if filtros:
+                conjuntos = sorted((self.indices[campo].get(str(valor), set()) for campo, valor in filtros), key=len)
+                handlers = set(conjuntos[0]).intersection(*conjuntos[1:])
+                # Se conserva el orden de creación
+                seleccion = [h for h in self.por_handler if h in handlers] if len(handlers) > 1 else list(handlers)
+            else:
+                seleccion = list(self.por_handler)
+            total = len(seleccion)
+            inicio = (max(pagina, 1) - 1) * por_pagina
+            return [self.por_handler[h] for h in seleccion[inicio:inicio + por_pagina]], total
+
+
+conexiones = AlmacenConexiones()
+
+
+# Flows compartidos entre conexiones con conteo de referencias (por controlador).
+# Un flow idéntico (p. ej. los ARP de ssh y web hacia el mismo servidor) se
+# instala con el primer uso y se borra cuando lo libera la última conexión.
+class TablaFlows:
+    def __init__(self):
+        self.flows = {}
+        self.refs = {}
+        # Flows instalados por switch (DPID en minúsculas)
+        self.por_switch = {}
+
+    def _contar(self, switch, delta):
+        switch = str(switch).lower()
+        total = self.por_switch.get(switch, 0) + delta
+        if total > 0:
+            self.por_switch[switch] = total
+        else:
+            self.por_switch.pop(switch, None)
+
+    def pendientes(self, flows):
+        # Flows que aún no están instalados (o cuyo contenido cambió), sin duplicados
+        vistos = set()
+        nuevos = []
+        for flow in flows:
+            if flow['name'] in vistos:
+                continue
+            vistos.add(flow['name'])
+            if self.flows.get(flow['name']) != flow:
+                nuevos.append(flow)
+        return nuevos
+
+    def conflictos(self, handler, flows):
+        # Nombres ya usados por otra conexión con un contenido distinto: compartirlos
+        # pisaría sus flows en el switch
+        return [f['name'] for f in flows if self.flows.get(f['name'], f) != f
+                and self.refs.get(f['name'], set()) - {handler}]
+
+    def adquirir(self, handler, flows):
+        conflictos = self.conflictos(handler, flows)
+        if conflictos:
+            raise ValueError(f"Flows con el mismo nombre y distinto contenido: {', '.join(conflictos)}")
+        for flow in flows:
+            anterior = self.flows.get(flow['name'])
+            if anterior is None or anterior['switch'] != flow['switch']:
+                if anterior is not None:
+                    self._contar(anterior['switch'], -1)
+                self._contar(flow['switch'], 1)
+            self.flows[flow['name']] = flow
+            self.refs.setdefault(flow['name'], set()).add(handler)
+
+    def por_liberar(self, handlers, nombres):
+        # Nombres que quedarían sin referencias si se eliminan esas conexiones
+        handlers = set(handlers)
+        return [n for n in dict.fromkeys(nombres) if not (self.refs.get(n, set()) - handlers)]
+
+    def liberar(self, handler, nombres):
+        for nombre in nombres:
+            refs = self.refs.get(nombre)
+            if refs is None:
+                continue
+            refs.discard(handler)
+            if not refs:
+                del self.refs[nombre]
+                flow = self.flows.pop(nombre, None)
+                if flow is not None:
+                    self._contar(flow['switch'], -1)
+
+    def exceso(self, flows):
+        # Entradas que faltarían por switch para instalar esos flows: {dpid: cantidad}
+        nuevos = {}
+        for nombre, switch in {f['name']: f['switch'] for f in flows if f['name'] not in self.flows}.items():
+            switch = str(switch).lower()
+            nuevos[switch] = nuevos.get(switch, 0) + 1
+        exceso = {}
+        for switch, n in nuevos.items():
+            sobra = self.por_switch.get(switch, 0) + n - capacidad_switch(switch)
+            if sobra > 0:
+                exceso[switch] = sobra
+        return exceso
+
+    def reporte(self):
+        referencias = sum(len(r) for r in self.refs.values())
+        return {'instalados': len(self.flows), 'referencias': referencias,
+                'ahorro': referencias - len(self.flows)}
+
+
+tablas_flows = {}
+# Serializa toda alta/baja de conexiones y cambio de las tablas de flows entre el
+# hilo principal y los recolectores (expiración); es reentrante porque las bajas
+# se llaman desde dentro de altas (desalojo) y revocaciones
+lock_flows = threading.RLock()
+
+
+def obtener_tabla_flows(controller_ip):
+    tabla = tablas_flows.get(controller_ip)
+    if tabla is None:
+        tabla = tablas_flows[controller_ip] = TablaFlows()
+    return tabla
+
+
+# Capacidad de las tablas de flows: entradas que esta herramienta puede ocupar en
+# cada switch. Antes de desbordar un switch se desalojan las conexiones menos
+# usadas; las que no tienen tráfico quedan primero en el orden LRU.
+CAPACIDAD_SWITCH = 2000
+# Capacidad propia de algunos switches: {dpid en minúsculas: entradas}
+capacidades_switch = {}
+
+
+def capacidad_switch(dpid):
+    return capacidades_switch.get(str(dpid).lower(), CAPACIDAD_SWITCH)
+
+
+def configurar_capacidades(valores):
+    # valores: 'N' (todos los switches) o 'DPID=N'
+    global CAPACIDAD_SWITCH
+    for valor in valores:
+        dpid, _, entradas = valor.rpartition('=')
+        if dpid:
+            capacidades_switch[dpid.strip().lower()] = int(entradas)
+        else:
+            CAPACIDAD_SWITCH = int(entradas)
+
+
+def elegir_desalojo(controller_ip, exceso, proteger=()):
+    # Conexiones a desalojar, de la menos a la más usada, hasta cubrir el exceso.
+    # Devuelve (handlers, exceso que queda sin cubrir).
+    tabla = obtener_tabla_flows(controller_ip)
+    restante = dict(exceso)
+    victimas = []
+    liberados = set()
+    for handler in conexiones.menos_usadas():
+        if not restante:
+            break
+        c = conexiones.get(handler)
+        if handler in proteger or c is None or (c.controller or 'localhost') != controller_ip:
+            continue
+        # Los flows compartidos con conexiones que se quedan no liberan espacio
+        nuevos = [n for n in tabla.por_liberar(victimas + [handler], c.flows) if n not in liberados]
+        switches = [str(tabla.flows[n]['switch']).lower() for n in nuevos if n in tabla.flows]
+        if not any(switch in restante for switch in switches):
+            continue
+        victimas.append(handler)
+        liberados.update(nuevos)
+        for switch in switches:
+            if switch in restante:
+                restante[switch] -= 1
+                if restante[switch] <= 0:
+                    del restante[switch]
+    return victimas, restante
+
+
+def asegurar_capacidad(controller_ip, flows, proteger=(), parcial=False):
+    # Hace lugar para los flows a instalar. Sin 'parcial' solo se desaloja si con
+    # eso alcanza. Devuelve (desalojadas, exceso que queda).
+    tabla = obtener_tabla_flows(controller_ip)
+    exceso = tabla.exceso(flows)
+    if exceso and any(temporizada(c) for c in conexiones.values()):
+        # Primero se descartan las conexiones cuyos flows ya vencieron en el switch
+        expirar_conexiones(controller_ip)
+        exceso = tabla.exceso(flows)
+    if not exceso:
+        return [], {}
+    victimas, restante = elegir_desalojo(controller_ip, exceso, proteger)
+    if not victimas or (restante and not parcial):
+        return [], exceso
+    with metricas.fase('desalojo'):
+        resultado = eliminar_conexiones(victimas)
+    desalojadas = [h for h, r in resultado.items() if r['ok']]
+    metricas.incrementar('conexiones_desalojadas_total', valor=len(desalojadas))
+    return desalojadas, tabla.exceso(flows)
+
+
+def texto_exceso(exceso):
+    detalle = ', '.join(f"{switch} (faltan {n})" for switch, n in sorted(exceso.items()))
+    return f"Tabla de flows llena en: {detalle}"
+
+
+def reporte_ocupacion():
+    filas = []
+    for controller_ip, tabla in tablas_flows.items():
+        for switch, n in sorted(tabla.por_switch.items()):
+            capacidad = capacidad_switch(switch)
+            filas.append({'controlador': controller_ip, 'switch': switch, 'flows': n, 'capacidad': capacidad,
+                          'ocupacion': n / capacidad if capacidad else 1.0})
+    return filas
+
+
+def ocupacion_menu():
+    filas = reporte_ocupacion()
+    if not filas:
+        print("No hay flows instalados por esta herramienta.")
+        return
+    for f in filas:
+        aviso = " | LLENO" if f['flows'] >= f['capacidad'] else ""
+        print(f"Controlador {f['controlador']} | Switch {f['switch']} | {f['flows']}/{f['capacidad']} flows "
+              f"({f['ocupacion'] * 100:.1f}%){aviso}")
+    print(f"Conexiones desalojadas: {metricas.contadores.get(('conexiones_desalojadas_total', ()), 0)} "
+          f"| expiradas: {metricas.contadores.get(('conexiones_expiradas_total', ()), 0)}")
+
+
+def registrar_conexion(handler, cod_alumno, nombre_servidor, nombre_servicio, controller_ip, ruta, datos_conexion):
+    # Se guarda la ruta y los datos de la conexión para poder reconstruir sus flows
+    flows = construir_flows(ruta, datos_conexion)
+    with lock_flows:
+        tabla = obtener_tabla_flows(controller_ip)
+        anterior = conexiones.get(handler)
+        if anterior is not None:
+            # Los flows de la versión anterior dejan de estar referenciados por este handler
+            obtener_tabla_flows(anterior.controller or 'localhost').liberar(handler, anterior.flows)
+        tabla.adquirir(handler, flows)
+        conexion = Conexion(handler, cod_alumno, nombre_servidor, nombre_servicio, controller_ip,
+                            [list(hop) for hop in ruta], datos_conexion, [flow['name'] for flow in flows])
+        conexiones[handler] = conexion
+    return conexion
+
+
+def mac_servidor(servidor):
+    if servidor.mac:
+        return servidor.mac
+    if servidor.servicios and servidor.servicios[0].extra:
+        return servidor.servicios[0].extra.get('mac', '')  # Si tienes la MAC del servidor
+    return ''
+
+
+# Timeouts por defecto de los flows IP (segundos, 0 = permanente). Cada servicio
+# puede fijar los suyos con los campos opcionales idle_timeout y hard_timeout.
+IDLE_TIMEOUT = 0
+HARD_TIMEOUT = 0
+
+
+def timeouts_servicio(servicio):
+    extra = servicio.extra or {}
+    timeouts = {}
+    for campo, defecto in (('idle_timeout', IDLE_TIMEOUT), ('hard_timeout', HARD_TIMEOUT)):
+        valor = int(extra.get(campo, defecto) or 0)
+        if valor:
+            timeouts[campo] = valor
+    return timeouts
+
+
+def temporizada(conexion):
+    datos = conexion.datos_conexion or {}
+    return bool(datos.get('idle_timeout') or datos.get('hard_timeout'))
+
+
+# Código de cada error: el modo lote lo emite junto al mensaje y la API lo
+# traduce a un status HTTP
+class ErrorConexion(Exception):
+    def __init__(self, mensaje, codigo='invalido'):
+        super().__init__(mensaje)
+        self.codigo = codigo
 
 
-def crear_conexion():
-    if not hasattr(listar_alumnos, 'data'):
-        print("Primero importe los datos con la opción 1 del menú principal.")
-        return
-    data = listar_alumnos.data
-    cod_alumno = input("Código del alumno: ").strip()
-    nombre_servidor = input("Nombre del servidor: ").strip()
-    nombre_servicio = input("Nombre del servicio: ").strip()
-    controller_ip = input("IP del controlador Floodlight (default: localhost): ").strip() or 'localhost'
-    # Buscar alumno
-    alumno = next((a for a in data.get('alumnos', []) if str(a['codigo']) == cod_alumno), None)
+def codigo_error(error):
+    if isinstance(error, ErrorConexion):
+        return error.codigo
+    if isinstance(error, FileNotFoundError):
+        return 'no_encontrado'
+    if isinstance(error, (requests.RequestException, ErrorHTTPAsync, asyncio.TimeoutError, ConnectionError)):
+        return 'controlador'
+    if isinstance(error, (KeyError, ValueError, TypeError)):
+        return 'invalido'
+    return 'error'
+
+
+def validar_conexion(cod_alumno, nombre_servidor, nombre_servicio):
+    with metricas.fase('busqueda'):
+        alumno = almacen.buscar_alumno(cod_alumno)
+        servidor = almacen.buscar_servidor(nombre_servidor)
+        servicio = almacen.buscar_servicio(nombre_servidor, nombre_servicio)
     if not alumno:
-        print("Alumno no encontrado.")
-        return
-    # Buscar servidor
-    servidor = next((s for s in data.get('servidores', []) if s['nombre'] == nombre_servidor), None)
+        raise ErrorConexion("Alumno no encontrado.", 'no_encontrado')
     if not servidor:
-        print("Servidor no encontrado.")
-        return
-    # Buscar servicio
-    servicio = next((srv for srv in servidor.get('servicios', []) if srv['nombre'] == nombre_servicio), None)
+        raise ErrorConexion("Servidor no encontrado.", 'no_encontrado')
     if not servicio:
-        print("Servicio no encontrado en el servidor.")
-        return    # Validar políticas
-    autorizado = False
-    for curso in data.get('cursos', []):
-        if curso['estado'] == 'DICTANDO' and cod_alumno in [str(c) for c in curso.get('alumnos', [])]:
-            for srv in curso.get('servidores', []):
-                if srv['nombre'] == nombre_servidor and nombre_servicio in srv.get('servicios_permitidos', []):
-                    autorizado = True
+        raise ErrorConexion("Servicio no encontrado en el servidor.", 'no_encontrado')
+    # Validar políticas
+    with metricas.fase('politica'):
+        autorizado = almacen.esta_autorizado(cod_alumno, nombre_servidor, nombre_servicio)
     if not autorizado:
-        print("El alumno NO está autorizado para acceder a ese servicio en ese servidor.")
-        return
+        metricas.incrementar('conexiones_rechazadas_total')
+        raise ErrorConexion("El alumno NO está autorizado para acceder a ese servicio en ese servidor.", 'no_autorizado')
+    return alumno, servidor, servicio
+
+
+# Con este nombre de servidor se elige la réplica autorizada menos cargada
+SERVIDOR_AUTOMATICO = '*'
+
+
+def replicas_servicio(cod_alumno, nombre_servicio):
+    # Servidores que ofrecen el servicio y a los que el alumno está autorizado
+    return [nombre for nombre in almacen.servidores_por_nombre
+            if almacen.esta_autorizado(cod_alumno, nombre, nombre_servicio)]
+
+
+def elegir_replica(cod_alumno, nombre_servicio, controller_ip='localhost', asignadas=None):
+    # asignadas: conexiones ya decididas por servidor que aún no están registradas
+    candidatos = replicas_servicio(cod_alumno, nombre_servicio)
+    if not candidatos:
+        metricas.incrementar('conexiones_rechazadas_total')
+        raise ErrorConexion("El alumno NO está autorizado para acceder a ese servicio en ningún servidor.",
+                          'no_autorizado')
+    # Si el alumno ya tiene una conexión a ese servicio se mantiene la misma réplica
+    for handler in conexiones.handlers_de('alumno', cod_alumno):
+        c = conexiones.get(handler)
+        if c is not None and c.servicio == nombre_servicio and c.servidor in candidatos:
+            return c.servidor
+    if len(candidatos) == 1:
+        return candidatos[0]
+    monitor = obtener_monitor_puertos(controller_ip)
+    cargas = {}
+    for nombre in candidatos:
+        mac = mac_servidor(almacen.buscar_servidor(nombre))
+        try:
+            dpid, puerto = get_attachment_point(controller_ip, mac) if mac else (None, None)
+            if not dpid or not puerto:
+                # Sin punto de conexión la réplica no es alcanzable
+                continue
+            tasa = monitor.tasa(dpid, puerto)
+        except requests.RequestException:
+            # Sin estadísticas del controlador se decide solo por conexiones
+            tasa = 0.0
+        n = len(conexiones.handlers_de('servidor', nombre)) + (asignadas or {}).get(nombre, 0)
+        cargas[nombre] = (n, tasa)
+    if not cargas:
+        return candidatos[0]
+    max_conexiones = max(n for n, _ in cargas.values()) or 1
+    max_tasa = max(t for _, t in cargas.values()) or 1.0
+    # Conexiones y tráfico normalizados pesan lo mismo; el empate lo decide el número de conexiones
+    return min(cargas, key=lambda nombre: (cargas[nombre][0] / max_conexiones + cargas[nombre][1] / max_tasa,
+                                           cargas[nombre][0], nombre))
+
+
+def conectar(cod_alumno, nombre_servidor, nombre_servicio, controller_ip='localhost', ip_src=None):
+    # Crea la conexión sin interacción; devuelve (conexión, reporte de flows)
+    with metricas.fase('total'), lock_flows:
+        try:
+            return _conectar(cod_alumno, nombre_servidor, nombre_servicio, controller_ip, ip_src)
+        except requests.RequestException as e:
+            raise ErrorConexion(f"Error de comunicación con el controlador: {e}", 'controlador') from e
+
+
+def _conectar(cod_alumno, nombre_servidor, nombre_servicio, controller_ip, ip_src):
+    if nombre_servidor == SERVIDOR_AUTOMATICO:
+        with metricas.fase('seleccion_replica'):
+            nombre_servidor = elegir_replica(cod_alumno, nombre_servicio, controller_ip)
+    alumno, servidor, servicio = validar_conexion(cod_alumno, nombre_servidor, nombre_servicio)
     handler = f"{cod_alumno}-{nombre_servidor}-{nombre_servicio}"
-    conexiones.append({'handler': handler, 'alumno': cod_alumno, 'servidor': nombre_servidor, 'servicio': nombre_servicio})
-    print(f"Conexión creada. Handler: {handler}")
+    # Igual que en la provisión masiva: una conexión existente no se vuelve a crear
+    if handler in conexiones:
+        raise ErrorConexion("La conexión ya existe.", 'existe')
     # Obtener MAC/IP origen y destino
-    mac_src = alumno['mac']
-    ip_src = input("IP del alumno (host origen): ").strip()
-    mac_dst = servidor['servicios'][0].get('mac', '')  # Si tienes la MAC del servidor
-    ip_dst = servidor['ip']
-    puerto_l4 = servicio['puerto']
-    protocolo = servicio['protocolo']
+    mac_src = alumno.mac
+    ip_src = ip_src or obtener_cache_dispositivos(controller_ip).buscar_ip(mac_src)
+    mac_dst = mac_servidor(servidor)
+    ip_dst = servidor.ip
+    puerto_l4 = servicio.puerto
+    protocolo = servicio.protocolo
     # Obtener punto de conexión (DPID y puerto) del alumno y servidor
-    src_dpid, src_port = get_attachment_point(controller_ip, mac_src)
-    dst_dpid, dst_port = get_attachment_point(controller_ip, mac_dst) if mac_dst else (None, None)
-    if not src_dpid or not src_port or not dst_dpid or not dst_port:
-        print("No se pudo obtener el punto de conexión de origen o destino. Verifica las MACs e IPs.")
-        return
+    with metricas.fase('attachment_point'):
+        src_dpid, src_port = get_attachment_point(controller_ip, mac_src)
+        dst_dpid, dst_port = get_attachment_point(controller_ip, mac_dst) if mac_dst else (None, None)
+    if not src_dpid or not src_port or not dst_dpid or not dst_port or not ip_src:
+        raise ErrorConexion("No se pudo obtener el punto de conexión de origen o destino. Verifica las MACs e IPs.")
     # Obtener ruta
-    ruta = get_route(controller_ip, src_dpid, src_port, dst_dpid, dst_port)
+    with metricas.fase('ruta'):
+        ruta = get_route(controller_ip, src_dpid, src_port, dst_dpid, dst_port)
     if not ruta:
-        print("No se pudo calcular la ruta entre el alumno y el servidor.")
-        return
+        raise ErrorConexion("No se pudo calcular la ruta entre el alumno y el servidor.")
     datos_conexion = {
         'mac_src': mac_src,
         'mac_dst': mac_dst,
         'ip_src': ip_src,
         'ip_dst': ip_dst,
         'puerto_l4': puerto_l4,
-        'protocolo': protocolo
+        'protocolo': protocolo,
+        **timeouts_servicio(servicio)
     }
-    build_route(ruta, datos_conexion, controller_ip)
+    # Solo se envían los flows que no comparte ya otra conexión
+    tabla = obtener_tabla_flows(controller_ip)
+    flows_ruta = construir_flows(ruta, datos_conexion)
+    conflictos = tabla.conflictos(handler, flows_ruta)
+    if conflictos:
+        raise ErrorConexion(f"Los flows {', '.join(conflictos)} ya los usa otra conexión con distinto contenido.",
+                            'conflicto')
+    with metricas.fase('capacidad'):
+        _, exceso = asegurar_capacidad(controller_ip, tabla.pendientes(flows_ruta), {handler})
+    if exceso:
+        metricas.incrementar('conexiones_rechazadas_capacidad_total')
+        raise ErrorConexion(texto_exceso(exceso), 'capacidad')
+    flows = tabla.pendientes(flows_ruta)
+    with metricas.fase('push_flows'):
+        ok, reporte, reversion = instalar_ruta(controller_ip, flows, tabla)
+    if not ok:
+        raise ErrorConexion(error_instalacion(reporte, reversion), 'controlador')
+    with metricas.fase('registro'):
+        conexion = registrar_conexion(handler, cod_alumno, nombre_servidor, nombre_servicio, controller_ip, ruta,
+                                      datos_conexion)
+    metricas.incrementar('conexiones_creadas_total')
+    metricas.incrementar('flows_enviados_total', valor=len(flows))
+    return conexion, reporte
+
+
+def crear_conexion():
+    if almacen is None:
+        print("Primero importe los datos con la opción 1 del menú principal.")
+        return
+    cod_alumno = input("Código del alumno: ").strip()
+    nombre_servidor = input(f"Nombre del servidor ('{SERVIDOR_AUTOMATICO}' = réplica menos cargada): ").strip()
+    nombre_servicio = input("Nombre del servicio: ").strip()
+    controller_ip = input("IP del controlador Floodlight (default: localhost): ").strip() or 'localhost'
+    try:
+        if nombre_servidor == SERVIDOR_AUTOMATICO:
+            if not replicas_servicio(cod_alumno, nombre_servicio):
+                raise ErrorConexion("El alumno NO está autorizado para acceder a ese servicio en ningún servidor.",
+                          'no_autorizado')
+        else:
+            validar_conexion(cod_alumno, nombre_servidor, nombre_servicio)
+        ip_src = input("IP del alumno (host origen): ").strip()
+        conexion, reporte = conectar(cod_alumno, nombre_servidor, nombre_servicio, controller_ip, ip_src)
+    except ErrorConexion as e:
+        print(e)
+        return
+    print(f"Conexión creada. Handler: {conexion.handler}")
+    imprimir_reporte_flows(reporte)
+    obtener_recolector(controller_ip, iniciar=True)
+
+
+# Estadísticas de tráfico por conexión. Un hilo por controlador descarga los
+# contadores de todos los switches en una sola petición por intervalo y los asocia
+# a cada conexión por la firma (switch + match) de sus flows del primer salto.
+INTERVALO_TRAFICO = 10.0
+# Muestras por conexión para las tasas móviles (memoria acotada)
+VENTANA_TRAFICO = 6
+# Segundos sin bytes nuevos para considerar inactiva una conexión
+UMBRAL_INACTIVIDAD = 60.0
+CAMPOS_FIRMA = ('in_port', 'ipv4_src', 'ipv4_dst', 'tcp_src', 'tcp_dst', 'udp_src', 'udp_dst')
+
+
+def firma_flow(switch, match):
+    campos = []
+    for campo in CAMPOS_FIRMA:
+        valor = match.get(campo)
+        if valor is None:
+            continue
+        valor = str(valor)
+        if campo != 'ipv4_src' and campo != 'ipv4_dst':
+            valor = valor_normalizado(valor)
+        campos.append((campo, valor))
+    return str(switch).lower(), tuple(campos)
+
+
+class RecolectorTrafico:
+    def __init__(self, controller_ip, intervalo=INTERVALO_TRAFICO, ventana=VENTANA_TRAFICO):
+        self.controller_ip = controller_ip
+        self.intervalo = intervalo
+        # handler -> deque de (instante, bytes, paquetes)
+        self.muestras = {}
+        self.ventana = ventana
+        # handler -> instante en que se vio el último byte nuevo (o la primera muestra)
+        self.ultima_actividad = {}
+        self.lock = threading.Lock()
+        self.parar = threading.Event()
+        self.hilo = None
+        # El daemon expira las conexiones desde su propia cola de escritura
+        self.expirar = True
+
+    def iniciar(self):
+        if self.hilo is None or not self.hilo.is_alive():
+            self.parar.clear()
+            self.hilo = threading.Thread(target=self._bucle, daemon=True, name=f'trafico-{self.controller_ip}')
+            self.hilo.start()
+        return self
+
+    def detener(self):
+        self.parar.set()
+        if self.hilo is not None:
+            self.hilo.join(timeout=self.intervalo)
+
+    def _bucle(self):
+        while not self.parar.is_set():
+            try:
+                self.muestrear()
+            except (requests.RequestException, ValueError):
+                metricas.incrementar('trafico_muestras_fallidas_total')
+            try:
+                if self.expirar and any(temporizada(c) for c in conexiones.values()):
+                    expirar_conexiones(self.controller_ip)
+            except Exception:
+                # Un error no debe terminar el hilo: se reintenta en el próximo intervalo
+                metricas.incrementar('expiracion_fallida_total')
+            self.parar.wait(self.intervalo)
+
+    def firmas(self):
+        # Solo el primer salto de cada sentido: así cada paquete se cuenta una vez
+        firmas = {}
+        for c in conexiones.values():
+            if (c.controller or 'localhost') != self.controller_ip or not c.ruta or not c.datos_conexion:
+                continue
+            for flow in construir_flows(c.ruta, c.datos_conexion):
+                if flow['name'].startswith('flow_') and flow['name'].endswith(('_0_fwd', '_0_rev')):
+                    firmas.setdefault(firma_flow(flow['switch'], flow), []).append(c.handler)
+        return firmas
+
+    def muestrear(self):
+        cuerpos = consultar_controlador(self.controller_ip, '/wm/core/switch/all/flow/json')
+        if not cuerpos:
+            return False
+        firmas = self.firmas()
+        totales = {handler: [0, 0] for handlers in firmas.values() for handler in handlers}
+        for dpid, datos in fusionar_por_dpid(cuerpos).items():
+            flows = datos.get('flows', []) if isinstance(datos, dict) else datos or []
+            for flow in flows:
+                handlers = firmas.get(firma_flow(dpid, flow.get('match') or {}))
+                if not handlers:
+                    continue
+                octetos = int(flow.get('byte_count', flow.get('byteCount', 0)))
+                paquetes = int(flow.get('packet_count', flow.get('packetCount', 0)))
+                for handler in handlers:
+                    totales[handler][0] += octetos
+                    totales[handler][1] += paquetes
+        ahora = time.monotonic()
+        activas = []
+        with self.lock:
+            for handler, (octetos, paquetes) in totales.items():
+                serie = self.muestras.get(handler)
+                if serie is None:
+                    serie = self.muestras[handler] = deque(maxlen=self.ventana)
+                if serie and octetos > serie[-1][1]:
+                    activas.append(handler)
+                if not serie or octetos > serie[-1][1] or handler not in self.ultima_actividad:
+                    self.ultima_actividad[handler] = ahora
+                serie.append((ahora, octetos, paquetes))
+            # Las conexiones borradas dejan de ocupar memoria
+            for handler in [h for h in self.muestras if h not in totales]:
+                del self.muestras[handler]
+                self.ultima_actividad.pop(handler, None)
+        # Las conexiones con tráfico pasan al final del orden de desalojo
+        conexiones.tocar(activas)
+        metricas.incrementar('trafico_muestras_total')
+        return True
+
+    def estadisticas(self, handler):
+        with self.lock:
+            serie = self.muestras.get(handler)
+            if not serie:
+                return None
+            t0, b0, p0 = serie[0]
+            t1, b1, p1 = serie[-1]
+            segundos = t1 - t0
+            return {
+                'bytes': b1,
+                'paquetes': p1,
+                'bytes_por_s': (b1 - b0) / segundos if segundos > 0 else 0.0,
+                'paquetes_por_s': (p1 - p0) / segundos if segundos > 0 else 0.0,
+                'inactiva_s': time.monotonic() - self.ultima_actividad.get(handler, t1),
+            }
+
+    def top(self, n=10):
+        with self.lock:
+            handlers = list(self.muestras)
+        stats = [(h, self.estadisticas(h)) for h in handlers]
+        stats = [(h, e) for h, e in stats if e is not None]
+        return sorted(stats, key=lambda x: x[1]['bytes_por_s'], reverse=True)[:n]
+
+    def inactivas(self, umbral=None):
+        umbral = UMBRAL_INACTIVIDAD if umbral is None else umbral
+        with self.lock:
+            handlers = list(self.muestras)
+        stats = [(h, self.estadisticas(h)) for h in handlers]
+        return [(h, e) for h, e in stats if e is not None and e['inactiva_s'] >= umbral]
+
+
+recolectores = {}
+
+
+def obtener_recolector(controller_ip, iniciar=False, expirar=None):
+    # expirar se fija antes de arrancar el hilo
+    with _lock_sesiones:
+        recolector = recolectores.get(controller_ip)
+        if recolector is None:
+            recolector = recolectores[controller_ip] = RecolectorTrafico(controller_ip)
+        if expirar is not None:
+            recolector.expirar = expirar
+    return recolector.iniciar() if iniciar else recolector
+
+
+def estadisticas_conexion(conexion):
+    recolector = recolectores.get(conexion.controller or 'localhost')
+    return recolector.estadisticas(conexion.handler) if recolector is not None else None
+
+
+def texto_trafico(e):
+    if e is None:
+        return "sin datos"
+    return f"{e['bytes']} B, {e['bytes_por_s']:.1f} B/s, {e['paquetes_por_s']:.1f} pkt/s"
 
 
 def listar_conexiones():
     if not conexiones:
         print("No hay conexiones manuales creadas.")
         return
-    print("Conexiones manuales:")
-    for c in conexiones:
-        print(f"Handler: {c['handler']} | Alumno: {c['alumno']} | Servidor: {c['servidor']} | Servicio: {c['servicio']}")
+    alumno = input("Filtrar por código de alumno (vacío = todos): ").strip()
+    servidor = input("Filtrar por servidor (vacío = todos): ").strip()
+    servicio = input("Filtrar por servicio (vacío = todos): ").strip()
+    orden = input("Reporte (vacío = por creación, 'top' = más tráfico, 'inactivas' = sin tráfico): ").strip().lower()
+    pagina = input("Página (default: 1): ").strip()
+    pagina = int(pagina) if pagina.isdigit() else 1
+    if orden in ('top', 'inactivas'):
+        # Se ordena/filtra todo el resultado del filtro y luego se pagina
+        todas, _ = conexiones.consultar(alumno, servidor, servicio, 1, max(1, len(conexiones)))
+        stats = [(c, estadisticas_conexion(c)) for c in todas]
+        if orden == 'top':
+            stats.sort(key=lambda x: x[1]['bytes_por_s'] if x[1] else -1.0, reverse=True)
+        else:
+            stats = [(c, e) for c, e in stats if e is not None and e['inactiva_s'] >= UMBRAL_INACTIVIDAD]
+        total = len(stats)
+        inicio = (max(pagina, 1) - 1) * 20
+        lista = stats[inicio:inicio + 20]
+    else:
+        lista, total = conexiones.consultar(alumno, servidor, servicio, pagina)
+        lista = [(c, estadisticas_conexion(c)) for c in lista]
+    paginas = max(1, -(-total // 20))
+    print(f"Conexiones manuales (página {pagina}/{paginas}, total {total}):")
+    for c, e in lista:
+        print(f"Handler: {c.handler} | Alumno: {c.alumno} | Servidor: {c.servidor} | Servicio: {c.servicio} | "
+              f"Tráfico: {texto_trafico(e)}")
+    for controller_ip, tabla in tablas_flows.items():
+        r = tabla.reporte()
+        print(f"Controlador {controller_ip}: {r['instalados']} flows instalados para {r['referencias']} usos "
+              f"(ahorro por compartir: {r['ahorro']} flows)")
     print()
 
 
+def eliminar_conexiones(handlers):
+    # Borra los flows de varias conexiones con DELETEs concurrentes por controlador
+    # y confirma con un único listado que ya no estén instalados
+    with lock_flows:
+        return _eliminar_conexiones(handlers)
+
+
+def _eliminar_conexiones(handlers):
+    resultado = {}
+    por_controlador = {}
+    for handler in handlers:
+        c = conexiones.get(handler)
+        if c is None:
+            resultado[handler] = {'ok': False, 'error': 'Conexión no encontrada', 'codigo': 'no_encontrado',
+                                  'pendientes': []}
+            continue
+        por_controlador.setdefault(c.controller or 'localhost', []).append(c)
+
+    async def _eliminar(controller_ip, lista):
+        async with cliente_floodlight_async(controller_ip) as cliente:
+            # Los flows compartidos con conexiones que siguen activas no se borran
+            nombres = obtener_tabla_flows(controller_ip).por_liberar(
+                [c.handler for c in lista], [nombre for c in lista for nombre in c.flows])
+            reporte = await cliente.borrar_flows(nombres)
+            fallidos = {r['name'] for r in reporte if not r['ok']}
+            instalados = flows_instalados(await cliente.listar_flows('all')) if nombres else {}
+            return fallidos, instalados
+
+    for controller_ip, lista in por_controlador.items():
+        tabla = obtener_tabla_flows(controller_ip)
+        try:
+            fallidos, instalados = asyncio.run(_eliminar(controller_ip, lista))
+        except (ErrorHTTPAsync, asyncio.TimeoutError, OSError) as e:
+            for c in lista:
+                resultado[c.handler] = {'ok': False, 'error': str(e) or type(e).__name__, 'codigo': 'controlador',
+                                        'pendientes': c.flows}
+            continue
+        with conexiones.lote():
+            for c in lista:
+                if conexiones.get(c.handler) is not c:
+                    # Ya la dio de baja otra operación
+                    resultado[c.handler] = {'ok': True, 'error': None, 'codigo': None, 'pendientes': []}
+                    continue
+                pendientes = [n for n in c.flows if n in fallidos or (n in instalados and len(tabla.refs.get(n, ())) <= 1)]
+                if not pendientes:
+                    tabla.liberar(c.handler, c.flows)
+                    del conexiones[c.handler]
+                resultado[c.handler] = {'ok': not pendientes, 'error': None,
+                                        'codigo': 'controlador' if pendientes else None, 'pendientes': pendientes}
+    return resultado
+
+
+def revocar_no_autorizadas(todas=False):
+    # Tras un cambio de políticas borra, en un solo lote concurrente, los flows de
+    # las conexiones que ya no están autorizadas. Solo se revisan las conexiones
+    # de los alumnos que perdieron alguna autorización (o todas, tras importar).
+    afectados = almacen.tomar_revocados() if almacen is not None else set()
+    if todas:
+        candidatas = list(conexiones)
+    else:
+        candidatas = [h for cod in afectados for h in conexiones.handlers_de('alumno', cod)]
+    revocar = []
+    for handler in candidatas:
+        c = conexiones.get(handler)
+        if c is not None and not conexion_autorizada(c):
+            revocar.append(handler)
+    if not revocar:
+        return {}
+    try:
+        with metricas.fase('revocacion'):
+            resultado = eliminar_conexiones(revocar)
+    except Exception:
+        pendientes_revocacion(revocar)
+        raise
+    # Las que no se pudieron revocar se reintentan con el próximo cambio de políticas
+    pendientes_revocacion([h for h, r in resultado.items() if not r['ok']])
+    metricas.incrementar('conexiones_revocadas_total', valor=sum(1 for r in resultado.values() if r['ok']))
+    return resultado
+
+
+def pendientes_revocacion(handlers):
+    if almacen is None:
+        return
+    for handler in handlers:
+        c = conexiones.get(handler)
+        if c is not None:
+            almacen.revocados.add(str(c.alumno))
+
+
+def conexion_autorizada(conexion):
+    return almacen is None or almacen.esta_autorizado(conexion.alumno, conexion.servidor, conexion.servicio)
+
+
+def imprimir_revocadas(resultado):
+    revocadas = [h for h, r in resultado.items() if r['ok']]
+    if revocadas:
+        print(f"Se revocaron {len(revocadas)} conexiones sin autorización: {', '.join(revocadas)}")
+    for handler, r in resultado.items():
+        if not r['ok']:
+            print(f"No se pudo revocar {handler}: {r['error'] or 'flows aún instalados: ' + ', '.join(r['pendientes'])}")
+
+
 def borrar_conexion():
-    handler = input("Handler de la conexión a borrar: ").strip()
-    for i, c in enumerate(conexiones):
-        if c['handler'] == handler:
-            conexiones.pop(i)
-            print("Conexión eliminada.")
-            return
-    print("Conexión no encontrada.")
+    entrada = input("Handler(s) de la conexión a borrar (separados por coma): ").strip()
+    handlers = [h.strip() for h in entrada.split(',') if h.strip()]
+    for handler, r in eliminar_conexiones(handlers).items():
+        if r['ok']:
+            print(f"Conexión {handler} eliminada.")
+        elif r['codigo'] == 'no_encontrado':
+            print(f"Conexión {handler} no encontrada.")
+        else:
+            print(f"No se pudo eliminar {handler}: {r['error'] or 'flows aún instalados: ' + ', '.join(r['pendientes'])}")
+
+
+# Provisión masiva de conexiones por curso
+TAM_LOTE_FLOWS = 256
+
+
+def planificar_conexiones(codigo_curso=None):
+    # Devuelve las tuplas (alumno, servidor, servicio) autorizadas, sin duplicados
+    if codigo_curso is None:
+        return sorted(almacen.autorizaciones)
+    curso = almacen.buscar_curso(codigo_curso)
+    if curso is None or curso.estado != 'DICTANDO':
+        return []
+    codigo = str(curso.codigo)
+    return sorted((cod, srv, svc) for cod in almacen.alumnos_curso[codigo]
+                  for srv, svc in almacen.permisos_curso[codigo])
+
+
+def provisionar_masivo(planes, controller_ip='localhost', tam_lote=TAM_LOTE_FLOWS, max_hilos=MAX_HILOS_FLOWS,
+                       asincrono=False):
+    # planes: tuplas (alumno, servidor, servicio) o (alumno, servidor, servicio, ip_src)
+    inicio = time.perf_counter()
+    try:
+        with lock_flows:
+            return _provisionar_masivo(planes, controller_ip, tam_lote, max_hilos, asincrono, inicio)
+    except requests.RequestException as e:
+        # Falló la consulta de dispositivos o rutas: todavía no se envió ningún flow
+        segundos = time.perf_counter() - inicio
+        error = f"Error de comunicación con el controlador: {e}"
+        handlers = dict.fromkeys(f"{p[0]}-{p[1]}-{p[2]}" for p in planes)
+        return {'planificadas': len(planes), 'creadas': 0, 'fallidas': [(h, error, 'controlador') for h in handlers],
+                'omitidas': [], 'flows': 0, 'segundos': segundos, 'conexiones_por_s': 0.0, 'flows_por_s': 0.0}
+
+
+def _provisionar_masivo(planes, controller_ip, tam_lote, max_hilos, asincrono, inicio):
+    fallidas = []
+    omitidas = []
+    vistos = set()
+    existentes = conexiones
+    dispositivos = obtener_cache_dispositivos(controller_ip)
+    with metricas.fase('masivo_dispositivos'):
+        dispositivos.refrescar()
+    # Una sola resolución de punto de conexión por MAC
+    puntos = {}
+    candidatas = []
+    for plan in planes:
+        cod_alumno, nombre_servidor, nombre_servicio = plan[:3]
+        handler = f"{cod_alumno}-{nombre_servidor}-{nombre_servicio}"
+        if handler in existentes:
+            omitidas.append(handler)
+            continue
+        if handler in vistos:
+            continue
+        vistos.add(handler)
+        alumno = almacen.buscar_alumno(cod_alumno)
+        servidor = almacen.buscar_servidor(nombre_servidor)
+        servicio = almacen.buscar_servicio(nombre_servidor, nombre_servicio)
+        if not alumno or not servidor or not servicio:
+            fallidas.append((handler, "Alumno, servidor o servicio no encontrado", 'no_encontrado'))
+            continue
+        mac_src, mac_dst = alumno.mac, mac_servidor(servidor)
+        for mac in (mac_src, mac_dst):
+            if mac and mac.lower() not in puntos:
+                puntos[mac.lower()] = dispositivos.buscar(mac)
+        src = puntos.get(mac_src.lower(), (None, None))
+        dst = puntos.get(mac_dst.lower(), (None, None)) if mac_dst else (None, None)
+        ip_src = (plan[3] if len(plan) > 3 else None) or dispositivos.buscar_ip(mac_src)
+        if not all(src) or not all(dst) or not ip_src:
+            fallidas.append((handler, "No se pudo obtener el punto de conexión o la IP", 'invalido'))
+            continue
+        datos_conexion = {
+            'mac_src': mac_src,
+            'mac_dst': mac_dst,
+            'ip_src': ip_src,
+            'ip_dst': servidor.ip,
+            'puerto_l4': servicio.puerto,
+            'protocolo': servicio.protocolo,
+            **timeouts_servicio(servicio)
+        }
+        candidatas.append((handler, cod_alumno, nombre_servidor, nombre_servicio, src + dst, datos_conexion))
+    # Una sola consulta de ruta por par de puntos de conexión, en paralelo
+    claves_ruta = list({c[4] for c in candidatas})
+    rutas = {}
+    if claves_ruta:
+        with metricas.fase('masivo_rutas'), \
+                ThreadPoolExecutor(max_workers=max(1, min(max_hilos, len(claves_ruta)))) as pool:
+            for clave, ruta in zip(claves_ruta, pool.map(lambda k: get_route(controller_ip, *k), claves_ruta)):
+                rutas[clave] = ruta
+    # Todos los flows se construyen antes de enviar nada; los compartidos se envían una vez
+    tabla = obtener_tabla_flows(controller_ip)
+    por_candidata = []
+    # Contenido de cada nombre de flow en el lote, para no mezclar flows distintos
+    contenidos = {}
+    for handler, cod_alumno, nombre_servidor, nombre_servicio, clave, datos_conexion in candidatas:
+        ruta = rutas.get(clave)
+        if not ruta:
+            fallidas.append((handler, "No se pudo calcular la ruta", 'invalido'))
+            continue
+        flows_conexion = construir_flows(ruta, datos_conexion)
+        conflictos = tabla.conflictos(handler, flows_conexion) + \
+            [f['name'] for f in flows_conexion if contenidos.get(f['name'], f) != f]
+        if conflictos:
+            fallidas.append((handler, f"Los flows {', '.join(conflictos)} ya los usa otra conexión con distinto contenido.",
+                             'conflicto'))
+            continue
+        for flow in flows_conexion:
+            contenidos.setdefault(flow['name'], flow)
+        por_candidata.append((handler, flows_conexion))
+    # Se desaloja lo necesario para el lote; las conexiones que aun así no caben fallan
+    with metricas.fase('masivo_capacidad'):
+        _, exceso = asegurar_capacidad(controller_ip, [f for _, fs in por_candidata for f in tabla.pendientes(fs)],
+                                       set(omitidas), parcial=True)
+    libres = {switch: capacidad_switch(switch) - tabla.por_switch.get(switch, 0) for switch in exceso}
+    rechazadas = set()
+    flows = []
+    duenos = {}
+    for handler, flows_conexion in por_candidata:
+        pendientes = tabla.pendientes(flows_conexion)
+        if libres:
+            necesarios = {}
+            for flow in pendientes:
+                switch = str(flow['switch']).lower()
+                if flow['name'] not in duenos and switch in libres:
+                    necesarios[switch] = necesarios.get(switch, 0) + 1
+            llenos = {switch: n - libres[switch] for switch, n in necesarios.items() if n > libres[switch]}
+            if llenos:
+                rechazadas.add(handler)
+                fallidas.append((handler, texto_exceso(llenos), 'capacidad'))
+                metricas.incrementar('conexiones_rechazadas_capacidad_total')
+                continue
+            for switch, n in necesarios.items():
+                libres[switch] -= n
+        for flow in pendientes:
+            if flow['name'] not in duenos:
+                flows.append(flow)
+                duenos[flow['name']] = []
+            duenos[flow['name']].append(handler)
+    aceptadas = {handler for handler, _ in por_candidata}
+    reporte = []
+    for i in range(0, len(flows), tam_lote):
+        with metricas.fase('masivo_push_lote'):
+            if asincrono:
+                reporte.extend(push_flows_async(controller_ip, flows[i:i + tam_lote]))
+            else:
+                reporte.extend(push_flows(controller_ip, flows[i:i + tam_lote], max_hilos))
+    errores = {}
+    for r in reporte:
+        if not r['ok']:
+            for handler in duenos[r['name']]:
+                errores.setdefault(handler, r)
+    # Cada conexión es atómica: se revierten los flows enviados que solo usaban conexiones fallidas
+    huerfanos = [r for r in reporte if r['ok'] and all(h in errores for h in duenos[r['name']])]
+    if huerfanos:
+        with metricas.fase('masivo_reversion'):
+            revertir_flows(controller_ip, huerfanos,
+                           {r['name']: tabla.flows[r['name']] for r in huerfanos if r['name'] in tabla.flows}, max_hilos)
+    creadas = 0
+    with conexiones.lote():
+        for handler, cod_alumno, nombre_servidor, nombre_servicio, clave, datos_conexion in candidatas:
+            if handler not in aceptadas or handler in rechazadas:
+                continue
+            if handler in errores:
+                r = errores[handler]
+                fallidas.append((handler, f"Error al insertar flow '{r['name']}': {r['status']} {r['error']}",
+                                 'controlador'))
+                continue
+            registrar_conexion(handler, cod_alumno, nombre_servidor, nombre_servicio, controller_ip, rutas[clave], datos_conexion)
+            creadas += 1
+    segundos = time.perf_counter() - inicio
+    flows_ok = sum(1 for r in reporte if r['ok'] and not r.get('revertido'))
+    return {
+        'planificadas': len(planes),
+        'creadas': creadas,
+        'fallidas': fallidas,
+        'omitidas': omitidas,
+        'flows': flows_ok,
+        'segundos': segundos,
+        'conexiones_por_s': creadas / segundos if segundos else 0.0,
+        'flows_por_s': flows_ok / segundos if segundos else 0.0,
+    }
+
+
+def provisionar_curso():
+    if almacen is None:
+        print("Primero importe los datos con la opción 1 del menú principal.")
+        return
+    codigo = input("Código del curso (vacío = todos los cursos DICTANDO): ").strip()
+    controller_ip = input("IP del controlador Floodlight (default: localhost): ").strip() or 'localhost'
+    planes = planificar_conexiones(codigo or None)
+    if not planes:
+        print("No hay conexiones autorizadas para provisionar.")
+        return
+    resultado = provisionar_masivo(planes, controller_ip)
+    obtener_recolector(controller_ip, iniciar=True)
+    print(f"Conexiones creadas: {resultado['creadas']}/{resultado['planificadas']} "
+          f"| Flows: {resultado['flows']} | {resultado['segundos']:.2f} s "
+          f"| {resultado['conexiones_por_s']:.1f} conexiones/s | {resultado['flows_por_s']:.1f} flows/s")
+    for handler, motivo, _ in resultado['fallidas']:
+        print(f"- {handler}: {motivo}")
 
 
 def listar_alumnos_curso():
-    if not hasattr(listar_alumnos, 'data'):
+    if almacen is None:
         print("Primero importe los datos con la opción 1 del menú principal.")
         return
-    data = listar_alumnos.data
     codigo = input("Ingrese el código del curso: ").strip()
-    curso = next((c for c in data.get('cursos', []) if str(c['codigo']) == codigo), None)
+    curso = almacen.buscar_curso(codigo)
     if not curso:
         print("Curso no encontrado.")
         return
     print(f"Alumnos en el curso {codigo}:")
-    for cod in curso.get('alumnos', []):
-        alumno = next((a for a in data.get('alumnos', []) if str(a['codigo']) == str(cod)), None)
+    for id_alumno in curso.alumnos:
+        alumno = almacen.buscar_alumno(almacen.clave_codigo(id_alumno))
         if alumno:
-            print(f"- {alumno['nombre']} (Código: {alumno['codigo']}, MAC: {alumno['mac']})")
+            print(f"- {alumno.nombre} (Código: {alumno.codigo}, MAC: {alumno.mac})")
     print()
 
 
 def listar_cursos_servicio_servidor():
-    if not hasattr(listar_alumnos, 'data'):
+    if almacen is None:
         print("Primero importe los datos con la opción 1 del menú principal.")
         return
-    data = listar_alumnos.data
     servicio = input("Nombre del servicio (ej: ssh): ").strip()
     servidor = input("Nombre del servidor: ").strip()
     print(f"Cursos con acceso a {servicio} en {servidor}:")
-    for curso in data.get('cursos', []):
-        for srv in curso.get('servidores', []):
-            if srv['nombre'] == servidor and servicio in srv.get('servicios_permitidos', []):
-                print(f"- {curso['codigo']} | {curso['nombre']}")
+    for curso in almacen.cursos_con_acceso(servidor, servicio):
+        print(f"- {curso.codigo} | {curso.nombre}")
     print()
 
 
+def metricas_menu():
+    metricas.imprimir()
+    archivo = input("Archivo para exportar en formato Prometheus (vacío = no exportar): ").strip()
+    if archivo:
+        metricas.exportar_prometheus(archivo)
+        print(f"Métricas exportadas a {archivo}")
+
+
+# Reconciliación del estado deseado de flows contra el staticentrypusher
+PREFIJOS_FLOWS_PROPIOS = ('flow_', 'arp_')
+CAMPOS_NO_COMPARABLES = ('name', 'switch', 'active', 'cookie')
+
+
+def flows_deseados(lista_conexiones):
+    # Las conexiones que perdieron la autorización no se reinstalan
+    deseados = {}
+    for c in lista_conexiones:
+        if not c.ruta or not c.datos_conexion or not conexion_autorizada(c):
+            continue
+        for flow in construir_flows(c.ruta, c.datos_conexion):
+            deseados[flow['name']] = flow
+    return deseados
+
+
+def _aplanar_flow_instalado(entrada):
+    # Floodlight lista los flows con 'match' e 'instructions' anidados; el stub
+    # devuelve el mismo dict enviado. Se llevan ambos formatos a claves planas.
+    plano = {k: v for k, v in entrada.items() if not isinstance(v, dict)}
+    plano.update(entrada.get('match', {}) or {})
+    for campo, campo_listado in (('idle_timeout', 'idleTimeoutSec'), ('hard_timeout', 'hardTimeoutSec')):
+        if campo_listado in entrada:
+            plano.setdefault(campo, entrada[campo_listado])
+    acciones = (entrada.get('instructions', {}) or {}).get('instruction_apply_actions', {})
+    if isinstance(acciones, dict) and 'actions' in acciones:
+        plano['actions'] = acciones['actions']
+    return plano
+
+
+def flows_instalados(listado):
+    # listado: respuesta de /wm/staticentrypusher/list/all/json -> {nombre: (dpid, flow plano)}
+    instalados = {}
+    for dpid, entradas in (listado or {}).items():
+        for entrada in entradas:
+            for nombre, flow in entrada.items():
+                instalados[nombre] = (dpid, _aplanar_flow_instalado(flow))
+    return instalados
+
+
+def valor_normalizado(valor):
+    # Floodlight lista eth_type '0x800' e ip_proto '6' donde se envió '0x0800' y
+    # '0x06': los números se comparan por valor, el resto sin mayúsculas
+    valor = str(valor).strip().lower()
+    try:
+        return str(int(valor, 0))
+    except ValueError:
+        return valor
+
+
+def flow_coincide(deseado, dpid, instalado):
+    if str(deseado['switch']).lower() != str(dpid).lower():
+        return False
+    for clave, valor in deseado.items():
+        if clave in CAMPOS_NO_COMPARABLES or clave not in instalado:
+            continue
+        if valor_normalizado(instalado[clave]) != valor_normalizado(valor):
+            return False
+    return True
+
+
+def diferencia_flows(deseados, instalados):
+    a_instalar = [flow for nombre, flow in deseados.items()
+                  if nombre not in instalados or not flow_coincide(flow, *instalados[nombre])]
+    # Solo se borran flows creados por esta herramienta
+    a_borrar = [nombre for nombre in instalados
+                if nombre not in deseados and nombre.startswith(PREFIJOS_FLOWS_PROPIOS)]
+    return a_instalar, a_borrar
+
+
+def reconciliar_flows(controller_ip, lista_conexiones, aplicar=True):
+    with lock_flows:
+        return _reconciliar_flows(controller_ip, lista_conexiones, aplicar)
+
+
+def _reconciliar_flows(controller_ip, lista_conexiones, aplicar):
+    async def _reconciliar():
+        async with cliente_floodlight_async(controller_ip) as cliente:
+            instalados = flows_instalados(await cliente.listar_flows('all'))
+            # Las conexiones vencidas no se reinstalan: se dan de baja
+            vencidas = set(expiradas(lista_conexiones, instalados))
+            deseados = flows_deseados([c for c in lista_conexiones if c.handler not in vencidas])
+            a_instalar, a_borrar = diferencia_flows(deseados, instalados)
+            resultado = {
+                'deseados': len(deseados),
+                'instalados': len(instalados),
+                'a_instalar': [f['name'] for f in a_instalar],
+                'a_borrar': a_borrar,
+                'expiradas': sorted(vencidas),
+                'revocadas': sorted(c.handler for c in lista_conexiones
+                                    if c.handler not in vencidas and not conexion_autorizada(c)),
+                'errores': [],
+            }
+            if aplicar:
+                reporte = await asyncio.gather(cliente.push_flows(a_instalar), cliente.borrar_flows(a_borrar))
+                resultado['errores'] = [r for r in reporte[0] + reporte[1] if not r['ok']]
+            return resultado
+    resultado = asyncio.run(_reconciliar())
+    if aplicar and resultado['expiradas']:
+        bajas = eliminar_conexiones(resultado['expiradas'])
+        metricas.incrementar('conexiones_expiradas_total', valor=sum(1 for r in bajas.values() if r['ok']))
+    if aplicar and resultado['revocadas']:
+        # Sus flows propios ya se borraron arriba; se completa la revocación pendiente
+        bajas = eliminar_conexiones(resultado['revocadas'])
+        pendientes_revocacion([h for h, r in bajas.items() if not r['ok']])
+        metricas.incrementar('conexiones_revocadas_total', valor=sum(1 for r in bajas.values() if r['ok']))
+    return resultado
+
+
+def expiradas(lista_conexiones, instalados):
+    # Floodlight quita del staticentrypusher las entradas vencidas por idle/hard
+    # timeout: una conexión temporizada sin ninguno de sus flows IP ya expiró
+    return [c.handler for c in lista_conexiones if temporizada(c)
+            and not any(nombre in instalados for nombre in c.flows if nombre.startswith('flow_'))]
+
+
+def expirar_conexiones(controller_ip):
+    # Da de baja las conexiones temporizadas cuyos flows ya vencieron en los switches
+    with lock_flows:
+        return _expirar_conexiones(controller_ip)
+
+
+def _expirar_conexiones(controller_ip):
+    propias = [c for c in conexiones.values() if (c.controller or 'localhost') == controller_ip and temporizada(c)]
+    if not propias:
+        return {}
+
+    async def _listar():
+        async with cliente_floodlight_async(controller_ip) as cliente:
+            return flows_instalados(await cliente.listar_flows('all'))
+
+    vencidas = expiradas(propias, asyncio.run(_listar()))
+    if not vencidas:
+        return {}
+    resultado = eliminar_conexiones(vencidas)
+    metricas.incrementar('conexiones_expiradas_total', valor=sum(1 for r in resultado.values() if r['ok']))
+    return resultado
+
+
+def reconciliar_menu():
+    controller_ip = input("IP del controlador Floodlight (default: localhost): ").strip() or 'localhost'
+    propias = [c for c in conexiones.values() if (c.controller or controller_ip) == controller_ip]
+    try:
+        resultado = reconciliar_flows(controller_ip, propias)
+    except (ErrorHTTPAsync, asyncio.TimeoutError, OSError) as e:
+        print(f"No se pudo reconciliar: {e or type(e).__name__}")
+        return
+    print(f"Flows deseados: {resultado['deseados']} | Instalados: {resultado['instalados']} "
+          f"| Enviados: {len(resultado['a_instalar'])} | Borrados: {len(resultado['a_borrar'])} "
+          f"| Conexiones expiradas: {len(resultado['expiradas'])}")
+    for r in resultado['errores']:
+        print(f"- Error en flow '{r['name']}': {r['status']} {r['error']}")
+
+
+# Modo lote: comandos desde un archivo o stdin, con resultados JSON por línea.
+# Cada línea es un objeto JSON ({"op": "crear_conexion", "alumno": ...}) o una
+# orden con argumentos separados por espacios (se admiten comillas):
+#   crear_conexion 20012482 "Servidor 1" ssh [ip_src]
+# Las altas y bajas de conexiones consecutivas se agrupan en una sola operación
+# contra el controlador.
+ARGUMENTOS_LOTE = {
+    'importar': ('archivo',),
+    'exportar': ('archivo', 'registro'),
+    'agregar_alumno': ('nombre', 'codigo', 'mac'),
+    'borrar_alumno': ('codigo',),
+    'curso_agregar_alumno': ('curso', 'alumno'),
+    'curso_eliminar_alumno': ('curso', 'alumno'),
+    'curso_estado': ('curso', 'estado'),
+    'crear_conexion': ('alumno', 'servidor', 'servicio', 'ip_src'),
+    'borrar_conexion': ('handler',),
+    'listar_conexiones': ('alumno', 'servidor', 'servicio', 'pagina'),
+    'provisionar': ('curso',),
+    'reconciliar': (),
+    'ocupacion': (),
+    'expirar': (),
+}
+
+
+def normalizar_comando(comando):
+    # Los argumentos llegan como texto (o escalares JSON, que se pasan a texto);
+    # cualquier otro tipo se rechaza antes de tocar el almacén
+    if not isinstance(comando, dict) or 'op' not in comando:
+        raise ValueError("Falta el campo 'op'")
+    op = comando['op']
+    if op not in ARGUMENTOS_LOTE:
+        raise ValueError(f"Comando desconocido: {op}")
+    normalizado = {'op': op}
+    for campo in ARGUMENTOS_LOTE[op]:
+        valor = comando.get(campo)
+        if valor is None:
+            continue
+        if isinstance(valor, bool):
+            valor = 'true' if valor else 'false'
+        elif not isinstance(valor, (str, int, float)):
+            raise ValueError(f"Valor inválido para '{campo}' en {op}")
+        normalizado[campo] = str(valor)
+    return normalizado
+
+
+def parsear_comando(linea):
+    linea = linea.strip()
+    if linea.startswith('{'):
+        return normalizar_comando(json.loads(linea))
+    partes = shlex.split(linea)
+    op, valores = partes[0], partes[1:]
+    if op not in ARGUMENTOS_LOTE:
+        raise ValueError(f"Comando desconocido: {op}")
+    nombres = ARGUMENTOS_LOTE[op]
+    if len(valores) > len(nombres):
+        raise ValueError(f"Demasiados argumentos para {op}")
+    comando = dict(zip(nombres, valores))
+    comando['op'] = op
+    return comando
+
+
+class EjecutorLote:
+    def __init__(self, controller_ip='localhost', salida=None, usar_snapshot=True):
+        self.controller_ip = controller_ip
+        self.salida = salida or sys.stdout
+        # El daemon importa sin snapshots: solo confía en los que genera el menú/lote
+        self.usar_snapshot = usar_snapshot
+        # Comandos de conexión pendientes de enviar: (op, [(número de línea, comando, dato)])
+        self.pendientes = None
+        self.resultados = []
+        # Réplicas elegidas en el lote pendiente: por servidor y por (alumno, servicio)
+        self.asignadas = {}
+        self.elegidas = {}
+
+    def emitir(self, numero, comando, ok, resultado=None, error=None, codigo='invalido'):
+        registro = {'linea': numero, 'op': comando.get('op'), 'ok': ok}
+        if ok:
+            registro['resultado'] = resultado
+        else:
+            registro['error'] = error
+            registro['codigo'] = codigo
+        self.resultados.append(registro)
+        self.salida.write(json.dumps(registro, ensure_ascii=False, default=str) + '\n')
+
+    def ejecutar(self, lineas):
+        for numero, linea in enumerate(lineas, 1):
+            if not linea.strip() or linea.lstrip().startswith('#'):
+                continue
+            try:
+                comando = parsear_comando(linea)
+            except ValueError as e:
+                self.emitir(numero, {'op': None}, False, error=str(e))
+                continue
+            self.procesar(numero, comando)
+        self.vaciar()
+        return self.resultados
+
+    def procesar(self, numero, comando):
+        try:
+            comando = normalizar_comando(comando)
+        except ValueError as e:
+            self.emitir(numero, {'op': comando.get('op') if isinstance(comando, dict) else None}, False, error=str(e))
+            return
+        if comando['op'] in ('crear_conexion', 'borrar_conexion'):
+            self.encolar(numero, comando)
+            return
+        self.vaciar()
+        try:
+            resultado = self.ejecutar_comando(comando)
+        except Exception as e:
+            # Un comando fallido no detiene el resto del lote
+            self.emitir(numero, comando, False, error=str(e) or type(e).__name__, codigo=codigo_error(e))
+            return
+        self.emitir(numero, comando, True, resultado)
+
+    def encolar(self, numero, comando):
+        op = comando['op']
+        if self.pendientes is not None and self.pendientes[0] != op:
+            self.vaciar()
+        dato, error = None, None
+        if op == 'crear_conexion':
+            try:
+                if almacen is None:
+                    raise ErrorConexion("Primero importe los datos.", 'sin_datos')
+                servidor = comando['servidor']
+                if servidor == SERVIDOR_AUTOMATICO:
+                    servidor = self.elegir(str(comando['alumno']), comando['servicio'])
+                validar_conexion(comando['alumno'], servidor, comando['servicio'])
+                dato = (str(comando['alumno']), servidor, comando['servicio'], comando.get('ip_src'))
+            except KeyError as e:
+                error = (f"Falta el campo {e}", 'invalido')
+            except Exception as e:
+                error = (str(e) or type(e).__name__, codigo_error(e))
+        else:
+            dato = comando.get('handler')
+        if self.pendientes is None:
+            self.pendientes = (op, [])
+        # Los comandos inválidos se guardan igual (error = (mensaje, código)) para
+        # emitir los resultados en orden
+        self.pendientes[1].append((numero, comando, dato, error))
+
+    def elegir(self, cod_alumno, nombre_servicio):
+        clave = (cod_alumno, nombre_servicio)
+        if clave not in self.elegidas:
+            servidor = elegir_replica(cod_alumno, nombre_servicio, self.controller_ip, self.asignadas)
+            self.elegidas[clave] = servidor
+            self.asignadas[servidor] = self.asignadas.get(servidor, 0) + 1
+        return self.elegidas[clave]
+
+    def vaciar(self):
+        if self.pendientes is None:
+            return
+        op, lista = self.pendientes
+        self.pendientes = None
+        self.asignadas = {}
+        self.elegidas = {}
+        try:
+            self._vaciar(op, lista)
+        except Exception as e:
+            # Falla el lote entero: cada comando recibe su registro de error
+            emitidos = {r['linea'] for r in self.resultados}
+            for numero, comando, _, error in lista:
+                if numero not in emitidos:
+                    mensaje, codigo = error or (str(e) or type(e).__name__, codigo_error(e))
+                    self.emitir(numero, comando, False, error=mensaje, codigo=codigo)
+
+    def _vaciar(self, op, lista):
+        if op == 'crear_conexion':
+            planes = [dato for _, _, dato, error in lista if error is None]
+            resultado = provisionar_masivo(planes, self.controller_ip) if planes else {'fallidas': [], 'omitidas': []}
+            fallidas = {handler: (error, codigo) for handler, error, codigo in resultado['fallidas']}
+            omitidas = set(resultado['omitidas'])
+            emitidos = set()
+            for numero, comando, dato, error in lista:
+                if error is not None:
+                    self.emitir(numero, comando, False, error=error[0], codigo=error[1])
+                    continue
+                handler = f"{dato[0]}-{dato[1]}-{dato[2]}"
+                if handler in fallidas:
+                    self.emitir(numero, comando, False, error=fallidas[handler][0], codigo=fallidas[handler][1])
+                elif handler in omitidas or handler in emitidos:
+                    self.emitir(numero, comando, False, error="La conexión ya existe.", codigo='existe')
+                else:
+                    self.emitir(numero, comando, True, {'handler': handler})
+                emitidos.add(handler)
+        else:
+            resultado = eliminar_conexiones([dato for _, _, dato, _ in lista])
+            for numero, comando, handler, _ in lista:
+                r = resultado.get(handler, {'ok': False, 'error': 'Conexión no encontrada', 'codigo': 'no_encontrado'})
+                if r['ok']:
+                    self.emitir(numero, comando, True, {'handler': handler})
+                else:
+                    self.emitir(numero, comando, False, error=r['error'] or f"Flows aún instalados: {r['pendientes']}",
+                                codigo=r['codigo'])
+
+    @staticmethod
+    def revocadas(resultado):
+        return {'ok': [h for h, r in resultado.items() if r['ok']],
+                'fallidas': [{'handler': h, 'error': r['error'], 'pendientes': r['pendientes']}
+                             for h, r in resultado.items() if not r['ok']]}
+
+    def ejecutar_comando(self, comando):
+        op = comando['op']
+        if op == 'importar':
+            cargar_almacen_archivo(comando['archivo'], self.usar_snapshot)
+            return {'alumnos': len(almacen.alumnos_por_codigo), 'cursos': len(almacen.cursos_por_codigo),
+                    'servidores': len(almacen.servidores_por_nombre),
+                    'revocadas': self.revocadas(revocar_no_autorizadas(todas=True))}
+        if op == 'reconciliar':
+            propias = [c for c in conexiones.values() if (c.controller or self.controller_ip) == self.controller_ip]
+            return reconciliar_flows(self.controller_ip, propias)
+        if op == 'ocupacion':
+            return {'switches': reporte_ocupacion()}
+        if op == 'expirar':
+            return self.revocadas(expirar_conexiones(self.controller_ip))
+        if op == 'listar_conexiones':
+            lista, total = conexiones.consultar(comando.get('alumno'), comando.get('servidor'), comando.get('servicio'),
+                                                int(comando.get('pagina') or 1))
+            return {'total': total, 'conexiones': [{'handler': c.handler, 'alumno': c.alumno, 'servidor': c.servidor,
+                                                    'servicio': c.servicio} for c in lista]}
+        if almacen is None:
+            raise ErrorConexion("Primero importe los datos.", 'sin_datos')
+        if op == 'exportar':
+            registro = comando.get('registro', usar_registro)
+            if isinstance(registro, str):
+                registro = registro.lower() in ('1', 'si', 'sí', 'true')
+            resultado = guardar_almacen(comando['archivo'], registro=registro)
+            resultado['archivo'] = comando['archivo']
+            return resultado
+        if op == 'agregar_alumno':
+            if not almacen.agregar_alumno(Alumno(comando['nombre'], comando['codigo'], comando['mac'])):
+                raise ErrorConexion("Ya existe un alumno con ese código.", 'existe')
+            return {'codigo': comando['codigo']}
+        if op == 'borrar_alumno':
+            if almacen.borrar_alumno(comando['codigo']) is None:
+                raise ErrorConexion("Alumno no encontrado.", 'no_encontrado')
+            return {'codigo': comando['codigo'], 'revocadas': self.revocadas(revocar_no_autorizadas())}
+        if op in ('curso_agregar_alumno', 'curso_eliminar_alumno', 'curso_estado'):
+            if almacen.buscar_curso(comando['curso']) is None:
+                raise ErrorConexion("Curso no encontrado.", 'no_encontrado')
+            if op == 'curso_estado':
+                almacen.cambiar_estado_curso(comando['curso'], comando['estado'].upper())
+                return {'curso': comando['curso'], 'estado': comando['estado'].upper(),
+                        'revocadas': self.revocadas(revocar_no_autorizadas())}
+            if op == 'curso_agregar_alumno':
+                cambio = almacen.agregar_alumno_curso(comando['curso'], comando['alumno'])
+            else:
+                cambio = almacen.eliminar_alumno_curso(comando['curso'], comando['alumno'])
+            return {'curso': comando['curso'], 'alumno': comando['alumno'], 'cambio': cambio,
+                    'revocadas': self.revocadas(revocar_no_autorizadas())}
+        if op == 'provisionar':
+            resultado = provisionar_masivo(planificar_conexiones(comando.get('curso')), self.controller_ip)
+            resultado['fallidas'] = [{'handler': h, 'error': e, 'codigo': c} for h, e, c in resultado['fallidas']]
+            return resultado
+        raise ValueError(f"Comando desconocido: {op}")
+
+
+def ejecutar_lote(origen, controller_ip='localhost', salida=None):
+    ejecutor = EjecutorLote(controller_ip, salida)
+    if origen == '-':
+        return ejecutor.ejecutar(sys.stdin)
+    with open(origen, 'r', encoding='utf-8') as f:
+        return ejecutor.ejecutar(f)
+
+
+# Modo daemon: API HTTP/JSON local sobre asyncio. Los datos, índices y sesiones
+# con el controlador se cargan una vez. Las consultas se responden en el bucle;
+# todo lo que modifica estado pasa por una única cola que lo ejecuta en orden en
+# un hilo (las llamadas al controlador bloquean) y agrupa las altas/bajas de
+# conexiones que llegan juntas en una sola operación, como el modo lote.
+# Toda petición lleva 'Authorization: Bearer <token>'; importar/exportar solo
+# aceptan archivos YAML dentro del directorio de datos del daemon.
+PUERTO_API = 8081
+# Segundos que se esperan para juntar peticiones concurrentes en un mismo lote
+ESPERA_LOTE_API = 0.005
+MAX_LOTE_API = 2048
+MAX_CUERPO_API = 1 << 20
+MAX_POR_PAGINA_API = 1000
+MOTIVOS_HTTP = {200: 'OK', 201: 'Created', 400: 'Bad Request', 401: 'Unauthorized', 403: 'Forbidden',
+                404: 'Not Found', 405: 'Method Not Allowed', 409: 'Conflict', 413: 'Payload Too Large',
+                500: 'Internal Server Error', 502: 'Bad Gateway'}
+# Status de cada código de error del modo lote; uno desconocido es un 500
+STATUS_CODIGO = {'invalido': 400, 'no_autorizado': 403, 'no_encontrado': 404, 'existe': 409, 'conflicto': 409,
+                 'capacidad': 409, 'sin_datos': 409, 'controlador': 502}
+EXTENSIONES_DATOS = ('.yaml', '.yml')
+
+
+class ErrorAPI(Exception):
+    def __init__(self, status, mensaje):
+        super().__init__(mensaje)
+        self.status = status
+
+
+def entero_positivo(parametros, nombre, defecto, maximo=None):
+    valor = parametros.get(nombre)
+    if valor is None or valor == '':
+        return defecto
+    try:
+        numero = int(valor)
+    except ValueError:
+        raise ErrorAPI(400, f"El parámetro '{nombre}' debe ser un entero.")
+    if numero < 1:
+        raise ErrorAPI(400, f"El parámetro '{nombre}' debe ser mayor que 0.")
+    if maximo is not None and numero > maximo:
+        raise ErrorAPI(400, f"El parámetro '{nombre}' no puede superar {maximo}.")
+    return numero
+
+
+class DaemonPoliticas:
+    def __init__(self, controller_ip='localhost', host='127.0.0.1', puerto=PUERTO_API, espera_lote=ESPERA_LOTE_API,
+                 token=None, directorio=None):
+        self.controller_ip = controller_ip
+        self.host = host
+        self.puerto = puerto
+        self.espera_lote = espera_lote
+        # Sin token configurado se genera uno y se muestra al iniciar
+        self.token_generado = not token
+        self.token = token or secrets.token_urlsafe(24)
+        self.directorio = os.path.realpath(directorio or os.getcwd())
+        # Cola de escritura: (comando, futuro)
+        self.cola = None
+        self.servidor = None
+        self.tareas = []
+
+    async def iniciar(self):
+        self.cola = asyncio.Queue()
+        self.servidor = await asyncio.start_server(self._atender, self.host, self.puerto)
+        self.puerto = self.servidor.sockets[0].getsockname()[1]
+        self.tareas = [asyncio.create_task(self._escritor()), asyncio.create_task(self._expirador())]
+        for controller_ip in {self.controller_ip} | {c.controller or 'localhost' for c in conexiones.values()}:
+            obtener_recolector(controller_ip, iniciar=True, expirar=False)
+        return self
+
+    async def detener(self):
+        if self.servidor is not None:
+            self.servidor.close()
+            await self.servidor.wait_closed()
+        for tarea in self.tareas:
+            tarea.cancel()
+        await asyncio.gather(*self.tareas, return_exceptions=True)
+
+    async def servir(self):
+        await self.iniciar()
+        print(f"API escuchando en http://{self.host}:{self.puerto}")
+        if self.token_generado:
+            print(f"Token de la API: {self.token}")
+        try:
+            await self.servidor.serve_forever()
+        finally:
+            await self.detener()
+
+    # Escritura serializada
+
+    async def mutar(self, comando):
+        futuro = asyncio.get_running_loop().create_future()
+        await self.cola.put((comando, futuro))
+        return await futuro
+
+    async def _escritor(self):
+        while True:
+            lote = [await self.cola.get()]
+            await asyncio.sleep(self.espera_lote)
+            while not self.cola.empty() and len(lote) < MAX_LOTE_API:
+                lote.append(self.cola.get_nowait())
+            try:
+                with metricas.fase('api_lote'):
+                    registros = await asyncio.to_thread(self._ejecutar_lote, [comando for comando, _ in lote])
+            except Exception as e:
+                for _, futuro in lote:
+                    if not futuro.done():
+                        futuro.set_exception(e)
+                continue
+            for (_, futuro), registro in zip(lote, registros):
+                if not futuro.done():
+                    futuro.set_result(registro)
+
+    def _ejecutar_lote(self, comandos):
+        ejecutor = EjecutorLote(self.controller_ip, io.StringIO(), usar_snapshot=False)
+        for numero, comando in enumerate(comandos):
+            try:
+                ejecutor.procesar(numero, comando)
+            except Exception as e:
+                # Cada petición recibe su propio error; el resto del lote sigue
+                ejecutor.emitir(numero, comando, False, error=str(e) or type(e).__name__, codigo=codigo_error(e))
+        ejecutor.vaciar()
+        registros = {r['linea']: r for r in ejecutor.resultados}
+        if any(c['op'] in ('crear_conexion', 'provisionar') for c in comandos):
+            obtener_recolector(self.controller_ip, iniciar=True, expirar=False)
+        return [registros.get(numero) or {'linea': numero, 'op': comando['op'], 'ok': False,
+                                          'error': "Comando sin resultado.", 'codigo': 'error'}
+                for numero, comando in enumerate(comandos)]
+
+    async def _expirador(self):
+        while True:
+            await asyncio.sleep(INTERVALO_TRAFICO)
+            if any(temporizada(c) for c in conexiones.values()):
+                await self.mutar({'op': 'expirar'})
+
+    # Consultas (sin cola: leen índices en memoria bajo el lock de cada almacén)
+
+    def consultar(self, recurso, partes, parametros):
+        if recurso == 'salud':
+            return {'alumnos': len(almacen.alumnos_por_codigo) if almacen is not None else 0,
+                    'conexiones': len(conexiones), 'controlador': self.controller_ip}
+        if recurso == 'conexiones':
+            lista, total = conexiones.consultar(parametros.get('alumno'), parametros.get('servidor'),
+                                                parametros.get('servicio'), entero_positivo(parametros, 'pagina', 1),
+                                                entero_positivo(parametros, 'por_pagina', 20, MAX_POR_PAGINA_API))
+            return {'total': total, 'conexiones': [{'handler': c.handler, 'alumno': c.alumno, 'servidor': c.servidor,
+                                                    'servicio': c.servicio, 'controlador': c.controller,
+                                                    'trafico': estadisticas_conexion(c)} for c in lista]}
+        if almacen is None:
+            raise ErrorAPI(409, "Primero importe los datos.")
+        if recurso == 'autorizacion':
+            try:
+                clave = (parametros['alumno'], parametros['servidor'], parametros['servicio'])
+            except KeyError as e:
+                raise ErrorAPI(400, f"Falta el parámetro {e}")
+            return {'autorizado': almacen.esta_autorizado(*clave), 'cursos': sorted(almacen.cursos_autorizantes(*clave))}
+        if recurso == 'alumnos' and len(partes) == 1:
+            alumno = almacen.buscar_alumno(partes[0])
+            if alumno is None:
+                raise ErrorAPI(404, "Alumno no encontrado.")
+            return alumno.a_dict()
+        if recurso == 'cursos' and len(partes) == 1:
+            curso = almacen.buscar_curso(partes[0])
+            if curso is None:
+                raise ErrorAPI(404, "Curso no encontrado.")
+            return almacen.curso_a_dict(curso)
+        raise ErrorAPI(404, "Recurso no encontrado.")
+
+    def archivo_datos(self, nombre):
+        # Ruta dentro del directorio de datos; rechaza rutas que salgan de él
+        if nombre is None:
+            raise ErrorAPI(400, "Falta el campo 'archivo'")
+        if not isinstance(nombre, str) or not nombre:
+            raise ErrorAPI(400, "Valor inválido para 'archivo'")
+        ruta = os.path.realpath(os.path.join(self.directorio, nombre))
+        if os.path.commonpath([ruta, self.directorio]) != self.directorio or \
+                not ruta.lower().endswith(EXTENSIONES_DATOS):
+            raise ErrorAPI(403, "Solo se permiten archivos YAML del directorio de datos.")
+        return ruta
+
+    def autorizada(self, cabeceras):
+        esquema, _, token = cabeceras.get('authorization', '').partition(' ')
+        return esquema.lower() == 'bearer' and hmac.compare_digest(token.strip().encode(), self.token.encode())
+
+    def comando(self, metodo, recurso, partes, cuerpo):
+        # Traduce la petición al comando equivalente del modo lote
+        if recurso == 'conexiones' and metodo == 'POST' and not partes:
+            return dict(cuerpo, op='crear_conexion')
+        if recurso == 'conexiones' and metodo == 'DELETE' and len(partes) == 1:
+            return {'op': 'borrar_conexion', 'handler': partes[0]}
+        if recurso == 'alumnos' and metodo == 'POST' and not partes:
+            return dict(cuerpo, op='agregar_alumno')
+        if recurso == 'alumnos' and metodo == 'DELETE' and len(partes) == 1:
+            return {'op': 'borrar_alumno', 'codigo': partes[0]}
+        if recurso == 'cursos' and len(partes) == 2 and partes[1] == 'alumnos' and metodo == 'POST':
+            return dict(cuerpo, op='curso_agregar_alumno', curso=partes[0])
+        if recurso == 'cursos' and len(partes) == 3 and partes[1] == 'alumnos' and metodo == 'DELETE':
+            return {'op': 'curso_eliminar_alumno', 'curso': partes[0], 'alumno': partes[2]}
+        if recurso == 'cursos' and len(partes) == 2 and partes[1] == 'estado' and metodo == 'PUT':
+            return dict(cuerpo, op='curso_estado', curso=partes[0])
+        if recurso in ('importar', 'exportar') and metodo == 'POST' and not partes:
+            return dict(cuerpo, op=recurso, archivo=self.archivo_datos(cuerpo.get('archivo')))
+        if recurso in ('provisionar', 'reconciliar') and metodo == 'POST' and not partes:
+            return dict(cuerpo, op=recurso)
+        if recurso == 'ocupacion' and metodo == 'GET' and not partes:
+            # Lee las tablas de flows, que solo cambian dentro de la cola
+            return {'op': 'ocupacion'}
+        return None
+
+    async def responder(self, metodo, destino, datos):
+        url = urlsplit(destino)
+        partes = [unquote(p) for p in url.path.strip('/').split('/') if p]
+        if not partes:
+            raise ErrorAPI(404, "Recurso no encontrado.")
+        recurso, partes = partes[0], partes[1:]
+        parametros = dict(parse_qsl(url.query))
+        if recurso == 'metricas' and metodo == 'GET':
+            return 200, metricas.texto_prometheus()
+        try:
+            cuerpo = json.loads(datos) if datos else {}
+        except ValueError:
+            raise ErrorAPI(400, "El cuerpo no es JSON válido.")
+        if not isinstance(cuerpo, dict):
+            raise ErrorAPI(400, "El cuerpo debe ser un objeto JSON.")
+        comando = self.comando(metodo, recurso, partes, cuerpo)
+        if comando is None:
+            if metodo != 'GET':
+                raise ErrorAPI(405, "Método no permitido.")
+            return 200, self.consultar(recurso, partes, parametros)
+        registro = await self.mutar(comando)
+        if not registro['ok']:
+            raise ErrorAPI(STATUS_CODIGO.get(registro.get('codigo'), 500), registro['error'])
+        return (201 if comando['op'] == 'crear_conexion' else 200), registro['resultado']
+
+    async def _atender(self, reader, writer):
+        try:
+            while True:
+                linea = await reader.readline()
+                if not linea.strip():
+                    break
+                metodo, destino = linea.decode('latin-1').split()[:2]
+                cabeceras = {}
+                while True:
+                    cabecera = await reader.readline()
+                    if cabecera in (b'\r\n', b'\n', b''):
+                        break
+                    nombre, _, valor = cabecera.decode('latin-1').partition(':')
+                    cabeceras[nombre.strip().lower()] = valor.strip()
+                largo = int(cabeceras.get('content-length') or 0)
+                inicio = time.perf_counter()
+                if largo > MAX_CUERPO_API:
+                    status, cuerpo = 413, {'error': 'Cuerpo demasiado grande.'}
+                elif not self.autorizada(cabeceras):
+                    if largo:
+                        await reader.readexactly(largo)
+                    status, cuerpo = 401, {'error': 'Token inválido o ausente.'}
+                else:
+                    datos = await reader.readexactly(largo) if largo else b''
+                    try:
+                        status, cuerpo = await self.responder(metodo.upper(), destino, datos)
+                    except ErrorAPI as e:
+                        status, cuerpo = e.status, {'error': str(e)}
+                    except Exception as e:
+                        status, cuerpo = 500, {'error': str(e) or type(e).__name__}
+                metricas.incrementar('api_respuestas_total', (('metodo', metodo.upper()), ('status', str(status))))
+                metricas.observar('api_segundos', (('metodo', metodo.upper()),), time.perf_counter() - inicio)
+                cerrar = cabeceras.get('connection', '').lower() == 'close' or largo > MAX_CUERPO_API
+                if isinstance(cuerpo, str):
+                    tipo, datos = 'text/plain; version=0.0.4', cuerpo.encode()
+                else:
+                    tipo, datos = 'application/json', json.dumps(cuerpo, ensure_ascii=False, default=str).encode()
+                writer.write(f'HTTP/1.1 {status} {MOTIVOS_HTTP.get(status, "")}\r\nContent-Type: {tipo}\r\n'
+                             f'Content-Length: {len(datos)}\r\nConnection: {"close" if cerrar else "keep-alive"}'
+                             f'\r\n\r\n'.encode() + datos)
+                await writer.drain()
+                if cerrar:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+def ejecutar_daemon(controller_ip='localhost', host='127.0.0.1', puerto=PUERTO_API, token=None):
+    try:
+        asyncio.run(DaemonPoliticas(controller_ip, host, puerto, token=token).servir())
+    except KeyboardInterrupt:
+        pass
+
+
 # Main
 
 
 def main():
+    parser = argparse.ArgumentParser(description='Network Policy manager de la UPSM')
+    parser.add_argument('--lote', metavar='ARCHIVO', help="ejecuta comandos desde ARCHIVO ('-' = stdin) sin menú")
+    parser.add_argument('--daemon', action='store_true', help='sirve la API HTTP/JSON local en lugar del menú')
+    parser.add_argument('--api', default=f'127.0.0.1:{PUERTO_API}', metavar='HOST:PUERTO',
+                        help='dirección de escucha de la API del daemon')
+    parser.add_argument('--token-api', default=os.environ.get('TOKEN_API'), metavar='TOKEN',
+                        help='token Bearer exigido por la API (default: $TOKEN_API o uno generado al iniciar)')
+    parser.add_argument('--controlador', default='localhost',
+                        help='IP[:puerto] del controlador Floodlight o nombre de un pool')
+    parser.add_argument('--controladores', metavar='ARCHIVO',
+                        help='YAML con pools de controladores {nombre: [{ip, dpids}]}')
+    parser.add_argument('--capacidad-switch', action='append', default=[], metavar='[DPID=]N',
+                        help=f'flows que la herramienta puede instalar por switch (default: {CAPACIDAD_SWITCH})')
+    parser.add_argument('--registro-cambios', action='store_true',
+                        help='al exportar sobre el archivo cargado, agregar solo los cambios a su registro')
+    args = parser.parse_args()
+    global usar_registro
+    usar_registro = args.registro_cambios
+    if args.controladores:
+        cargar_pools(args.controladores)
+    configurar_capacidades(args.capacidad_switch)
     if os.path.exists('datos.yaml'):
-        data = importar_datos('datos.yaml')
-        listar_alumnos.data = data
-    else:
-        data = {}
-    menu()
+        cargar_almacen_archivo('datos.yaml')
+    conexiones.abrir(ARCHIVO_CONEXIONES)
+    try:
+        # Las conexiones recuperadas se revisan contra las políticas actuales
+        if almacen is not None and len(conexiones):
+            revocadas = revocar_no_autorizadas(todas=True)
+            if not args.lote:
+                imprimir_revocadas(revocadas)
+        if args.lote:
+            ejecutar_lote(args.lote, args.controlador)
+        elif args.daemon:
+            host, _, puerto = args.api.rpartition(':')
+            ejecutar_daemon(args.controlador, host or '127.0.0.1', int(puerto), args.token_api)
+        else:
+            # Estadísticas de tráfico para las conexiones recuperadas
+            for controller_ip in {c.controller or 'localhost' for c in conexiones.values()}:
+                obtener_recolector(controller_ip, iniciar=True)
+            menu()
+    finally:
+        for recolector in list(recolectores.values()):
+            recolector.detener()
+        conexiones.cerrar()
 
 
 if __name__ == "__main__":
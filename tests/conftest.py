@@ -0,0 +1,68 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import benchmark
+import main
+from floodlight_stub import FloodlightStub
+
+
+@pytest.fixture(autouse=True)
+def estado(monkeypatch):
+    # Cada prueba parte sin conexiones, tablas, cachés ni circuitos de la anterior
+    monkeypatch.setattr(main, 'conexiones', main.AlmacenConexiones())
+    monkeypatch.setattr(main, 'almacen', None)
+    monkeypatch.setattr(main, 'TIMEOUT_LECTURA', 2)
+    monkeypatch.setattr(main, 'REINTENTOS', 0)
+    monkeypatch.setattr(main, 'CAPACIDAD_SWITCH', main.CAPACIDAD_SWITCH)
+    for global_ in (main.tablas_flows, main._caches_dispositivos, main._caches_rutas, main._monitores_puertos,
+                    main._circuitos, main._sesiones, main.capacidades_switch):
+        global_.clear()
+    yield
+    for recolector in list(main.recolectores.values()):
+        recolector.detener()
+    main.recolectores.clear()
+
+
+@pytest.fixture
+def datos(tmp_path):
+    data = benchmark.generar_datos(200, 5, semilla=1)
+    archivo = str(tmp_path / 'datos.yaml')
+    main.exportar_datos(archivo, data)
+    main.cargar_almacen_archivo(archivo)
+    return data, archivo
+
+
+@pytest.fixture
+def stub(datos):
+    stub = FloodlightStub().iniciar()
+    benchmark.poblar_stub(stub, datos[0], 4)
+    yield stub
+    stub.detener()
+
+
+@pytest.fixture
+def autorizadas(datos):
+    return sorted(main.almacen.autorizaciones)
+
+
+@pytest.fixture
+def entorno(tmp_path):
+    # Carga un dataset propio y levanta un stub con sus hosts
+    stubs = []
+
+    def crear(data, switches=4):
+        archivo = str(tmp_path / 'propio.yaml')
+        main.exportar_datos(archivo, data)
+        main.cargar_almacen_archivo(archivo)
+        stub = FloodlightStub().iniciar()
+        stubs.append(stub)
+        benchmark.poblar_stub(stub, data, switches)
+        return stub
+
+    yield crear
+    for stub in stubs:
+        stub.detener()
@@ -0,0 +1,112 @@
+import copy
+
+import pytest
+
+import benchmark
+import main
+
+
+@pytest.fixture
+def data():
+    return benchmark.generar_datos(60, 8, semilla=3)
+
+
+# Almacén indexado
+
+
+def test_busquedas_coinciden_con_el_recorrido_lineal(data):
+    almacen = main.AlmacenPoliticas(copy.deepcopy(data))
+    for d in data['alumnos']:
+        assert almacen.buscar_alumno(d['codigo']).nombre == d['nombre']
+        assert almacen.buscar_alumno(str(d['codigo'])).mac == d['mac']
+        assert almacen.buscar_alumno_por_mac(d['mac'].upper()).codigo == d['codigo']
+    for d in data['servidores']:
+        assert almacen.buscar_servidor(d['nombre']).ip == d['ip']
+        for s in d['servicios']:
+            servicio = almacen.buscar_servicio(d['nombre'], s['nombre'])
+            assert (servicio.protocolo, servicio.puerto) == (s['protocolo'], s['puerto'])
+    for d in data['cursos']:
+        assert almacen.buscar_curso(d['codigo']).nombre == d['nombre']
+        for codigo in d['alumnos']:
+            assert almacen.alumno_en_curso(d['codigo'], codigo)
+    assert almacen.buscar_alumno('no-existe') is None
+    assert almacen.buscar_servicio(data['servidores'][0]['nombre'], 'no-existe') is None
+
+
+def test_conversion_conserva_el_formato_del_yaml(data):
+    data['version'] = 2
+    data['alumnos'][0]['carrera'] = 'Telecomunicaciones'
+    assert main.AlmacenPoliticas(copy.deepcopy(data)).a_dict() == data
+
+
+def test_agregar_y_borrar_alumno_mantienen_los_indices(data):
+    almacen = main.AlmacenPoliticas(data)
+    assert not almacen.agregar_alumno(main.Alumno('Repetido', data['alumnos'][0]['codigo'], 'aa:aa:aa:aa:aa:aa'))
+    assert almacen.agregar_alumno(main.Alumno('Nuevo', 1, 'AA:BB:CC:DD:EE:FF'))
+    assert almacen.buscar_alumno('1').nombre == 'Nuevo'
+    assert almacen.buscar_alumno_por_mac('aa:bb:cc:dd:ee:ff').codigo == 1
+
+    curso = next(d for d in data['cursos'] if d['alumnos'])
+    codigo = curso['alumnos'][0]
+    mac = almacen.buscar_alumno(codigo).mac
+    assert almacen.borrar_alumno(codigo).codigo == codigo
+    assert almacen.buscar_alumno(codigo) is None
+    assert almacen.buscar_alumno_por_mac(mac) is None
+    assert not any(almacen.alumno_en_curso(d['codigo'], codigo) for d in data['cursos'])
+    assert codigo not in almacen.curso_a_dict(almacen.buscar_curso(curso['codigo']))['alumnos']
+    assert almacen.borrar_alumno(codigo) is None
+
+
+# Matriz de autorización
+
+
+def autorizaciones_por_recorrido(almacen):
+    # Cálculo directo desde los cursos, como antes de precalcular la matriz
+    esperado = {}
+    for d in almacen.a_dict()['cursos']:
+        if d['estado'] != 'DICTANDO':
+            continue
+        for alumno in d['alumnos']:
+            for s in d['servidores']:
+                for servicio in s['servicios_permitidos']:
+                    esperado.setdefault((str(alumno), s['nombre'], servicio), set()).add(d['codigo'])
+    return esperado
+
+
+def test_matriz_inicial_coincide_con_el_recorrido(data):
+    almacen = main.AlmacenPoliticas(data)
+    assert almacen.autorizaciones == autorizaciones_por_recorrido(almacen)
+    clave = next(iter(almacen.autorizaciones))
+    assert almacen.esta_autorizado(int(clave[0]), *clave[1:])
+    assert almacen.cursos_autorizantes(*clave) == almacen.autorizaciones[clave]
+
+
+def test_cambios_de_cursos_actualizan_la_matriz(data):
+    almacen = main.AlmacenPoliticas(data)
+    cursos = [d['codigo'] for d in data['cursos']]
+    alumnos = [d['codigo'] for d in data['alumnos']]
+    ajeno = next(a for a in alumnos if not almacen.alumno_en_curso(cursos[0], a))
+    otro = next(a for a in alumnos if not almacen.alumno_en_curso(cursos[2], a))
+    borrado = next(a for a in alumnos if a != ajeno and almacen.cursos_alumno.get(str(a)))
+    operaciones = [
+        lambda: almacen.agregar_alumno_curso(cursos[0], ajeno),
+        lambda: almacen.eliminar_alumno_curso(cursos[1], sorted(almacen.alumnos_curso[cursos[1]])[0]),
+        lambda: almacen.cambiar_estado_curso(cursos[2], 'INACTIVO'),
+        lambda: almacen.agregar_alumno_curso(cursos[2], otro),
+        lambda: almacen.cambiar_estado_curso(cursos[2], 'DICTANDO'),
+        lambda: almacen.borrar_alumno(borrado),
+        lambda: almacen.eliminar_alumno_curso(cursos[0], ajeno),
+    ]
+    for operacion in operaciones:
+        assert operacion()
+        assert almacen.autorizaciones == autorizaciones_por_recorrido(almacen)
+
+
+def test_perder_la_ultima_autorizacion_marca_al_alumno_revocado(data):
+    almacen = main.AlmacenPoliticas(data)
+    clave = next(c for c, cursos in sorted(almacen.autorizaciones.items()) if len(cursos) == 1)
+    curso = next(iter(almacen.autorizaciones[clave]))
+    almacen.cambiar_estado_curso(curso, 'INACTIVO')
+    assert not almacen.esta_autorizado(*clave)
+    assert clave[0] in almacen.tomar_revocados()
+    assert not almacen.tomar_revocados()
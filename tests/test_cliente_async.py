@@ -0,0 +1,87 @@
+import asyncio
+import socketserver
+import threading
+
+import pytest
+
+import main
+
+
+class _Respuesta(socketserver.BaseRequestHandler):
+    def handle(self):
+        self.request.recv(65536)
+        self.request.sendall(self.server.respuesta)
+
+
+@pytest.fixture
+def servidor_falso():
+    # Servidor TCP que responde siempre los mismos bytes (no necesariamente HTTP)
+    servidores = []
+
+    def crear(respuesta):
+        servidor = socketserver.ThreadingTCPServer(('127.0.0.1', 0), _Respuesta)
+        servidor.daemon_threads = True
+        servidor.respuesta = respuesta
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+        servidores.append(servidor)
+        return '127.0.0.1:%d' % servidor.server_address[1]
+
+    yield crear
+    for servidor in servidores:
+        servidor.shutdown()
+        servidor.server_close()
+
+
+def pedir(controller_ip, metodo='GET', ruta='/wm/device/', cuerpo=None):
+    async def _pedir():
+        async with main.ClienteFloodlightAsync(controller_ip) as cliente:
+            return await cliente.peticion(metodo, ruta, cuerpo)
+    return asyncio.run(_pedir())
+
+
+@pytest.mark.parametrize('respuesta', [
+    b'SSH-2.0-OpenSSH_9.6\r\n',
+    b'HTTP/1.1 abc OK\r\n\r\n',
+    b'HTTP/1.1 200 OK\r\nContent-Length: muchos\r\n\r\n{}',
+    b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\nzz\r\n',
+])
+def test_respuesta_malformada_es_error_http(servidor_falso, respuesta):
+    controller_ip = servidor_falso(respuesta)
+    with pytest.raises(main.ErrorHTTPAsync, match='Respuesta HTTP inválida'):
+        pedir(controller_ip)
+    # Cuenta como fallo del controlador para el circuit breaker
+    assert main.obtener_circuito(controller_ip).fallos
+
+
+def test_push_flow_a_un_puerto_no_http_reporta_el_error(servidor_falso):
+    controller_ip = servidor_falso(b'garbage\r\n')
+
+    async def _push():
+        async with main.ClienteFloodlightAsync(controller_ip) as cliente:
+            return await cliente.push_flow({'name': 'flow_x', 'switch': '00:01'})
+    resultado = asyncio.run(_push())
+    assert not resultado['ok'] and 'Respuesta HTTP inválida' in resultado['error']
+
+
+def test_eliminar_conexiones_con_controlador_no_http_no_lanza(servidor_falso):
+    controller_ip = servidor_falso(b'garbage\r\n')
+    conexion = main.Conexion('20000000-S-svc', '20000000', 'S', 'svc', controller_ip, [], {}, ['flow_x'])
+    main.conexiones['20000000-S-svc'] = conexion
+    resultado = main.eliminar_conexiones(['20000000-S-svc'])
+    assert not resultado['20000000-S-svc']['ok']
+    assert '20000000-S-svc' in main.conexiones
+
+
+def test_cliente_contra_el_stub(stub):
+    flow = {'name': 'flow_prueba', 'switch': stub.dpid(0), 'priority': '100', 'active': 'true'}
+
+    async def _ciclo():
+        async with main.ClienteFloodlightAsync(stub.controller_ip) as cliente:
+            enviados = await cliente.push_flows([flow])
+            listado = await cliente.listar_flows()
+            borrados = await cliente.borrar_flows(['flow_prueba'])
+            return enviados, listado, borrados, await cliente.listar_flows()
+    enviados, listado, borrados, despues = asyncio.run(_ciclo())
+    assert enviados[0]['ok'] and borrados[0]['ok']
+    assert 'flow_prueba' in main.flows_instalados(listado)
+    assert 'flow_prueba' not in main.flows_instalados(despues)
@@ -0,0 +1,163 @@
+import time
+
+import pytest
+
+import main
+from floodlight_stub import FloodlightStub
+
+
+@pytest.fixture
+def lento():
+    # Cada respuesta tarda 0.1 s, como un controlador remoto
+    stub = FloodlightStub(latencia=0.1).iniciar()
+    yield stub
+    stub.detener()
+
+
+@pytest.fixture
+def red():
+    stub = FloodlightStub().iniciar()
+    stub.construir_topologia(3)
+    stub.agregar_host('44:00:00:00:00:01', '10.0.0.1', stub.dpid(0), 10)
+    stub.agregar_host('52:00:00:00:00:01', '10.0.0.2', stub.dpid(2), 20)
+    yield stub
+    stub.detener()
+
+
+@pytest.fixture
+def consultas(monkeypatch):
+    # Endpoints GET pedidos al controlador, en orden
+    pedidas = []
+    original = main.consultar_controlador
+
+    def registrar(controller_ip, ruta):
+        pedidas.append(ruta)
+        return original(controller_ip, ruta)
+
+    monkeypatch.setattr(main, 'consultar_controlador', registrar)
+    return pedidas
+
+
+def flows_de_prueba(stub, cantidad):
+    return [{'name': f'flow_prueba_{i}', 'switch': stub.dpid(i % 2), 'priority': '100', 'active': 'true',
+             'actions': 'output=1'} for i in range(cantidad)]
+
+
+# Envío concurrente de flows
+
+
+def test_push_flows_envia_en_paralelo_y_conserva_el_orden(lento):
+    flows = flows_de_prueba(lento, 32)
+    inicio = time.perf_counter()
+    reporte = main.push_flows(lento.controller_ip, flows)
+    # En serie serían 3.2 s
+    assert time.perf_counter() - inicio < 1.5
+    assert [r['name'] for r in reporte] == [f['name'] for f in flows]
+    assert [r['switch'] for r in reporte] == [f['switch'] for f in flows]
+    assert all(r['ok'] and r['status'] == 200 for r in reporte)
+    assert lento.total_flows() == 32
+
+
+def test_push_flows_reutiliza_la_sesion_del_controlador(lento):
+    main.push_flows(lento.controller_ip, flows_de_prueba(lento, 4))
+    sesion = main.obtener_sesion(lento.controller_ip)
+    main.push_flows(lento.controller_ip, flows_de_prueba(lento, 4))
+    assert main.obtener_sesion(lento.controller_ip) is sesion
+    assert list(main._sesiones) == [lento.controller_ip]
+
+
+def test_build_route_informa_cada_flow_y_revierte_si_uno_falla(lento):
+    ruta = [(lento.dpid(0), 1), (lento.dpid(0), 2), (lento.dpid(1), 1), (lento.dpid(1), 3)]
+    datos_conexion = {'mac_src': '44:00:00:00:00:01', 'mac_dst': '52:00:00:00:00:01', 'ip_src': '10.0.0.1',
+                      'ip_dst': '10.0.0.2', 'puerto_l4': 22, 'protocolo': 'TCP'}
+    reporte = main.build_route(ruta, datos_conexion, lento.controller_ip)
+    assert all(r['ok'] for r in reporte)
+    assert lento.total_flows() == len(reporte) == len(main.construir_flows(ruta, datos_conexion))
+
+    with lento.lock:
+        lento.flows.clear()
+    lento.rechazar.add(reporte[-1]['name'])
+    reporte = main.build_route(ruta, datos_conexion, lento.controller_ip)
+    assert not reporte[-1]['ok'] and reporte[-1]['status'] == 500
+    assert all(r.get('revertido') for r in reporte[:-1])
+    assert lento.total_flows() == 0
+
+
+# Índice MAC -> punto de conexión
+
+
+def test_busquedas_dentro_del_ttl_usan_una_sola_descarga(red, consultas):
+    for _ in range(50):
+        assert main.get_attachment_point(red.controller_ip, '44:00:00:00:00:01') == (red.dpid(0), 10)
+        assert main.get_attachment_point(red.controller_ip, '52:00:00:00:00:01') == (red.dpid(2), 20)
+    assert main.obtener_cache_dispositivos(red.controller_ip).buscar_ip('52:00:00:00:00:01') == '10.0.0.2'
+    assert consultas == ['/wm/device/']
+
+
+def test_ttl_vencido_vuelve_a_descargar(red, consultas):
+    cache = main.CacheDispositivos(red.controller_ip, ttl=0.2)
+    assert cache.buscar('44:00:00:00:00:01') == (red.dpid(0), 10)
+    # El host se movió de puerto: se ve al vencer el TTL
+    red.dispositivos[0]['attachmentPoint'] = [{'switchDPID': red.dpid(1), 'port': 11}]
+    assert cache.buscar('44:00:00:00:00:01') == (red.dpid(0), 10)
+    time.sleep(0.25)
+    assert cache.buscar('44:00:00:00:00:01') == (red.dpid(1), 11)
+    assert consultas == ['/wm/device/'] * 2
+
+
+def test_mac_desconocida_fuerza_descarga_acotada(red, consultas):
+    cache = main.CacheDispositivos(red.controller_ip, intervalo_minimo=0.2)
+    assert cache.buscar('44:00:00:00:00:01') == (red.dpid(0), 10)
+    red.agregar_host('44:00:00:00:00:02', '10.0.0.3', red.dpid(1), 12)
+    # Dentro del intervalo mínimo una MAC desconocida no repite la descarga
+    assert cache.buscar('44:00:00:00:00:02') == (None, None)
+    assert len(consultas) == 1
+    time.sleep(0.25)
+    assert cache.buscar('44:00:00:00:00:02') == (red.dpid(1), 12)
+    assert len(consultas) == 2
+
+
+# Caché de rutas
+
+
+def test_rutas_repetidas_salen_de_la_cache(red, consultas):
+    cache = main.CacheRutas(red.controller_ip, intervalo_topologia=60)
+    primera = cache.obtener(red.dpid(0), 10, red.dpid(2), 20)
+    assert primera[0] == (red.dpid(0), 10) and primera[-1] == (red.dpid(2), 20)
+    for _ in range(20):
+        assert cache.obtener(red.dpid(0), 10, red.dpid(2), 20) == primera
+    assert (cache.aciertos, cache.fallos) == (20, 1)
+    # La topología se verifica una vez por intervalo, no en cada ruta
+    assert consultas == ['/wm/topology/links/json', '/wm/core/controller/switches/json']
+
+
+def test_cambio_de_topologia_invalida_las_rutas(red):
+    cache = main.CacheRutas(red.controller_ip, intervalo_topologia=0.2)
+    clave = (red.dpid(0), 10, red.dpid(2), 20)
+    anterior = cache.obtener(*clave)
+    # Se cae el enlace s2-s3 y el controlador recalcula la ruta
+    red.enlaces.pop()
+    red.rutas[(red.dpid(0), '10', red.dpid(2), '20')] = [{'switch': red.dpid(0), 'port': 10},
+                                                        {'switch': red.dpid(0), 'port': 3},
+                                                        {'switch': red.dpid(2), 'port': 3},
+                                                        {'switch': red.dpid(2), 'port': 20}]
+    assert cache.obtener(*clave) == anterior
+    time.sleep(0.25)
+    nueva = cache.obtener(*clave)
+    assert nueva != anterior and nueva[1] == (red.dpid(0), 3)
+    assert cache.fallos == 2
+
+    # Sin cambios, pasado el intervalo las rutas se conservan
+    time.sleep(0.25)
+    assert cache.obtener(*clave) == nueva
+    assert cache.fallos == 2
+
+
+def test_cache_de_rutas_descarta_la_menos_usada(red):
+    cache = main.CacheRutas(red.controller_ip, capacidad=2, intervalo_topologia=60)
+    a, b, c = [(red.dpid(0), 10, red.dpid(i), 20 + i) for i in range(3)]
+    cache.obtener(*a)
+    cache.obtener(*b)
+    cache.obtener(*a)
+    cache.obtener(*c)
+    assert list(cache.rutas) == [a, c]
@@ -0,0 +1,146 @@
+import asyncio
+import http.client
+import json
+import os
+import threading
+
+import pytest
+
+import main
+
+TOKEN = 'secreto'
+
+
+@pytest.fixture
+def api(stub, tmp_path):
+    # El daemon corre en su propio bucle, en un hilo aparte
+    bucle = asyncio.new_event_loop()
+    hilo = threading.Thread(target=bucle.run_forever, daemon=True)
+    hilo.start()
+    daemon = main.DaemonPoliticas(stub.controller_ip, '127.0.0.1', 0, token=TOKEN, directorio=str(tmp_path))
+    asyncio.run_coroutine_threadsafe(daemon.iniciar(), bucle).result(5)
+    yield daemon
+    asyncio.run_coroutine_threadsafe(daemon.detener(), bucle).result(5)
+    bucle.call_soon_threadsafe(bucle.stop)
+    hilo.join(5)
+    bucle.close()
+
+
+def pedir(daemon, metodo, ruta, cuerpo=None, token=TOKEN):
+    http_ = http.client.HTTPConnection('127.0.0.1', daemon.puerto, timeout=10)
+    cabeceras = {'Content-Type': 'application/json', 'Connection': 'close'}
+    if token is not None:
+        cabeceras['Authorization'] = f'Bearer {token}'
+    try:
+        http_.request(metodo, ruta, json.dumps(cuerpo) if cuerpo is not None else None, cabeceras)
+        respuesta = http_.getresponse()
+        return respuesta.status, json.loads(respuesta.read())
+    finally:
+        http_.close()
+
+
+def no_autorizada():
+    for alumno in sorted(main.almacen.alumnos_por_codigo):
+        for servidor in main.almacen.servidores_por_nombre.values():
+            for servicio in servidor.servicios:
+                if not main.almacen.esta_autorizado(alumno, servidor.nombre, servicio.nombre):
+                    return alumno, servidor.nombre, servicio.nombre
+
+
+def cuerpo_conexion(clave):
+    return {'alumno': clave[0], 'servidor': clave[1], 'servicio': clave[2]}
+
+
+# Autenticación y confinamiento de rutas
+
+
+@pytest.mark.parametrize('token', [None, 'otro', ''])
+def test_sin_token_valido_responde_401(api, token):
+    status, cuerpo = pedir(api, 'GET', '/salud', token=token)
+    assert status == 401
+    assert 'Token' in cuerpo['error']
+
+
+def test_token_valido_responde(api):
+    status, cuerpo = pedir(api, 'GET', '/salud')
+    assert status == 200
+    assert cuerpo['alumnos'] == 200
+
+
+@pytest.mark.parametrize('archivo', ['../fuera.yaml', '/etc/datos.yaml', 'datos.db', 'sub/../../fuera.yml'])
+def test_exportar_fuera_del_directorio_responde_403(api, tmp_path, archivo):
+    status, _ = pedir(api, 'POST', '/exportar', {'archivo': archivo})
+    assert status == 403
+    assert not os.path.exists(tmp_path.parent / 'fuera.yaml')
+
+
+def test_enlace_simbolico_fuera_del_directorio_responde_403(api, tmp_path):
+    externo = tmp_path.parent / f'{tmp_path.name}_externo'
+    externo.mkdir()
+    os.symlink(externo, tmp_path / 'enlace')
+    status, _ = pedir(api, 'POST', '/exportar', {'archivo': 'enlace/datos.yaml'})
+    assert status == 403
+    assert not os.listdir(externo)
+
+
+def test_exportar_dentro_del_directorio(api, tmp_path):
+    status, cuerpo = pedir(api, 'POST', '/exportar', {'archivo': 'copia.yaml'})
+    assert status == 200
+    assert cuerpo['archivo'] == str(tmp_path / 'copia.yaml')
+    assert os.path.exists(tmp_path / 'copia.yaml')
+
+
+# Validación de parámetros y status de error
+
+
+@pytest.mark.parametrize('consulta', ['pagina=abc', 'pagina=0', 'por_pagina=-1', 'por_pagina=x',
+                                      f'por_pagina={main.MAX_POR_PAGINA_API + 1}'])
+def test_paginacion_invalida_responde_400(api, consulta):
+    status, cuerpo = pedir(api, 'GET', f'/conexiones?{consulta}')
+    assert status == 400
+    assert 'pagina' in cuerpo['error']
+
+
+def test_paginacion(api, autorizadas):
+    for clave in autorizadas[:5]:
+        assert pedir(api, 'POST', '/conexiones', cuerpo_conexion(clave))[0] == 201
+    status, cuerpo = pedir(api, 'GET', '/conexiones?pagina=2&por_pagina=2')
+    assert status == 200
+    assert cuerpo['total'] == 5
+    assert len(cuerpo['conexiones']) == 2
+    assert len(pedir(api, 'GET', '/conexiones?pagina=3&por_pagina=2')[1]['conexiones']) == 1
+
+
+def test_status_de_cada_error(api, autorizadas):
+    clave = autorizadas[0]
+    assert pedir(api, 'POST', '/conexiones', cuerpo_conexion(clave))[0] == 201
+    assert pedir(api, 'POST', '/conexiones', cuerpo_conexion(clave))[0] == 409
+    assert pedir(api, 'POST', '/conexiones', cuerpo_conexion(no_autorizada()))[0] == 403
+    assert pedir(api, 'POST', '/conexiones', cuerpo_conexion(('no-existe',) + clave[1:]))[0] == 404
+    assert pedir(api, 'POST', '/conexiones', {'alumno': clave[0]})[0] == 400
+    assert pedir(api, 'DELETE', '/conexiones/no-existe')[0] == 404
+    assert pedir(api, 'DELETE', '/alumnos/no-existe')[0] == 404
+    assert pedir(api, 'POST', '/cursos/no-existe/alumnos', {'alumno': clave[0]})[0] == 404
+
+
+def test_error_del_controlador_responde_502(api, stub, autorizadas):
+    stub.detener()
+    status, cuerpo = pedir(api, 'POST', '/conexiones', cuerpo_conexion(autorizadas[0]))
+    assert status == 502
+    assert cuerpo['error']
+
+
+def test_peticiones_simultaneas_reciben_su_propio_resultado(api, autorizadas):
+    claves = autorizadas[:6] + [no_autorizada(), ('no-existe',) + autorizadas[0][1:]]
+    resultados = [None] * len(claves)
+
+    def crear(i):
+        resultados[i] = pedir(api, 'POST', '/conexiones', cuerpo_conexion(claves[i]))[0]
+
+    hilos = [threading.Thread(target=crear, args=(i,)) for i in range(len(claves))]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    assert resultados == [201] * 6 + [403, 404]
+    assert len(main.conexiones) == 6
@@ -0,0 +1,79 @@
+import os
+
+import yaml
+
+import main
+
+
+def cargar(archivo):
+    with open(archivo, encoding='utf-8') as f:
+        return yaml.safe_load(f)
+
+
+def test_una_edicion_tras_cargar_serializa_solo_su_seccion(datos):
+    _, archivo = datos
+    assert set(main.almacen.yaml_secciones) == {'alumnos', 'cursos', 'servidores'}
+    main.almacen.agregar_alumno(main.Alumno('Nuevo', 29999999, '44:ff:00:00:00:01'))
+    esperado = main.almacen.a_dict()
+
+    assert main.guardar_almacen(archivo) == {'modo': 'completo', 'secciones_serializadas': 1}
+    assert cargar(archivo) == esperado
+    # El índice apunta al archivo recién escrito
+    assert main.guardar_almacen(archivo)['secciones_serializadas'] == 0
+    assert cargar(archivo) == esperado
+
+
+def test_exportar_a_otro_archivo_copia_las_secciones(datos, tmp_path):
+    data, archivo = datos
+    otro = str(tmp_path / 'copia.yaml')
+    assert main.guardar_almacen(otro)['secciones_serializadas'] == 0
+    assert cargar(otro) == cargar(archivo)
+
+
+def test_el_indice_no_guarda_el_yaml_en_memoria(datos):
+    assert all(isinstance(rango, tuple) and len(rango) == 2 for rango in main.almacen.yaml_secciones.values())
+
+
+def test_origen_modificado_afuera_se_vuelve_a_serializar(datos):
+    _, archivo = datos
+    esperado = main.almacen.a_dict()
+    with open(archivo, 'a', encoding='utf-8') as f:
+        f.write('# editado a mano\n')
+    assert main.guardar_almacen(archivo)['secciones_serializadas'] == 3
+    assert cargar(archivo) == esperado
+
+
+def test_archivos_con_otro_formato_no_se_indexan(tmp_path):
+    archivo = str(tmp_path / 'a_mano.yaml')
+    with open(archivo, 'w', encoding='utf-8') as f:
+        f.write('# comentario\n'
+                'servidores: &srv []\n'
+                'alumnos:\n- {nombre: Ana, codigo: 1, mac: "44:00:00:00:00:01"}\n'
+                'cursos: []\n')
+    main.cargar_almacen_archivo(archivo)
+    assert main.almacen.yaml_secciones == {}
+    assert main.guardar_almacen(archivo)['secciones_serializadas'] == 3
+    assert cargar(archivo)['alumnos'][0]['nombre'] == 'Ana'
+
+
+def test_indice_secciones():
+    contenido = b'alumnos:\n- codigo: 1\n  nombre: A\ncursos: []\nversion: 3\n'
+    cursos, version = contenido.index(b'cursos'), contenido.index(b'version')
+    assert main.indice_secciones(contenido) == {'alumnos': (0, cursos), 'cursos': (cursos, version),
+                                                'version': (version, len(contenido))}
+    for invalido in (b'alumnos: []', b'---\nalumnos: []\n', b'- 1\n', b'alumnos: []\nalumnos: []\n',
+                     b'alumnos: &a []\ncursos: *a\n', b'"alumnos": []\n'):
+        assert main.indice_secciones(invalido) == {}
+
+
+def test_registro_reaplicado_marca_sus_secciones(datos):
+    _, archivo = datos
+    curso = next(iter(main.almacen.cursos_por_codigo))
+    main.almacen.cambiar_estado_curso(curso, 'INACTIVO')
+    main.guardar_almacen(archivo, registro=True)
+    main.cargar_almacen_archivo(archivo)
+    assert set(main.almacen.yaml_secciones) == {'alumnos', 'servidores'}
+    esperado = main.almacen.a_dict()
+    assert main.guardar_almacen(archivo)['secciones_serializadas'] == 1
+    assert cargar(archivo) == esperado
+    assert not os.path.exists(main.ruta_registro(archivo))
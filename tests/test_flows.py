@@ -0,0 +1,96 @@
+import pytest
+
+import main
+
+
+def datos_dns():
+    # Mismo servidor y puerto, distinto protocolo
+    return {
+        'alumnos': [{'nombre': 'Ana', 'codigo': 20100001, 'mac': '44:00:00:00:00:01'}],
+        'servidores': [{'nombre': 'DNS', 'ip': '10.0.0.53', 'mac': '52:00:00:00:00:53',
+                        'servicios': [{'nombre': 'dns-udp', 'protocolo': 'UDP', 'puerto': 53},
+                                      {'nombre': 'dns-tcp', 'protocolo': 'TCP', 'puerto': 53}]}],
+        'cursos': [{'codigo': 'TEL0001', 'estado': 'DICTANDO', 'nombre': 'Redes', 'alumnos': [20100001],
+                    'servidores': [{'nombre': 'DNS', 'servicios_permitidos': ['dns-udp', 'dns-tcp']}]}],
+    }
+
+
+def flows_en_stub(stub):
+    return {nombre: flow for flows in stub.flows.values() for nombre, flow in flows.items()}
+
+
+def test_mismo_puerto_con_distinto_protocolo_no_comparte_flows(entorno):
+    stub = entorno(datos_dns())
+    udp, _ = main.conectar('20100001', 'DNS', 'dns-udp', stub.controller_ip)
+    tcp, _ = main.conectar('20100001', 'DNS', 'dns-tcp', stub.controller_ip)
+    propios_udp = {n for n in udp.flows if n.startswith('flow_')}
+    propios_tcp = {n for n in tcp.flows if n.startswith('flow_')}
+    assert propios_udp and propios_tcp and not propios_udp & propios_tcp
+    # Solo los ARP se comparten
+    assert set(udp.flows) & set(tcp.flows) == {n for n in udp.flows if n.startswith('arp_')}
+
+    main.eliminar_conexiones([tcp.handler])
+    instalados = flows_en_stub(stub)
+    assert set(instalados) == set(udp.flows)
+    assert all(instalados[n]['ip_proto'] == '0x11' for n in propios_udp)
+
+
+def test_adquirir_rechaza_un_nombre_con_otro_contenido():
+    tabla = main.TablaFlows()
+    flow = {'name': 'arp_a_b_0_fwd', 'switch': '00:01', 'in_port': '1', 'actions': 'output=2'}
+    tabla.adquirir('a', [flow])
+    tabla.adquirir('b', [dict(flow)])
+    assert tabla.refs['arp_a_b_0_fwd'] == {'a', 'b'}
+
+    distinto = dict(flow, actions='output=3')
+    assert tabla.conflictos('c', [distinto]) == ['arp_a_b_0_fwd']
+    with pytest.raises(ValueError):
+        tabla.adquirir('c', [distinto])
+    assert tabla.flows['arp_a_b_0_fwd'] == flow
+    assert tabla.refs['arp_a_b_0_fwd'] == {'a', 'b'}
+
+
+def test_la_unica_conexion_puede_reemplazar_sus_flows():
+    tabla = main.TablaFlows()
+    flow = {'name': 'flow_x', 'switch': '00:01', 'actions': 'output=2'}
+    tabla.adquirir('a', [flow])
+    assert not tabla.conflictos('a', [dict(flow, actions='output=3')])
+
+
+def test_conexion_con_flows_en_conflicto_se_rechaza_sin_enviar(entorno):
+    stub = entorno(datos_dns())
+    udp, _ = main.conectar('20100001', 'DNS', 'dns-udp', stub.controller_ip)
+    arp = next(n for n in udp.flows if n.startswith('arp_'))
+    # Otra versión del mismo ARP (p. ej. tras un cambio de ruta)
+    tabla = main.obtener_tabla_flows(stub.controller_ip)
+    tabla.flows[arp] = dict(tabla.flows[arp], actions='output=99')
+    antes = flows_en_stub(stub)
+    with pytest.raises(main.ErrorConexion, match='distinto contenido'):
+        main.conectar('20100001', 'DNS', 'dns-tcp', stub.controller_ip)
+    assert flows_en_stub(stub) == antes
+    assert '20100001-DNS-dns-tcp' not in main.conexiones
+
+
+def test_registros_con_nombres_viejos_se_renombran_al_abrir(tmp_path, entorno):
+    stub = entorno(datos_dns())
+    main.conexiones.abrir(str(tmp_path / 'c.db'))
+    udp, _ = main.conectar('20100001', 'DNS', 'dns-udp', stub.controller_ip)
+    viejos = [n.replace('_udp_', '_') for n in udp.flows]
+    udp.flows = viejos
+    main.conexiones[udp.handler] = udp
+    main.conexiones.cerrar()
+
+    main.tablas_flows.clear()
+    restauradas = main.AlmacenConexiones()
+    restauradas.abrir(str(tmp_path / 'c.db'))
+    nombres = [n.replace('_53_', '_udp_53_') if n.startswith('flow_') else n for n in viejos]
+    assert restauradas[udp.handler].flows == nombres
+    assert set(main.obtener_tabla_flows(stub.controller_ip).refs) == set(nombres)
+    restauradas.cerrar()
+
+    # El nuevo formato quedó guardado
+    main.tablas_flows.clear()
+    reabiertas = main.AlmacenConexiones()
+    reabiertas.abrir(str(tmp_path / 'c.db'))
+    assert reabiertas[udp.handler].flows == nombres
+    reabiertas.cerrar()
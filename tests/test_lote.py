@@ -0,0 +1,90 @@
+import io
+import json
+
+import pytest
+
+import main
+
+
+@pytest.fixture
+def llamadas(monkeypatch):
+    # Argumentos de cada operación agrupada contra el controlador
+    registro = {'provisionar': [], 'eliminar': []}
+    provisionar, eliminar = main.provisionar_masivo, main.eliminar_conexiones
+
+    def provisionar_registrado(planes, *args, **kwargs):
+        registro['provisionar'].append(list(planes))
+        return provisionar(planes, *args, **kwargs)
+
+    def eliminar_registrado(handlers, *args, **kwargs):
+        registro['eliminar'].append(list(handlers))
+        return eliminar(handlers, *args, **kwargs)
+
+    monkeypatch.setattr(main, 'provisionar_masivo', provisionar_registrado)
+    monkeypatch.setattr(main, 'eliminar_conexiones', eliminar_registrado)
+    return registro
+
+
+def texto(clave):
+    return f'crear_conexion {clave[0]} "{clave[1]}" {clave[2]}'
+
+
+# Lectura de comandos
+
+
+def test_parsear_comando_en_texto_y_json():
+    assert main.parsear_comando('crear_conexion 20000001 "Servidor 1" ssh\n') == \
+        {'op': 'crear_conexion', 'alumno': '20000001', 'servidor': 'Servidor 1', 'servicio': 'ssh'}
+    assert main.parsear_comando('{"op": "exportar", "archivo": "a.yaml", "registro": true, "otro": 1}') == \
+        {'op': 'exportar', 'archivo': 'a.yaml', 'registro': 'true'}
+    assert main.parsear_comando('{"op": "borrar_alumno", "codigo": 20000001}') == \
+        {'op': 'borrar_alumno', 'codigo': '20000001'}
+
+
+@pytest.mark.parametrize('linea, mensaje', [
+    ('no_existe 1', 'Comando desconocido'),
+    ('borrar_conexion a b', 'Demasiados argumentos'),
+    ('{"op": "borrar_alumno", "codigo": [1]}', "Valor inválido para 'codigo'"),
+    ('{"codigo": 1}', "Falta el campo 'op'"),
+    ('{"op": "importar"', 'Expecting'),
+])
+def test_parsear_comando_invalido(linea, mensaje):
+    with pytest.raises(ValueError, match=mensaje):
+        main.parsear_comando(linea)
+
+
+# Ejecución y agrupación
+
+
+def test_altas_y_bajas_consecutivas_se_agrupan(stub, autorizadas, llamadas):
+    claves = autorizadas[:3]
+    handlers = [f"{a}-{s}-{v}" for a, s, v in claves]
+    lineas = [texto(c) for c in claves] + [
+        '# comentario', '', texto(claves[0]), 'listar_conexiones',
+        f'borrar_conexion "{handlers[0]}"', f'{{"op": "borrar_conexion", "handler": "{handlers[1]}"}}',
+        'borrar_conexion no-existe']
+    salida = io.StringIO()
+    resultados = main.EjecutorLote(stub.controller_ip, salida).ejecutar(lineas)
+
+    # Comentarios y líneas vacías no cortan el grupo; la alta repetida se rechaza
+    assert [len(planes) for planes in llamadas['provisionar']] == [4]
+    assert llamadas['eliminar'] == [[handlers[0], handlers[1], 'no-existe']]
+    assert [r['linea'] for r in resultados] == [1, 2, 3, 6, 7, 8, 9, 10]
+    assert [r['ok'] for r in resultados] == [True, True, True, False, True, True, True, False]
+    assert resultados[3]['codigo'] == 'existe'
+    assert resultados[4]['resultado']['total'] == 3
+    assert resultados[7]['codigo'] == 'no_encontrado'
+    assert [json.loads(l) for l in salida.getvalue().splitlines()] == resultados
+    assert list(main.conexiones) == [handlers[2]]
+
+
+def test_comando_fallido_no_detiene_el_lote(stub, autorizadas, llamadas):
+    clave = autorizadas[0]
+    lineas = ['crear_conexion', f'crear_conexion no-existe "{clave[1]}" {clave[2]}', texto(clave), texto(clave),
+              'curso_estado no-existe INACTIVO', 'ocupacion']
+    resultados = main.EjecutorLote(stub.controller_ip, io.StringIO()).ejecutar(lineas)
+    assert [(r['ok'], r.get('codigo')) for r in resultados] == [
+        (False, 'invalido'), (False, 'no_encontrado'), (True, None), (False, 'existe'),
+        (False, 'no_encontrado'), (True, None)]
+    # Los comandos inválidos no llegan al controlador
+    assert [set(planes) for planes in llamadas['provisionar']] == [{(str(clave[0]), clave[1], clave[2], None)}]
@@ -0,0 +1,224 @@
+import json
+import os
+import threading
+import time
+
+import pytest
+
+import main
+
+
+def conectar(stub, clave):
+    conexion, _ = main.conectar(*clave, stub.controller_ip)
+    return conexion
+
+
+def flows_en_stub(stub):
+    return {nombre for flows in stub.flows.values() for nombre in flows}
+
+
+# Instalación atómica de rutas
+
+
+def test_ruta_fallida_revierte_los_flows_enviados(stub, autorizadas):
+    conexion = conectar(stub, autorizadas[0])
+    nombres = list(conexion.flows)
+    main.eliminar_conexiones([conexion.handler])
+    assert stub.total_flows() == 0
+
+    # El último flow de la ruta falla: los ya enviados se revierten
+    stub.rechazar.add(nombres[-1])
+    with pytest.raises(main.ErrorConexion, match='Se revirtieron'):
+        conectar(stub, autorizadas[0])
+    assert stub.total_flows() == 0
+    assert conexion.handler not in main.conexiones
+    assert not main.obtener_tabla_flows(stub.controller_ip).flows
+
+
+def test_ruta_fallida_conserva_los_flows_compartidos(stub, autorizadas):
+    # Mismo alumno y servidor, otro servicio: comparten los flows ARP
+    clave, otra = next((a, b) for a, b in zip(autorizadas, autorizadas[1:]) if a[:2] == b[:2])
+    primera = conectar(stub, clave)
+    segunda = conectar(stub, otra)
+    propios = [n for n in segunda.flows if n not in primera.flows]
+    assert propios and len(propios) < len(segunda.flows)
+    main.eliminar_conexiones([segunda.handler])
+    antes = flows_en_stub(stub)
+
+    stub.rechazar.add(propios[-1])
+    with pytest.raises(main.ErrorConexion):
+        conectar(stub, otra)
+    assert flows_en_stub(stub) == antes == set(primera.flows)
+    assert set(main.obtener_tabla_flows(stub.controller_ip).flows) == set(primera.flows)
+
+
+# Reconciliación
+
+
+def test_reconciliar_reinstala_faltantes_y_borra_sobrantes(stub, autorizadas):
+    for clave in autorizadas[:3]:
+        conectar(stub, clave)
+    borrado = next(n for n in sorted(flows_en_stub(stub)) if n.startswith('flow_'))
+    with stub.lock:
+        for flows in stub.flows.values():
+            flows.pop(borrado, None)
+    dpid = stub.dpid(0)
+    assert main.push_flow_to_floodlight(stub.controller_ip, {'name': 'flow_huerfano', 'switch': dpid,
+                                                             'priority': '100', 'active': 'true'})['ok']
+
+    resultado = main.reconciliar_flows(stub.controller_ip, main.conexiones.values())
+    assert resultado['a_instalar'] == [borrado]
+    assert resultado['a_borrar'] == ['flow_huerfano']
+    assert not resultado['errores']
+    assert borrado in flows_en_stub(stub)
+    assert 'flow_huerfano' not in flows_en_stub(stub)
+
+    # Sin diferencias, una segunda pasada no cambia nada
+    resultado = main.reconciliar_flows(stub.controller_ip, main.conexiones.values())
+    assert resultado['a_instalar'] == [] and resultado['a_borrar'] == []
+
+
+def test_reconciliar_sin_aplicar_solo_informa(stub, autorizadas):
+    conexion = conectar(stub, autorizadas[0])
+    with stub.lock:
+        stub.flows.clear()
+    resultado = main.reconciliar_flows(stub.controller_ip, main.conexiones.values(), aplicar=False)
+    assert sorted(resultado['a_instalar']) == sorted(set(conexion.flows))
+    assert stub.total_flows() == 0
+
+
+# Registro de cambios
+
+
+def curso_con_alumno():
+    codigo = next(c for c, alumnos in main.almacen.alumnos_curso.items()
+                  if alumnos and main.almacen.buscar_curso(c).estado == 'DICTANDO')
+    return codigo, sorted(main.almacen.alumnos_curso[codigo])[0]
+
+
+def test_registro_de_cambios_se_reaplica_al_cargar(datos):
+    _, archivo = datos
+    curso, alumno = curso_con_alumno()
+    main.almacen.eliminar_alumno_curso(curso, alumno)
+    main.almacen.cambiar_estado_curso(curso, 'INACTIVO')
+    assert main.guardar_almacen(archivo, registro=True) == {'modo': 'registro', 'cambios': 2}
+
+    main.cargar_almacen_archivo(archivo)
+    assert not main.almacen.alumno_en_curso(curso, alumno)
+    assert main.almacen.buscar_curso(curso).estado == 'INACTIVO'
+    assert main.almacen.registrados == 2
+
+
+def test_registro_truncado_descarta_la_linea_incompleta(datos):
+    _, archivo = datos
+    curso, alumno = curso_con_alumno()
+    main.almacen.eliminar_alumno_curso(curso, alumno)
+    main.guardar_almacen(archivo, registro=True)
+    registro = main.ruta_registro(archivo)
+    validos = os.path.getsize(registro)
+    # Corte a mitad de escritura del siguiente cambio
+    with open(registro, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(['cambiar_estado_curso', curso, 'INACTIVO'])[:-5])
+
+    main.cargar_almacen_archivo(archivo)
+    assert not main.almacen.alumno_en_curso(curso, alumno)
+    assert main.almacen.buscar_curso(curso).estado == 'DICTANDO'
+    assert os.path.getsize(registro) == validos
+
+
+def test_exportacion_completa_descarta_el_registro(datos):
+    _, archivo = datos
+    curso, alumno = curso_con_alumno()
+    main.almacen.eliminar_alumno_curso(curso, alumno)
+    main.guardar_almacen(archivo, registro=True)
+    assert main.guardar_almacen(archivo)['modo'] == 'completo'
+    assert not os.path.exists(main.ruta_registro(archivo))
+
+    main.cargar_almacen_archivo(archivo)
+    assert not main.almacen.alumno_en_curso(curso, alumno)
+
+
+# Revocación tras un cambio de políticas
+
+
+def quitar_autorizacion(alumno, servidor, servicio):
+    for curso in sorted(main.almacen.cursos_autorizantes(alumno, servidor, servicio)):
+        main.almacen.eliminar_alumno_curso(curso, alumno)
+
+
+def test_revocacion_borra_las_conexiones_no_autorizadas(stub, autorizadas):
+    conexion = conectar(stub, autorizadas[0])
+    otra = conectar(stub, next(c for c in autorizadas if c[0] != autorizadas[0][0]))
+    quitar_autorizacion(*autorizadas[0])
+
+    resultado = main.revocar_no_autorizadas()
+    assert resultado[conexion.handler]['ok']
+    assert otra.handler not in resultado
+    assert conexion.handler not in main.conexiones
+    assert otra.handler in main.conexiones
+    assert flows_en_stub(stub) == set(otra.flows)
+    assert not main.almacen.revocados
+
+
+def test_revocacion_fallida_queda_pendiente(stub, autorizadas):
+    conexion = conectar(stub, autorizadas[0])
+    quitar_autorizacion(*autorizadas[0])
+    stub.detener()
+
+    resultado = main.revocar_no_autorizadas()
+    assert not resultado[conexion.handler]['ok']
+    assert conexion.handler in main.conexiones
+    assert str(conexion.alumno) in main.almacen.revocados
+    # La reconciliación tampoco la vuelve a instalar
+    assert not main.flows_deseados([conexion])
+
+
+# Capacidad de las tablas de flows
+
+
+def test_desalojo_de_la_conexion_menos_usada(stub, autorizadas):
+    main.configurar_capacidades(['30'])
+    handlers = []
+    desalojadas = []
+    for clave in autorizadas[:15]:
+        handlers.append(conectar(stub, clave).handler)
+        if len(handlers) == 2:
+            # La primera pasa a ser la más usada
+            main.conexiones.tocar([handlers[0]])
+        desalojadas = [h for h in handlers if h not in main.conexiones]
+        if desalojadas:
+            break
+
+    assert desalojadas[0] == handlers[1]
+    assert handlers[0] in main.conexiones
+    assert handlers[-1] in main.conexiones
+    assert max(s['flows'] for s in main.reporte_ocupacion()) <= 30
+    tabla = main.obtener_tabla_flows(stub.controller_ip)
+    assert stub.total_flows() == len(tabla.flows) == sum(tabla.por_switch.values())
+
+
+
+# Expiración concurrente (recolector y menú a la vez)
+
+
+def test_expiracion_concurrente_no_falla(stub, autorizadas, monkeypatch):
+    monkeypatch.setattr(main, 'HARD_TIMEOUT', 1)
+    for clave in autorizadas[:10]:
+        conectar(stub, clave)
+    time.sleep(1.2)
+    errores = []
+
+    def expirar():
+        try:
+            main.expirar_conexiones(stub.controller_ip)
+        except Exception as e:
+            errores.append(e)
+
+    hilos = [threading.Thread(target=expirar) for _ in range(4)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    assert not errores
+    assert not len(main.conexiones)
+    assert not main.obtener_tabla_flows(stub.controller_ip).refs
@@ -0,0 +1,106 @@
+import pytest
+
+import main
+from floodlight_stub import FloodlightStub
+
+
+@pytest.fixture
+def controladores(monkeypatch):
+    # Dos fragmentos (s1-s2 y s3-s4) y una réplica que ve toda la red
+    monkeypatch.setattr(main, 'pools', {})
+    stubs = [FloodlightStub().iniciar() for _ in range(3)]
+    primero, segundo, replica = stubs
+    dpid = primero.dpid
+    primero.agregar_host('44:00:00:00:00:01', '10.0.0.1', dpid(0), 10)
+    segundo.agregar_host('52:00:00:00:00:01', '10.0.0.2', dpid(3), 20)
+    main.configurar_pool('pool', [(primero.controller_ip, [dpid(0), dpid(1).upper()]),
+                                  (segundo.controller_ip, [dpid(2), dpid(3)]),
+                                  (replica.controller_ip, [])])
+    yield stubs
+    for stub in stubs:
+        stub.detener()
+
+
+def flows_por_switch(stub, switches):
+    return [{'name': f'flow_pool_{i}', 'switch': stub.dpid(i), 'priority': '100', 'active': 'true',
+             'actions': 'output=1'} for i in switches]
+
+
+def abrir_circuito(ip):
+    circuito = main.obtener_circuito(ip)
+    for _ in range(circuito.umbral):
+        circuito.fallo()
+
+
+def nombres(stub):
+    return {nombre for flows in stub.flows.values() for nombre in flows}
+
+
+# Pools de controladores
+
+
+def test_orden_de_candidatos(controladores):
+    primero, segundo, replica = (s.controller_ip for s in controladores)
+    pool = main.pools['pool']
+    dpid = controladores[0].dpid
+    assert pool.candidatos(dpid(1)) == [primero, replica, segundo]
+    assert pool.candidatos(dpid(2).upper()) == [segundo, replica, primero]
+    assert pool.destino(dpid(2)) == segundo
+    abrir_circuito(segundo)
+    assert pool.destino(dpid(2)) == replica
+    assert pool.sanos() == [primero, replica]
+    abrir_circuito(replica)
+    abrir_circuito(primero)
+    # Ninguno sano: se usa el dueño y el error lo da su circuito
+    assert pool.destino(dpid(2)) == segundo
+    assert pool.sanos() == [primero, segundo, replica]
+
+
+def test_cada_flow_va_al_duenio_de_su_switch(controladores):
+    primero, segundo, replica = controladores
+    reporte = main.push_flows('pool', flows_por_switch(primero, range(4)))
+    assert all(r['ok'] for r in reporte)
+    assert nombres(primero) == {'flow_pool_0', 'flow_pool_1'}
+    assert nombres(segundo) == {'flow_pool_2', 'flow_pool_3'}
+    assert not nombres(replica)
+
+    # El borrado sin switch se resuelve con la tabla de flows o se pide a todos
+    assert main.borrar_flow_de_floodlight('pool', 'flow_pool_2')['ok']
+    assert nombres(segundo) == {'flow_pool_3'}
+
+
+def test_fragmento_caido_pasa_a_la_replica(controladores):
+    primero, segundo, replica = controladores
+    primero.detener()
+    abrir_circuito(primero.controller_ip)
+    antes = main.metricas.contadores.get(('pool_failover_total', (('pool', 'pool'),)), 0)
+    reporte = main.push_flows('pool', flows_por_switch(primero, range(4)))
+    assert all(r['ok'] for r in reporte)
+    assert nombres(replica) == {'flow_pool_0', 'flow_pool_1'}
+    assert nombres(segundo) == {'flow_pool_2', 'flow_pool_3'}
+    assert main.metricas.contadores[('pool_failover_total', (('pool', 'pool'),))] > antes
+
+
+def test_miembro_que_cae_durante_el_envio_se_reintenta_en_otro(controladores):
+    primero, _, replica = controladores
+    primero.detener()
+    # El próximo fallo abre su circuito
+    circuito = main.obtener_circuito(primero.controller_ip)
+    for _ in range(circuito.umbral - 1):
+        circuito.fallo()
+    resultado = main.push_flow_to_floodlight('pool', flows_por_switch(primero, [0])[0])
+    assert resultado['ok']
+    assert circuito.estado() == 'abierto'
+    assert nombres(replica) == {'flow_pool_0'}
+
+
+def test_consultas_unen_los_fragmentos(controladores):
+    primero, segundo, _ = controladores
+    dispositivos = main.obtener_cache_dispositivos('pool')
+    assert dispositivos.buscar('44:00:00:00:00:01') == (primero.dpid(0), 10)
+    assert dispositivos.buscar('52:00:00:00:00:01') == (segundo.dpid(3), 20)
+    segundo.detener()
+    abrir_circuito(segundo.controller_ip)
+    # Sin el segundo fragmento se sigue respondiendo con lo que ven los demás
+    assert dispositivos.refrescar()
+    assert dispositivos.buscar('44:00:00:00:00:01') == (primero.dpid(0), 10)
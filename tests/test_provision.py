@@ -0,0 +1,67 @@
+import pytest
+
+import main
+
+
+def flows_en_stub(stub):
+    return {nombre for flows in stub.flows.values() for nombre in flows}
+
+
+def curso_dictando():
+    return next(c for c, curso in sorted(main.almacen.cursos_por_codigo.items())
+                if curso.estado == 'DICTANDO' and main.almacen.alumnos_curso[c])
+
+
+# Provisión masiva por curso
+
+
+def test_plan_del_curso_cubre_sus_alumnos_y_servicios(datos):
+    curso = curso_dictando()
+    plan = main.planificar_conexiones(curso)
+    assert len(plan) == len(set(plan))
+    assert set(plan) == {clave for clave, cursos in main.almacen.autorizaciones.items() if curso in cursos}
+    main.almacen.cambiar_estado_curso(curso, 'INACTIVO')
+    assert main.planificar_conexiones(curso) == []
+    assert main.planificar_conexiones('no-existe') == []
+
+
+@pytest.mark.parametrize('asincrono', [False, True])
+def test_provisionar_curso_crea_todas_las_conexiones(stub, asincrono):
+    plan = main.planificar_conexiones(curso_dictando())
+    resultado = main.provisionar_masivo(plan, stub.controller_ip, tam_lote=7, asincrono=asincrono)
+    assert resultado['creadas'] == len(plan)
+    assert not resultado['fallidas'] and not resultado['omitidas']
+    instalados = {nombre for c in main.conexiones.values() for nombre in c.flows}
+    # Los flows compartidos entre conexiones se envían una sola vez
+    assert resultado['flows'] == len(instalados) == stub.total_flows()
+    assert flows_en_stub(stub) == instalados
+
+    # Repetir la provisión no duplica nada
+    resultado = main.provisionar_masivo(plan + plan[:1], stub.controller_ip)
+    assert resultado['creadas'] == 0
+    assert sorted(resultado['omitidas']) == sorted(f"{a}-{s}-{v}" for a, s, v in plan + plan[:1])
+    assert stub.total_flows() == len(instalados)
+
+
+def test_flow_rechazado_solo_falla_sus_conexiones(stub):
+    plan = main.planificar_conexiones(curso_dictando())
+    # Se rechaza el primer flow IP de la primera conexión, sea cual sea su ruta
+    main.provisionar_masivo(plan[:1], stub.controller_ip)
+    rechazado = main.conexiones[f"{plan[0][0]}-{plan[0][1]}-{plan[0][2]}"].flows[0]
+    main.eliminar_conexiones(list(main.conexiones))
+    assert stub.total_flows() == 0
+    stub.rechazar.add(rechazado)
+
+    resultado = main.provisionar_masivo(plan, stub.controller_ip)
+    fallidas = {h: codigo for h, _, codigo in resultado['fallidas']}
+    assert fallidas == {f"{plan[0][0]}-{plan[0][1]}-{plan[0][2]}": 'controlador'}
+    assert resultado['creadas'] == len(plan) - 1
+    assert flows_en_stub(stub) == {nombre for c in main.conexiones.values() for nombre in c.flows}
+
+
+def test_plan_con_datos_inexistentes_se_informa(stub, autorizadas):
+    plan = [autorizadas[0], ('no-existe',) + autorizadas[0][1:]]
+    resultado = main.provisionar_masivo(plan, stub.controller_ip)
+    assert resultado['creadas'] == 1
+    assert resultado['fallidas'] == [(f"no-existe-{plan[0][1]}-{plan[0][2]}",
+                                      "Alumno, servidor o servicio no encontrado", 'no_encontrado')]
@@ -0,0 +1,65 @@
+import main
+
+
+def datos_conexion(**extra):
+    return dict({'mac_src': '44:00:00:00:00:01', 'mac_dst': '52:00:00:00:00:01', 'ip_src': '10.128.0.1',
+                 'ip_dst': '10.0.0.3', 'puerto_l4': 22, 'protocolo': 'TCP'}, **extra)
+
+
+RUTA = [['00:00:00:00:00:00:00:01', 10], ['00:00:00:00:00:00:00:01', 2],
+        ['00:00:00:00:00:00:00:02', 1], ['00:00:00:00:00:00:00:02', 60]]
+
+
+def listado_floodlight(flows):
+    # Formato de /wm/staticentrypusher/list/all/json de Floodlight 1.x
+    listado = {}
+    for flow in flows:
+        match = {campo: flow[campo] for campo in ('in_port', 'eth_type', 'ip_proto', 'ipv4_src', 'ipv4_dst',
+                                                  'tcp_src', 'tcp_dst', 'udp_src', 'udp_dst') if campo in flow}
+        if 'eth_type' in match:
+            match['eth_type'] = hex(int(match['eth_type'], 16))
+        if 'ip_proto' in match:
+            match['ip_proto'] = str(int(match['ip_proto'], 16))
+        entrada = {'version': 'OF_13', 'command': 'ADD', 'cookie': '45035996273704960', 'priority': flow['priority'],
+                   'idleTimeoutSec': flow.get('idle_timeout', '0'), 'hardTimeoutSec': flow.get('hard_timeout', '0'),
+                   'outGroup': 'any', 'outPort': 'any', 'flags': '0', 'match': match,
+                   'instructions': {'instruction_apply_actions': {'actions': flow['actions']}}}
+        listado.setdefault(flow['switch'], []).append({flow['name']: entrada})
+    return listado
+
+
+def test_flows_identicos_en_formato_floodlight_no_se_reinstalan():
+    deseados = {f['name']: f for f in main.construir_flows(RUTA, datos_conexion(idle_timeout=30))}
+    listado = listado_floodlight(deseados.values())
+    instalado = next(iter(listado['00:00:00:00:00:00:00:01'][0].values()))
+    assert instalado['match']['eth_type'] == '0x800'
+
+    a_instalar, a_borrar = main.diferencia_flows(deseados, main.flows_instalados(listado))
+    assert a_instalar == []
+    assert a_borrar == []
+
+
+def test_flows_distintos_en_formato_floodlight_se_reinstalan():
+    deseados = {f['name']: f for f in main.construir_flows(RUTA, datos_conexion())}
+    instalados = list(deseados.values())
+    ip = next(f for f in instalados if f['name'].startswith('flow_'))
+    arp = next(f for f in instalados if f['name'].startswith('arp_'))
+    instalados = [dict(f, ip_proto='0x11') if f is ip else dict(f, actions='output=9') if f is arp else f
+                  for f in instalados]
+
+    a_instalar, _ = main.diferencia_flows(deseados, main.flows_instalados(listado_floodlight(instalados)))
+    assert sorted(f['name'] for f in a_instalar) == sorted([ip['name'], arp['name']])
+
+
+def test_timeout_distinto_se_reinstala():
+    deseados = {f['name']: f for f in main.construir_flows(RUTA, datos_conexion(idle_timeout=30))}
+    instalados = [dict(f, idle_timeout='60') if 'idle_timeout' in f else f for f in deseados.values()]
+    a_instalar, _ = main.diferencia_flows(deseados, main.flows_instalados(listado_floodlight(instalados)))
+    assert {f['name'] for f in a_instalar} == {n for n, f in deseados.items() if 'idle_timeout' in f}
+
+
+def test_valor_normalizado():
+    assert main.valor_normalizado('0x800') == main.valor_normalizado('0x0800') == '2048'
+    assert main.valor_normalizado('6') == main.valor_normalizado('0x06')
+    assert main.valor_normalizado('output=2') == 'output=2'
+    assert main.valor_normalizado('10.0.0.3') == '10.0.0.3'
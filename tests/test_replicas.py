@@ -0,0 +1,71 @@
+import io
+import time
+
+import main
+
+ALUMNOS = [20200000 + i for i in range(7)]
+
+
+def datos_replicas():
+    # Tres réplicas del servicio web; el último alumno solo puede usar la primera
+    return {
+        'alumnos': [{'nombre': f'Alumno {i}', 'codigo': codigo, 'mac': f'44:00:00:00:01:{i:02x}'}
+                    for i, codigo in enumerate(ALUMNOS)],
+        'servidores': [{'nombre': f'Web {i}', 'ip': f'10.0.1.{i}', 'mac': f'52:00:00:00:01:{i:02x}',
+                        'servicios': [{'nombre': 'http', 'protocolo': 'TCP', 'puerto': 80}]} for i in (1, 2, 3)],
+        'cursos': [{'codigo': 'TEL0100', 'estado': 'DICTANDO', 'nombre': 'Web', 'alumnos': ALUMNOS[:-1],
+                    'servidores': [{'nombre': f'Web {i}', 'servicios_permitidos': ['http']} for i in (1, 2, 3)]},
+                   {'codigo': 'TEL0101', 'estado': 'DICTANDO', 'nombre': 'Web básico', 'alumnos': ALUMNOS[-1:],
+                    'servidores': [{'nombre': 'Web 1', 'servicios_permitidos': ['http']}]}],
+    }
+
+
+def punto_servidor(stub, nombre):
+    servidor = main.almacen.buscar_servidor(nombre)
+    return main.get_attachment_point(stub.controller_ip, servidor.mac)
+
+
+# Elección de réplica
+
+
+def test_solo_se_eligen_replicas_autorizadas(entorno):
+    stub = entorno(datos_replicas())
+    assert main.replicas_servicio(str(ALUMNOS[0]), 'http') == ['Web 1', 'Web 2', 'Web 3']
+    assert main.elegir_replica(str(ALUMNOS[-1]), 'http', stub.controller_ip) == 'Web 1'
+    conexion, _ = main.conectar(str(ALUMNOS[-1]), main.SERVIDOR_AUTOMATICO, 'http', stub.controller_ip)
+    assert conexion.servidor == 'Web 1'
+
+
+def test_conexiones_se_reparten_entre_replicas(entorno):
+    stub = entorno(datos_replicas())
+    elegidos = [main.conectar(str(a), main.SERVIDOR_AUTOMATICO, 'http', stub.controller_ip)[0].servidor
+                for a in ALUMNOS[:6]]
+    assert sorted(elegidos) == ['Web 1', 'Web 1', 'Web 2', 'Web 2', 'Web 3', 'Web 3']
+
+
+def test_replica_con_mas_trafico_se_evita(entorno):
+    stub = entorno(datos_replicas())
+    monitor = main.obtener_monitor_puertos(stub.controller_ip)
+    monitor.refrescar()
+    stub.sumar_trafico(*punto_servidor(stub, 'Web 1'), rx=10_000_000)
+    stub.sumar_trafico(*punto_servidor(stub, 'Web 2'), rx=1_000)
+    time.sleep(0.05)
+    monitor.refrescar()
+    assert main.elegir_replica(str(ALUMNOS[0]), 'http', stub.controller_ip) == 'Web 3'
+
+
+def test_alumno_conserva_su_replica(entorno):
+    stub = entorno(datos_replicas())
+    main.conectar(str(ALUMNOS[0]), 'Web 2', 'http', stub.controller_ip)
+    main.conectar(str(ALUMNOS[1]), 'Web 2', 'http', stub.controller_ip)
+    assert main.elegir_replica(str(ALUMNOS[0]), 'http', stub.controller_ip) == 'Web 2'
+    assert main.elegir_replica(str(ALUMNOS[2]), 'http', stub.controller_ip) != 'Web 2'
+
+
+def test_lote_reparte_las_altas_aun_no_registradas(entorno):
+    stub = entorno(datos_replicas())
+    lineas = [f'crear_conexion {a} {main.SERVIDOR_AUTOMATICO} http' for a in ALUMNOS[:6]]
+    resultados = main.EjecutorLote(stub.controller_ip, io.StringIO()).ejecutar(lineas)
+    assert all(r['ok'] for r in resultados)
+    assert sorted(c.servidor for c in main.conexiones.values()) == ['Web 1', 'Web 1', 'Web 2', 'Web 2',
+                                                                   'Web 3', 'Web 3']
@@ -0,0 +1,74 @@
+import time
+
+import main
+
+
+def conectar(stub, clave):
+    conexion, _ = main.conectar(*clave, stub.controller_ip)
+    return conexion
+
+
+def primer_salto(nombre):
+    return nombre.startswith('flow_') and nombre.endswith(('_0_fwd', '_0_rev'))
+
+
+# Estadísticas de tráfico por conexión
+
+
+def test_muestras_suman_solo_el_primer_salto_de_cada_sentido(stub, autorizadas, monkeypatch):
+    activa, quieta = conectar(stub, autorizadas[0]), conectar(stub, autorizadas[-1])
+    consultas = []
+    original = main.consultar_controlador
+
+    def registrar(controller_ip, ruta):
+        consultas.append(ruta)
+        return original(controller_ip, ruta)
+
+    monkeypatch.setattr(main, 'consultar_controlador', registrar)
+    recolector = main.RecolectorTrafico(stub.controller_ip)
+    assert recolector.muestrear()
+    assert recolector.estadisticas(activa.handler)['bytes'] == 0
+
+    propios = [n for n in activa.flows if n.startswith('flow_')]
+    assert any(not primer_salto(n) for n in propios)
+    esperado = 0
+    for i, nombre in enumerate(propios):
+        stub.sumar_trafico_flow(nombre, 1000 * (i + 1), paquetes=i + 1)
+        esperado += 1000 * (i + 1) if primer_salto(nombre) else 0
+    time.sleep(0.05)
+    assert recolector.muestrear()
+
+    e = recolector.estadisticas(activa.handler)
+    assert e['bytes'] == esperado > 0
+    assert e['bytes_por_s'] > 0 and e['paquetes_por_s'] > 0
+    assert recolector.estadisticas(quieta.handler)['bytes'] == 0
+    assert [h for h, _ in recolector.top(1)] == [activa.handler]
+    # Una sola consulta de estadísticas por muestra, sin importar cuántas conexiones haya
+    assert consultas == ['/wm/core/switch/all/flow/json'] * 2
+
+
+def test_inactividad_y_conexiones_borradas(stub, autorizadas):
+    activa, quieta = conectar(stub, autorizadas[0]), conectar(stub, autorizadas[-1])
+    recolector = main.RecolectorTrafico(stub.controller_ip)
+    recolector.muestrear()
+    time.sleep(0.1)
+    stub.sumar_trafico_flow(next(n for n in activa.flows if primer_salto(n)), 500)
+    recolector.muestrear()
+    assert [h for h, _ in recolector.inactivas(0.1)] == [quieta.handler]
+
+    main.eliminar_conexiones([quieta.handler])
+    recolector.muestrear()
+    assert recolector.estadisticas(quieta.handler) is None
+    assert list(recolector.muestras) == [activa.handler]
+
+
+def test_recolector_en_segundo_plano(stub, autorizadas):
+    conexion = conectar(stub, autorizadas[0])
+    recolector = main.obtener_recolector(stub.controller_ip)
+    recolector.intervalo = 0.05
+    assert main.obtener_recolector(stub.controller_ip, iniciar=True) is recolector
+    time.sleep(0.3)
+    assert len(recolector.muestras[conexion.handler]) >= 3
+    assert main.estadisticas_conexion(conexion)['bytes'] == 0
+    recolector.detener()
+    assert not recolector.hilo.is_alive()